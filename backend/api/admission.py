@@ -0,0 +1,109 @@
+import re
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_CLASS = 'interactive'
+
+
+class RequestClass:
+    """
+    Concurrency budget for one class of requests.
+
+    Up to `max_concurrent` requests run at once (None for no limit). Further
+    requests wait in a queue of at most `max_queue` entries for up to
+    `queue_timeout` seconds; anything beyond that is shed.
+    """
+
+    def __init__(self, name, max_concurrent=None, max_queue=0, queue_timeout=0, retry_after=5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+
+    def _has_room(self):
+        return self.max_concurrent is None or self.in_flight < self.max_concurrent
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if allowed; False if shed"""
+        with self._condition:
+            if self._has_room():
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.max_queue or self.queue_timeout <= 0:
+                self.shed += 1
+                return False
+
+            self.waiting += 1
+            self.queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while not self._has_room():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._condition.wait(remaining)
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': self.shed,
+            }
+
+
+class AdmissionController:
+    """Classifies requests by path and holds the budget of each class"""
+
+    def __init__(self, classes, routes):
+        self.classes = {name: RequestClass(name, **options) for name, options in classes.items()}
+        self.classes.setdefault(DEFAULT_CLASS, RequestClass(DEFAULT_CLASS))
+        self.routes = [(re.compile(pattern), name) for pattern, name in routes]
+
+    def classify(self, path):
+        for pattern, name in self.routes:
+            if pattern.search(path):
+                return self.classes[name]
+        return self.classes[DEFAULT_CLASS]
+
+    def stats(self):
+        return {name: request_class.stats() for name, request_class in self.classes.items()}
+
+
+_controller = None
+_controller_config = None
+
+
+def get_controller():
+    """The process-wide controller, rebuilt if the settings change"""
+    global _controller, _controller_config
+    config = (getattr(settings, 'ADMISSION_CLASSES', {}), getattr(settings, 'ADMISSION_ROUTES', []))
+    if _controller is None or _controller_config is None or any(a is not b for a, b in zip(config, _controller_config)):
+        _controller = AdmissionController(*config)
+        _controller_config = config
+    return _controller
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'api'
+    verbose_name = 'API'
+
+    def ready(self):
+        from .signals import connect_change_tracking, connect_session_user_invalidation, connect_token_invalidation
+        connect_change_tracking()
+        connect_token_invalidation()
+        connect_session_user_invalidation()
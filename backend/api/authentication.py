@@ -0,0 +1,211 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .lru import TTLCache
+from .models import CacheGeneration
+
+SHARED_KEY_PREFIX = 'auth-token:'
+GENERATION_KEY = 'auth-token-generation'
+# Never copied into the shared cache; loaded from the database if needed
+UNCACHED_USER_FIELDS = ('password',)
+SESSION_USER_KEY_PREFIX = 'session-user:'
+SESSION_USER_GENERATION_KEY = 'session-user-generation'
+# Attributes in which ModelBackend caches a user's permissions
+PERMISSION_CACHES = ('_user_perm_cache', '_group_perm_cache', '_perm_cache')
+
+_local_cache = None
+
+
+def local_token_cache():
+    """The process-wide token cache, created from settings on first use"""
+    global _local_cache
+    if _local_cache is None:
+        _local_cache = TTLCache(
+            maxsize=getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 1000),
+            ttl=getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60),
+        )
+    return _local_cache
+
+
+def shared_token_cache():
+    """The configured shared cache (e.g. Redis or Memcached), or None"""
+    alias = getattr(settings, 'TOKEN_AUTH_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _generation(shared):
+    if shared is None:
+        return CacheGeneration.objects.current(GENERATION_KEY)
+    return shared.get(GENERATION_KEY, 0)
+
+
+def _bump_generation(shared):
+    if shared is None:
+        CacheGeneration.objects.bump(GENERATION_KEY)
+    elif not shared.add(GENERATION_KEY, 1, None):
+        try:
+            shared.incr(GENERATION_KEY)
+        except ValueError:
+            shared.set(GENERATION_KEY, 1, None)
+
+
+def user_values(user):
+    """The user's field values for a shared cache, without the password hash"""
+    return {
+        field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields
+        if field.attname not in UNCACHED_USER_FIELDS
+    }
+
+
+def user_from_values(db, values):
+    # Fields left out come back deferred, so they load from the database
+    # on access and save() does not overwrite them
+    return get_user_model().from_db(db, list(values), list(values.values()))
+
+
+def _pack(user, token):
+    token_values = {field.attname: getattr(token, field.attname) for field in token._meta.concrete_fields}
+    return user._state.db, user_values(user), token_values
+
+
+def _unpack(cached):
+    db, values, token_values = cached
+    user = user_from_values(db, values)
+    token = Token.from_db(db, list(token_values), list(token_values.values()))
+    token.user = user
+    return user, token
+
+
+def invalidate_tokens(keys):
+    """
+    Drop cached tokens and bump the revocation generation, so every process
+    discards its local entries on its next request instead of trusting them
+    until they expire. The generation lives in the shared cache, or in the
+    database when there is none.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    local = local_token_cache()
+    for key in keys:
+        local.delete(key)
+
+    shared = shared_token_cache()
+    if shared is not None:
+        shared.delete_many([SHARED_KEY_PREFIX + key for key in keys])
+    _bump_generation(shared)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers resolved tokens instead of querying
+    authtoken_token joined with auth_user on every request.
+
+    Lookups go to an in-process LRU (TOKEN_AUTH_CACHE_SIZE entries, each
+    trusted for TOKEN_AUTH_CACHE_TTL seconds), then to the optional shared
+    cache named by TOKEN_AUTH_SHARED_CACHE, then to the database. Signals
+    in api.signals invalidate entries when a token is deleted or replaced
+    (e.g. by create_api_token) or its user is changed, and bump a
+    generation every process checks before trusting its copy. Without a
+    shared cache the generation is read from the database: one primary key
+    lookup per request instead of the token and user join.
+    """
+
+    def authenticate_credentials(self, key):
+        local = local_token_cache()
+        shared = shared_token_cache()
+        generation = _generation(shared)
+
+        entry = local.get(key)
+        if entry is not None and entry[2] == generation:
+            user, token = entry[0], entry[1]
+        else:
+            cached = shared.get(SHARED_KEY_PREFIX + key) if shared is not None else None
+            if cached is not None:
+                user, token = _unpack(cached)
+            else:
+                # Raises AuthenticationFailed for unknown keys and inactive
+                # users; failures are never cached
+                user, token = super().authenticate_credentials(key)
+                if shared is not None:
+                    shared.set(SHARED_KEY_PREFIX + key, _pack(user, token), getattr(settings, 'TOKEN_AUTH_SHARED_CACHE_TTL', 300))
+            local.set(key, (user, token, generation))
+
+        # Requests must not share (and mutate) one cached user instance
+        return copy.copy(user), token
+
+
+def session_user_cache():
+    """The shared cache named by SESSION_SHARED_CACHE, or None"""
+    alias = getattr(settings, 'SESSION_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _session_user_key(cache, user_id):
+    return f"{SESSION_USER_KEY_PREFIX}{cache.get(SESSION_USER_GENERATION_KEY, 0)}:{user_id}"
+
+
+def forget_session_users(user_ids):
+    """Drop cached session users, e.g. after a logout or password change"""
+    cache = session_user_cache()
+    if cache is not None:
+        cache.delete_many([_session_user_key(cache, user_id) for user_id in user_ids])
+
+
+def forget_all_session_users():
+    """Orphan every cached session user by moving to a new key generation"""
+    cache = session_user_cache()
+    if cache is None:
+        return
+    if not cache.add(SESSION_USER_GENERATION_KEY, 1, None):
+        try:
+            cache.incr(SESSION_USER_GENERATION_KEY)
+        except ValueError:
+            cache.set(SESSION_USER_GENERATION_KEY, 1, None)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that caches the user loaded for each session request,
+    together with their permissions, instead of reading auth_user (and the
+    permission tables on the first permission check) on every request. The
+    password hash is not cached; it loads from the database if needed.
+
+    Entries live in the SESSION_SHARED_CACHE cache for
+    SESSION_USER_CACHE_TTL seconds. Signals in api.signals drop them on
+    logout and whenever the user, their groups or their permissions change.
+    Every process must read the same cache for that to end other sessions
+    at once, so without SESSION_SHARED_CACHE this behaves as ModelBackend.
+    """
+
+    def get_user(self, user_id):
+        cache = session_user_cache()
+        if cache is None:
+            return super().get_user(user_id)
+        key = _session_user_key(cache, user_id)
+        cached = cache.get(key)
+        if cached is not None:
+            db, values, permission_caches, session_hash = cached
+            user = user_from_values(db, values)
+            for name, permissions in permission_caches.items():
+                setattr(user, name, permissions)
+            # Every session request verifies this HMAC of the password hash;
+            # answering from the cache keeps the password deferred
+            user.get_session_auth_hash = lambda: session_hash
+            return user
+
+        user = super().get_user(user_id)
+        if user is None:
+            return None
+        # Fill the permission caches so they are stored with the user
+        self.get_all_permissions(user)
+        permission_caches = {name: getattr(user, name) for name in PERMISSION_CACHES if hasattr(user, name)}
+        cached = (user._state.db, user_values(user), permission_caches, user.get_session_auth_hash())
+        cache.set(key, cached, getattr(settings, 'SESSION_USER_CACHE_TTL', 300))
+        return user
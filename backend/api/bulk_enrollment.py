@@ -0,0 +1,91 @@
+from django.db import transaction
+
+from clients.models import Client, Enrollment, record_enrollment_changes
+
+# Client fields a bulk enrollment may select on
+CLIENT_FILTER_FIELDS = [
+    'county', 'sub_county', 'ward', 'gender',
+    'date_of_birth__gte', 'date_of_birth__lte',
+    'created_at__gte', 'created_at__lte',
+]
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BulkEnrollmentResult:
+    def __init__(self):
+        self.created = 0
+        self.reactivated = 0
+        self.already_active = 0
+        self.failed_client_ids = []
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'reactivated': self.reactivated,
+            'already_active': self.already_active,
+            'failed': len(self.failed_client_ids),
+            'failed_client_ids': self.failed_client_ids,
+        }
+
+
+def bulk_enroll(program, client_ids=None, client_filter=None, fields=None, chunk_size=1000):
+    """
+    Enroll many clients in one program inside a single transaction.
+
+    Clients are given either as a list of ids or as a filter on
+    CLIENT_FILTER_FIELDS, and are resolved with one query. Missing
+    enrollments are inserted and inactive ones reactivated with one upsert
+    statement per chunk; ids that match no client are reported as failed.
+    """
+    fields = fields or {}
+    result = BulkEnrollmentResult()
+
+    with transaction.atomic():
+        if client_ids is not None:
+            requested = list(dict.fromkeys(client_ids))
+            found = set()
+            for chunk in _chunks(requested, chunk_size):
+                found.update(Client.objects.filter(client_id__in=chunk).values_list('client_id', flat=True))
+            result.failed_client_ids = [str(client_id) for client_id in requested if client_id not in found]
+            targets = [client_id for client_id in requested if client_id in found]
+        else:
+            targets = list(Client.objects.filter(**client_filter).values_list('client_id', flat=True))
+
+        for chunk in _chunks(targets, chunk_size):
+            _enroll_chunk(program, chunk, fields, result)
+
+    return result
+
+
+def _enroll_chunk(program, client_ids, fields, result):
+    existing = {
+        client_id: is_active
+        for client_id, is_active in Enrollment.objects.filter(
+            program=program, client_id__in=client_ids
+        ).values_list('client_id', 'is_active')
+    }
+
+    new = [client_id for client_id in client_ids if client_id not in existing]
+    reactivate = [client_id for client_id, is_active in existing.items() if not is_active]
+    changed = new + reactivate
+
+    # Inserts and reactivations go out as one upsert statement per chunk
+    Enrollment.objects.upsert(
+        [Enrollment(client_id=client_id, program=program, is_active=True, **fields) for client_id in changed],
+        update_fields=['is_active', 'updated_at', *fields],
+    )
+
+    result.created += len(new)
+    result.reactivated += len(reactivate)
+    result.already_active += len(existing) - len(reactivate)
+
+    if changed:
+        # bulk_create does not return ids on MySQL, so read them back
+        record_enrollment_changes(
+            Enrollment.objects.filter(program=program, client_id__in=changed).values_list('id', 'client_id', 'program_id')
+        )
@@ -0,0 +1,239 @@
+import codecs
+import csv
+import json
+import logging
+import re
+from datetime import date
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.parsers import BaseParser
+
+from clients.models import Client
+from locations.lookup import is_valid_name, locations
+from .models import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+GENDERS = {
+    'm': 'M', 'male': 'M',
+    'f': 'F', 'female': 'F',
+    'o': 'O', 'other': 'O',
+}
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+REQUIRED_FIELDS = ['first_name', 'last_name', 'date_of_birth', 'gender', 'county', 'sub_county']
+OPTIONAL_FIELDS = ['id_number', 'phone_number', 'email', 'ward', 'blood_type', 'allergies']
+
+
+class CSVUploadParser(BaseParser):
+    """Hands the raw request stream to the importer instead of parsing it"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+class NDJSONUploadParser(CSVUploadParser):
+    media_type = 'application/x-ndjson'
+
+
+def read_rows(stream, input_format):
+    """
+    Yield (row_number, dict) pairs from a CSV (with header row) or
+    newline-delimited JSON byte stream. Row numbers are 1-based data rows.
+    """
+    # The stream may be an uploaded file or the request itself, so decode
+    # with a reader that only needs read()
+    text = codecs.getreader('utf-8-sig')(stream)
+    if input_format == CSV:
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row
+    elif input_format == NDJSON:
+        number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {'__invalid__': line}
+    else:
+        raise ValueError(f"Unsupported import format: {input_format}")
+
+
+def detect_format(content_type='', filename=''):
+    """Guess the import format from a content type or file name"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    filename = (filename or '').lower()
+    if content_type in ('text/csv', 'application/csv') or filename.endswith('.csv'):
+        return CSV
+    if content_type in ('application/x-ndjson', 'application/jsonl') or filename.endswith(('.ndjson', '.jsonl')):
+        return NDJSON
+    return None
+
+
+class ImportReport:
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def add_error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+
+class ClientImporter:
+    """
+    Bulk loader for client records.
+
+    Rows are processed in batches: each batch is validated with plain
+    Python checks (no per-row serializer or full_clean), existing national
+    ID numbers for the whole batch are fetched in one query, and valid rows
+    are written with bulk_create together with their change-feed events.
+    Rows that fail are reported with their row number and reasons; the
+    rest of the batch is still imported.
+    """
+
+    def __init__(self, batch_size=2000, insert_chunk_size=500, dry_run=False):
+        self.batch_size = batch_size
+        self.insert_chunk_size = insert_chunk_size
+        self.dry_run = dry_run
+        self.max_lengths = {
+            name: Client._meta.get_field(name).max_length
+            for name in REQUIRED_FIELDS + OPTIONAL_FIELDS
+            if name != 'gender' and Client._meta.get_field(name).max_length
+        }
+        self._seen_id_numbers = set()
+
+    def run(self, rows):
+        """Import (row_number, dict) pairs and return an ImportReport"""
+        report = ImportReport()
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return report
+            report.total += len(batch)
+            self._import_batch(batch, report)
+
+    def validate_row(self, row):
+        """Return (cleaned_fields, errors) for a single row"""
+        if '__invalid__' in row:
+            return None, {'row': 'Line is not a JSON object.'}
+
+        errors = {}
+        cleaned = {}
+        for name in REQUIRED_FIELDS + OPTIONAL_FIELDS:
+            value = row.get(name)
+            value = value.strip() if isinstance(value, str) else value
+            if value in (None, ''):
+                if name in REQUIRED_FIELDS:
+                    errors[name] = 'This field is required.'
+                else:
+                    cleaned[name] = None
+                continue
+            value = str(value)
+            max_length = self.max_lengths.get(name)
+            if max_length and len(value) > max_length:
+                errors[name] = f'Ensure this field has no more than {max_length} characters.'
+                continue
+            cleaned[name] = value
+
+        if cleaned.get('date_of_birth'):
+            try:
+                cleaned['date_of_birth'] = date.fromisoformat(cleaned['date_of_birth'])
+                if cleaned['date_of_birth'] > timezone.localdate():
+                    errors['date_of_birth'] = 'Date of birth cannot be in the future.'
+            except ValueError:
+                errors['date_of_birth'] = 'Use the format YYYY-MM-DD.'
+
+        if cleaned.get('gender'):
+            gender = GENDERS.get(cleaned['gender'].lower())
+            if gender is None:
+                errors['gender'] = 'Use M, F or O.'
+            cleaned['gender'] = gender
+
+        if cleaned.get('county') and locations.county(cleaned['county']) is None:
+            errors['county'] = 'Unknown county.'
+
+        for field, label in (('sub_county', 'sub-county'), ('ward', 'ward')):
+            if cleaned.get(field) and not is_valid_name(cleaned[field]):
+                errors[field] = f'Enter a valid {label} name.'
+
+        if cleaned.get('email') and not EMAIL_RE.match(cleaned['email']):
+            errors['email'] = 'Enter a valid email address.'
+
+        return cleaned, errors
+
+    def _import_batch(self, batch, report):
+        valid = []
+        for row_number, row in batch:
+            cleaned, errors = self.validate_row(row)
+            if errors:
+                report.add_error(row_number, errors)
+            else:
+                valid.append((row_number, cleaned))
+
+        # One query for the uniqueness check of the whole batch
+        id_numbers = {cleaned['id_number'] for _, cleaned in valid if cleaned['id_number']}
+        existing = set(
+            Client.objects.filter(id_number__in=id_numbers).values_list('id_number', flat=True)
+        ) if id_numbers else set()
+
+        clients = []
+        for row_number, cleaned in valid:
+            id_number = cleaned['id_number']
+            if id_number and (id_number in existing or id_number in self._seen_id_numbers):
+                report.add_error(row_number, {'id_number': 'A client with this ID number already exists.'})
+                continue
+            if id_number:
+                self._seen_id_numbers.add(id_number)
+            client = Client(**cleaned)
+            # A dry run must not add sub-counties or wards
+            client.assign_locations(create=not self.dry_run)
+            clients.append((row_number, client))
+
+        if self.dry_run:
+            report.created += len(clients)
+            return
+
+        for start in range(0, len(clients), self.insert_chunk_size):
+            self._insert_chunk(clients[start:start + self.insert_chunk_size], report)
+
+    def _insert_chunk(self, chunk, report):
+        objects = [client for _, client in chunk]
+        try:
+            with transaction.atomic():
+                Client.objects.bulk_create(objects)
+                ChangeEvent.objects.record_many(objects, ChangeEvent.UPSERT)
+            report.created += len(objects)
+        except IntegrityError:
+            # A concurrent writer took one of the ID numbers; fall back to
+            # row-by-row inserts for this chunk only.
+            logger.warning("Bulk insert conflict, retrying %d rows individually", len(objects))
+            for row_number, client in chunk:
+                try:
+                    with transaction.atomic():
+                        client.save(force_insert=True)
+                    report.created += 1
+                except IntegrityError:
+                    report.add_error(row_number, {'id_number': 'A client with this ID number already exists.'})
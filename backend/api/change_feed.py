@@ -0,0 +1,149 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+# Database aliases whose open transactions this process is not allowed to see
+_writers_hidden = set()
+
+# Age in seconds of the oldest other transaction that has written rows
+OPEN_WRITER_AGE_SQL = {
+    'mysql': (
+        "SELECT TIMESTAMPDIFF(MICROSECOND, MIN(trx_started), NOW(6)) / 1000000"
+        " FROM information_schema.innodb_trx"
+        " WHERE trx_rows_modified > 0 AND trx_mysql_thread_id <> CONNECTION_ID()"
+    ),
+    'postgresql': (
+        "SELECT EXTRACT(EPOCH FROM now() - MIN(xact_start)) FROM pg_stat_activity"
+        " WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+    ),
+}
+
+
+def open_writer_age(using='default'):
+    """
+    Seconds since the oldest transaction still writing to the database
+    began, 0 if there is none, or None where that cannot be seen (SQLite,
+    or MySQL without the PROCESS privilege).
+    
+    Rows such a transaction wrote, and the sequence numbers or timestamps
+    it took for them, can still commit behind anything read now.
+    """
+    connection = connections[using]
+    sql = OPEN_WRITER_AGE_SQL.get(connection.vendor)
+    if sql is None or using in _writers_hidden:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            age = cursor.fetchone()[0]
+    except DatabaseError:
+        _writers_hidden.add(using)
+        logger.warning("Cannot list open transactions on %s; gaps fill within CHANGE_FEED_GAP_GRACE only", using, exc_info=True)
+        return None
+    return float(age or 0)
+
+
+def commit_horizon(grace, using='default'):
+    """
+    The time before which rows, or gaps between them, can be trusted to
+    stay as read: `grace` seconds ago, or earlier while an open
+    transaction older than that may still commit.
+    """
+    age = open_writer_age(using) or 0
+    return timezone.now() - timedelta(seconds=max(grace, age))
+
+
+def read_changes(after, limit):
+    """
+    Return up to `limit` events with a sequence greater than `after`.
+    
+    Sequence numbers are allocated when a transaction inserts its event, not
+    when it commits, so a later number can become visible before an earlier
+    one. Reading stops at a gap in the sequence while the event after the gap
+    is newer than the commit horizon: the start of the oldest transaction
+    still writing, and at least CHANGE_FEED_GAP_GRACE seconds ago, because
+    the missing number may still commit. Older gaps are permanent
+    (rollbacks, compaction).
+    
+    Returns a tuple of (events, has_more).
+    """
+    # Taken before reading, so a writer committing in between is either
+    # still counted as open or already visible
+    horizon = commit_horizon(getattr(settings, 'CHANGE_FEED_GAP_GRACE', 5))
+    
+    rows = list(ChangeEvent.objects.filter(id__gt=after).order_by('id')[:limit + 1])
+    has_more = len(rows) > limit
+    
+    events = []
+    previous = after
+    for event in rows[:limit]:
+        if event.id != previous + 1 and event.created_at > horizon:
+            return events, True
+        events.append(event)
+        previous = event.id
+    return events, has_more
+
+
+def wait_for_changes(after, limit, wait, poll_interval=0.5):
+    """
+    Long-poll variant of read_changes: block for up to `wait` seconds until
+    at least one event is available.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        events, has_more = read_changes(after, limit)
+        if events or time.monotonic() >= deadline:
+            return events, has_more
+        time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+
+
+def compact_change_events(compact_after, tombstone_retention, batch_size=1000):
+    """
+    Keep the outbox bounded.
+    
+    - Events older than `compact_after` that have a newer event for the same
+      object are deleted; the latest state of every object is kept.
+    - Delete events (tombstones) older than `tombstone_retention` are deleted.
+    
+    Both run as batched DELETEs by primary key so locks are held briefly.
+    Returns a tuple of (superseded_deleted, tombstones_deleted).
+    """
+    now = timezone.now()
+    
+    newer = ChangeEvent.objects.filter(
+        model=OuterRef('model'),
+        object_id=OuterRef('object_id'),
+        id__gt=OuterRef('id'),
+    )
+    superseded = ChangeEvent.objects.filter(created_at__lt=now - compact_after).filter(Exists(newer))
+    superseded_deleted = _delete_in_batches(superseded, batch_size)
+    
+    tombstones = ChangeEvent.objects.filter(
+        operation=ChangeEvent.DELETE,
+        created_at__lt=now - tombstone_retention,
+    )
+    tombstones_deleted = _delete_in_batches(tombstones, batch_size)
+    
+    return superseded_deleted, tombstones_deleted
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += ChangeEvent.objects.filter(id__in=ids).delete()[0]
+        last_id = ids[-1]
@@ -0,0 +1,172 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models import ChangeEvent, ChangeTrackedModel
+
+
+def change_sequence():
+    """
+    (id, created_at) of the newest change event, or (0, None). One primary
+    key lookup, whatever the size of the tables behind it.
+    """
+    return ChangeEvent.objects.order_by('-id').values_list('id', 'created_at').first() or (0, None)
+
+
+def get_validators(queryset, dependencies=(), *extra):
+    """
+    Compute an (ETag, Last-Modified) pair for the rows of a queryset without
+    loading, serializing or counting them.
+    
+    Every write to a change-tracked model (clients, enrollments, programs)
+    appends to the change feed, so the feed's latest sequence number stands
+    in for all of them: the validators move whenever any such row is
+    created, changed or deleted. Other models whose data is nested in the
+    representation, such as program categories, are small reference
+    tables and are summarised by MAX(updated_at) and COUNT(*) instead; the
+    count catches deletes. `extra` values, such as the accepted media type,
+    are mixed into the ETag.
+    
+    The local date is always included because serializers expose
+    date-dependent fields (client age, program is_active).
+    """
+    parts = [timezone.localdate().isoformat()]
+    parts.extend(str(value) for value in extra)
+    
+    timestamps = []
+    models = [queryset.model, *dependencies]
+    if any(issubclass(model, ChangeTrackedModel) for model in models):
+        sequence, changed_at = change_sequence()
+        parts.append(f"changes:{sequence}")
+        if changed_at:
+            timestamps.append(changed_at)
+    for model in models:
+        if issubclass(model, ChangeTrackedModel):
+            continue
+        qs = queryset if model is queryset.model else model._default_manager.all()
+        stats = qs.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        parts.append(f"{model._meta.label_lower}:{stats['count']}:{stats['last_modified']}")
+        if stats['last_modified']:
+            timestamps.append(stats['last_modified'])
+    
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    # Weak: the validator tracks the data, not the exact bytes, which also
+    # change with compression.
+    etag = f'W/"{digest}"'
+    last_modified = int(max(timestamps).timestamp()) if timestamps else None
+    return etag, last_modified
+
+
+def response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def set_validator_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Representations differ per client only through auth and content negotiation
+    patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+    return response
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    Return a 304 (or 412) response if the request's conditional headers match
+    the validators, otherwise None.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validator_headers(response, etag, last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Viewset mixin answering conditional list/retrieve requests with
+    304 Not Modified before the queryset is serialized.
+    
+    `conditional_dependencies` lists models whose rows are nested in the
+    representation; a change to any of them changes the validators.
+    
+    Setting `response_cache_timeout` also caches the rendered JSON body under
+    the ETag, so repeat requests for unchanged data skip serialization.
+    CompressionMiddleware stores compressed variants next to the entry.
+    """
+    conditional_dependencies = ()
+    response_cache_timeout = None
+    
+    def get_conditional_validators(self, queryset):
+        return get_validators(
+            queryset,
+            self.conditional_dependencies,
+            type(self).__name__,
+            self.action,
+            getattr(self.request, 'accepted_media_type', ''),
+        )
+    
+    def get_response_cache_key(self, request, etag):
+        # Only JSON is cached: the browsable API embeds per-user data
+        renderer = getattr(request, 'accepted_renderer', None)
+        if self.response_cache_timeout is None or getattr(renderer, 'format', None) != 'json':
+            return None
+        path = hashlib.sha1(request.get_full_path().encode('utf-8')).hexdigest()
+        return f'response:{type(self).__name__}:{path}:{etag}'
+    
+    def _conditional(self, request, queryset, handler, *args, **kwargs):
+        try:
+            etag, last_modified = self.get_conditional_validators(queryset)
+        except (TypeError, ValueError, ValidationError):
+            # Malformed lookup value; let the regular handler produce the 404
+            return handler(request, *args, **kwargs)
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        
+        cache_key = self.get_response_cache_key(request, etag)
+        cached = response_cache().get(cache_key) if cache_key else None
+        if cached is not None:
+            response = HttpResponse(cached['content'], content_type=cached['content_type'])
+            response.compression_cache_key = cache_key
+            response.compression_cache_timeout = self.response_cache_timeout
+            return set_validator_headers(response, etag, last_modified)
+        
+        response = handler(request, *args, **kwargs)
+        if 200 <= response.status_code < 300:
+            set_validator_headers(response, etag, last_modified)
+            self._response_cache_key = cache_key
+        return response
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        cache_key = getattr(self, '_response_cache_key', None)
+        if cache_key and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            response_cache().set(cache_key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+            }, self.response_cache_timeout)
+            response.compression_cache_key = cache_key
+            response.compression_cache_timeout = self.response_cache_timeout
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional(request, queryset, super().list, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        return self._conditional(request, queryset, super().retrieve, *args, **kwargs)
@@ -1 +1,446 @@
- 
\ No newline at end of file
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, HTTPError, RequestException, Timeout as RequestTimeout
+
+from . import external_api_config as config
+
+logger = logging.getLogger('external_api_client')
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay or HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class APIRateLimitExceeded(HTTPError):
+    """
+    The upstream API answered 429 Too Many Requests.
+
+    `retry_after` is the number of seconds it asked us to wait, if any.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, **kwargs):
+        super().__init__(message, **kwargs)
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying an upstream call.
+
+    Only idempotent methods are retried, and only after connection errors,
+    timeouts and transient statuses (429, 5xx gateway errors); other 4xx
+    answers will not improve on retry. Delays follow decorrelated jitter:
+    each is drawn between `base_delay` and three times the previous one,
+    capped at `max_delay`, so clients that failed together do not retry
+    together. A Retry-After from the upstream is honoured. The whole call,
+    retries included, must finish within `deadline` seconds.
+
+    A policy holds no per-call state; `start()` returns a RetryBudget for
+    one call. `tenacity_kwargs()` applies the same policy to a tenacity
+    @retry decorator.
+    """
+
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+    RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.max_attempts = max_attempts or config.MAX_RETRIES
+        self.base_delay = config.RETRY_BACKOFF if base_delay is None else base_delay
+        self.max_delay = config.RETRY_BACKOFF_MAX if max_delay is None else max_delay
+        self.deadline = config.RETRY_DEADLINE if deadline is None else deadline
+
+    def is_retryable(self, method: str, error: BaseException) -> bool:
+        if method.upper() not in self.IDEMPOTENT_METHODS:
+            return False
+        if isinstance(error, (ConnectionError, RequestTimeout)):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and response.status_code in self.RETRY_STATUSES
+
+    def backoff(self, previous: float) -> float:
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous * 3)))
+
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is None and getattr(error, 'response', None) is not None:
+            retry_after = parse_retry_after(error.response.headers.get('Retry-After'))
+        return retry_after
+
+    def start(self) -> 'RetryBudget':
+        return RetryBudget(self)
+
+    def tenacity_kwargs(self, method_arg: int = 1) -> Dict[str, Any]:
+        """
+        Arguments for tenacity.retry() applying this policy to a function
+        whose HTTP method is positional argument `method_arg`.
+        """
+        def retry(retry_state):
+            budget = getattr(retry_state, 'retry_budget', None)
+            if budget is None:
+                budget = retry_state.retry_budget = self.start()
+            error = retry_state.outcome.exception()
+            if error is None:
+                return False
+            method = retry_state.kwargs.get('method') or retry_state.args[method_arg]
+            retry_state.retry_delay = budget.next_delay(method, error)
+            return retry_state.retry_delay is not None
+
+        return {
+            'retry': retry,
+            'wait': lambda retry_state: retry_state.retry_delay,
+            'stop': lambda retry_state: False,
+            'reraise': True,
+        }
+
+
+class RetryBudget:
+    """Attempts and deadline of one call under a RetryPolicy"""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.attempts = 0
+        self.delay = policy.base_delay
+        self.deadline = time.monotonic() + policy.deadline
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def next_delay(self, method: str, error: BaseException) -> Optional[float]:
+        """
+        Record a failed attempt. Returns the seconds to wait before the next
+        one, or None if the call should give up.
+        """
+        self.attempts += 1
+        if self.attempts >= self.policy.max_attempts or not self.policy.is_retryable(method, error):
+            return None
+        self.delay = self.policy.backoff(self.delay)
+        delay = max(self.delay, self.policy.retry_after(error) or 0)
+        if delay >= self.remaining():
+            return None
+        return delay
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket pacing outbound calls to one upstream.
+
+    Tokens refill at `rate` per second up to `capacity`, so short bursts
+    pass at once and sustained traffic is spread out. When the upstream
+    answers 429 the bucket pauses for its Retry-After and halves its rate
+    (down to a tenth of the configured rate); each successful call then
+    wins back a twentieth of the configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token, sleeping until one is available. Returns False if
+        that would take longer than `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1 and now >= self.blocked_until:
+                    self.tokens -= 1
+                    return True
+                wait = max((1 - self.tokens) / self.rate, self.blocked_until - now)
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """The upstream throttled us: back off and slow down"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = 0
+            self.rate = max(self.max_rate / 10, self.rate / 2)
+            self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after is not None else 1 / self.rate))
+
+    def succeeded(self) -> None:
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter(key: str) -> TokenBucket:
+    """
+    The token bucket for an upstream (e.g. its base URL), shared by every
+    service calling it. Paced at RATE_LIMIT_CALLS per RATE_LIMIT_PERIOD
+    with bursts of up to RATE_LIMIT_BURST calls.
+    """
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                bucket = _buckets[key] = TokenBucket(
+                    rate=config.RATE_LIMIT_CALLS / config.RATE_LIMIT_PERIOD,
+                    capacity=config.RATE_LIMIT_BURST,
+                )
+    return bucket
+
+
+class CircuitOpenError(RequestException):
+    """The circuit for an upstream endpoint is open; the call was not made"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream endpoint.
+
+    Closed: calls go through. After `failure_threshold` consecutive
+    failures (connection errors, timeouts, 5xx answers) the circuit opens
+    and calls are refused at once for `reset_timeout` seconds. Then it is
+    half-open: one probe call goes through, and its outcome closes the
+    circuit or opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = config.CIRCUIT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+        self.rejected = 0
+        self.successes = 0
+        self.total_failures = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_failure(error: BaseException) -> bool:
+        """Whether an error says the upstream is unhealthy (4xx answers do not)"""
+        if isinstance(error, (ConnectionError, RequestTimeout)):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and response.status_code >= 500
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self.opened_at + self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self.probing):
+                self.probing = self.state == self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def cancel_probe(self) -> None:
+        """Give back a half-open probe slot whose call was never made"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            self.failures = 0
+            self.probing = False
+            self.state = self.CLOSED
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.probing = False
+            if not self.is_failure(error):
+                # The upstream answered; it is not down
+                if self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.total_failures += 1
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning("Circuit %s opened after %d failure(s)", self.name, self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'retry_after': round(self.retry_after(), 1) if self.state == self.OPEN else None,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'successes': self.successes,
+                'failures': self.total_failures,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(name: str) -> CircuitBreaker:
+    """The breaker for an upstream endpoint, shared by every service calling it"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in list(_breakers.items())}
+
+
+class ExternalAPIClient:
+    """
+    HTTP transport shared by the external API services.
+
+    One requests.Session per process keeps TCP and TLS connections to each
+    upstream host open between calls instead of reconnecting every time.
+    Up to EXTERNAL_API_POOL_MAXSIZE idle connections are kept per host, for
+    up to EXTERNAL_API_POOL_CONNECTIONS hosts. Requests get a connect
+    timeout of EXTERNAL_API_CONNECT_TIMEOUT and a read timeout of
+    EXTERNAL_API_TIMEOUT unless the caller passes one.
+
+    Session state is limited to common headers; callers pass their own
+    authentication headers per request, so services with different tokens
+    can share one pool.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        verify: Optional[bool] = None,
+    ):
+        self.connect_timeout = connect_timeout or config.CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or config.REQUEST_TIMEOUT
+        self.session = requests.Session()
+        self.session.verify = config.VERIFY_SSL if verify is None else verify
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'User-Agent': f'afya-yetu-his/{config.API_VERSION}',
+        })
+
+        # Retries are the services' job; the adapter makes a single attempt
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or config.POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or config.POOL_MAXSIZE,
+            max_retries=0,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[Timeout] = None,
+        **kwargs: Any
+    ) -> requests.Response:
+        """
+        Send a request over the pooled session.
+
+        Raises APIRateLimitExceeded on 429 and HTTPError on other error
+        statuses; connection problems raise the usual RequestException.
+        """
+        if config.LOG_REQUESTS:
+            logger.debug("%s %s", method.upper(), url)
+        response = self.session.request(
+            method.upper(),
+            url,
+            headers=headers,
+            timeout=(self.connect_timeout, self.read_timeout) if timeout is None else timeout,
+            **kwargs
+        )
+        if config.LOG_RESPONSES:
+            logger.debug("%s %s -> %s in %.3fs", method.upper(), url, response.status_code, response.elapsed.total_seconds())
+
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            raise APIRateLimitExceeded(
+                f"Rate limit exceeded for {url}",
+                retry_after=retry_after,
+                response=response,
+            )
+        response.raise_for_status()
+        return response
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def shared_client() -> ExternalAPIClient:
+    """The process-wide client, created on first use"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = ExternalAPIClient()
+    return _shared_client
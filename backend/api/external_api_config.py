@@ -20,16 +20,46 @@ ENDPOINTS = {
 
 # Request settings
 REQUEST_TIMEOUT = getattr(settings, 'EXTERNAL_API_TIMEOUT', 30)  # seconds
+CONNECT_TIMEOUT = getattr(settings, 'EXTERNAL_API_CONNECT_TIMEOUT', 5)  # seconds
 MAX_RETRIES = getattr(settings, 'EXTERNAL_API_MAX_RETRIES', 3)
-RETRY_BACKOFF = getattr(settings, 'EXTERNAL_API_RETRY_BACKOFF', 0.5)  # seconds
+RETRY_BACKOFF = getattr(settings, 'EXTERNAL_API_RETRY_BACKOFF', 0.5)  # seconds, first retry delay
+RETRY_BACKOFF_MAX = getattr(settings, 'EXTERNAL_API_RETRY_BACKOFF_MAX', 10)  # seconds
+RETRY_DEADLINE = getattr(settings, 'EXTERNAL_API_RETRY_DEADLINE', 30)  # seconds for a call, retries included
+
+# Circuit breaker, per upstream endpoint
+CIRCUIT_FAILURE_THRESHOLD = getattr(settings, 'EXTERNAL_API_CIRCUIT_FAILURE_THRESHOLD', 5)  # consecutive failures
+CIRCUIT_RESET_TIMEOUT = getattr(settings, 'EXTERNAL_API_CIRCUIT_RESET_TIMEOUT', 30)  # seconds open before a probe
+
+# Connection pool (see external_api_client.py)
+POOL_CONNECTIONS = getattr(settings, 'EXTERNAL_API_POOL_CONNECTIONS', 10)  # hosts
+POOL_MAXSIZE = getattr(settings, 'EXTERNAL_API_POOL_MAXSIZE', 20)  # kept-alive connections per host
 
 # Rate limiting
 RATE_LIMIT_CALLS = getattr(settings, 'EXTERNAL_API_RATE_LIMIT_CALLS', 100)
 RATE_LIMIT_PERIOD = getattr(settings, 'EXTERNAL_API_RATE_LIMIT_PERIOD', 60)  # seconds
+RATE_LIMIT_BURST = getattr(settings, 'EXTERNAL_API_RATE_LIMIT_BURST', max(1, RATE_LIMIT_CALLS // 10))  # calls
+RATE_LIMIT_WAIT = getattr(settings, 'EXTERNAL_API_RATE_LIMIT_WAIT', 10)  # seconds a call may wait for its turn
 
 # Cache settings
 CACHE_ENABLED = getattr(settings, 'EXTERNAL_API_CACHE_ENABLED', True)
 CACHE_TIMEOUT = getattr(settings, 'EXTERNAL_API_CACHE_TIMEOUT', 300)  # seconds
+CACHE_MAX_ENTRIES = getattr(settings, 'EXTERNAL_API_CACHE_MAX_ENTRIES', 1000)
+# Per-endpoint overrides of CACHE_TIMEOUT; 0 disables caching for an endpoint
+CACHE_TIMEOUTS = getattr(settings, 'EXTERNAL_API_CACHE_TIMEOUTS', {
+    'facilities': 24 * 3600,
+    'patient_history': 600,
+    'lab_results': 60,
+    'prescriptions': 60,
+})
+# Cached endpoints whose responses a write to an endpoint makes stale, on
+# top of the written endpoint itself and the paths below it
+CACHE_INVALIDATES = getattr(settings, 'EXTERNAL_API_CACHE_INVALIDATES', {
+    'patient_create': ['patient_search'],
+    'patient_update': ['patient_detail', 'patient_search'],
+    'medical_record_create': ['patient_history'],
+    'lab_result_create': ['lab_results'],
+    'prescription_create': ['prescriptions'],
+})
 
 # Logging
 LOG_REQUESTS = getattr(settings, 'EXTERNAL_API_LOG_REQUESTS', True)
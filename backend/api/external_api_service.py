@@ -1,12 +1,58 @@
+import copy
 import logging
-import requests
+import re
+import time
 from typing import Dict, Any, Optional, Union
 from requests.exceptions import RequestException, Timeout
 from datetime import datetime
-from .external_api_client import ExternalAPIClient, APIRateLimitExceeded
+from . import external_api_config as config
+from .external_api_client import (
+    ExternalAPIClient, APIRateLimitExceeded, CircuitOpenError, RetryPolicy,
+    circuit_breaker, circuit_breaker_stats, rate_limiter, shared_client,
+)
+from .lru import TTLCache
 
 logger = logging.getLogger('external_api')
 
+_response_cache = None
+
+
+def response_cache() -> TTLCache:
+    """The process-wide cache of GET responses, created on first use"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = TTLCache(maxsize=config.CACHE_MAX_ENTRIES, ttl=config.CACHE_TIMEOUT)
+    return _response_cache
+
+
+def _normalize_endpoint(endpoint: str) -> str:
+    return endpoint.strip('/')
+
+
+def _breaker_name(base_url: str, endpoint: str) -> str:
+    # Path segments holding ids share one breaker: patients/*/records
+    return f"{base_url}/" + re.sub(r'(?<![^/])[^/]*\d[^/]*', '*', _normalize_endpoint(endpoint))
+
+
+def upstream_status() -> Dict[str, Any]:
+    """Circuit breaker states and response cache statistics of this process"""
+    return {
+        'circuits': circuit_breaker_stats(),
+        'response_cache': response_cache().stats(),
+    }
+
+
+def _normalize_params(params: Optional[Dict[str, Any]]) -> tuple:
+    """Order-independent, hashable form of query parameters; None values are dropped"""
+    if not params:
+        return ()
+    return tuple(sorted(
+        (str(key), tuple(map(str, value)) if isinstance(value, (list, tuple)) else str(value))
+        for key, value in params.items()
+        if value is not None
+    ))
+
+
 class ExternalAPIService:
     """
     Service for interacting with external health information APIs
@@ -16,9 +62,11 @@ class ExternalAPIService:
         self, 
         base_url: str, 
         api_token: Optional[str] = None,
-        timeout: int = 30,
+        timeout: Optional[float] = None,
         retry_attempts: int = 3,
-        logger: Optional[logging.Logger] = None
+        logger: Optional[logging.Logger] = None,
+        client: Optional[ExternalAPIClient] = None,
+        retry_policy: Optional[RetryPolicy] = None
     ):
         """
         Initialize the external API service
@@ -26,23 +74,28 @@ class ExternalAPIService:
         Args:
             base_url: Base URL for the API
             api_token: Authentication token for the API
-            timeout: Request timeout in seconds
+            timeout: Read timeout in seconds (default EXTERNAL_API_TIMEOUT)
             retry_attempts: Number of retry attempts for failed requests
             logger: Logger instance for this service
+            client: Transport to use (default the shared pooled client)
+            retry_policy: Retry policy (default: retry_attempts attempts,
+                RETRY_BACKOFF jittered backoff, RETRY_DEADLINE budget)
         """
         self.base_url = base_url.rstrip('/')
         self.api_token = api_token
         self.timeout = timeout
         self.retry_attempts = retry_attempts
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=retry_attempts)
         self.logger = logger or logging.getLogger(__name__)
         
-        self.session = requests.Session()
+        self.client = client or shared_client()
+        self.rate_limiter = rate_limiter(self.base_url)
         
-        # Configure authentication if token is provided
+        # Sent with every request; the pooled session is shared by services
+        # with different tokens
+        self.headers = {}
         if self.api_token:
-            self.session.headers.update({
-                'Authorization': f'Bearer {self.api_token}'
-            })
+            self.headers['Authorization'] = f'Bearer {self.api_token}'
         
         self.logger.info(f"Initialized ExternalAPIService with base URL: {self.base_url}")
     
@@ -55,6 +108,12 @@ class ExternalAPIService:
         """
         Handle API requests with retry logic and error handling
         
+        Failed attempts are retried according to the retry policy: only
+        idempotent methods and transient errors, with jittered backoff,
+        within the policy's deadline. Each attempt's read timeout is cut to
+        what is left of the deadline. While the endpoint's circuit breaker
+        is open, CircuitOpenError is raised without calling the upstream.
+        
         Args:
             method: HTTP method (get, post, put, delete)
             endpoint: API endpoint to call
@@ -64,53 +123,134 @@ class ExternalAPIService:
             Dict[str, Any]: Response data from the API
             
         Raises:
-            Exception: If the request fails after all retry attempts
+            RequestException: If the request fails and is not retried
         """
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        attempts = 0
-        last_error = None
+        budget = self.retry_policy.start()
+        breaker = circuit_breaker(_breaker_name(self.base_url, endpoint))
         
-        while attempts < self.retry_attempts:
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {breaker.name}", retry_after=breaker.retry_after())
+            
+            # Wait for our turn rather than be throttled by the upstream. If
+            # the call is never made, a half-open probe slot is given back
+            if not self.rate_limiter.acquire(timeout=min(config.RATE_LIMIT_WAIT, budget.remaining())):
+                breaker.cancel_probe()
+                raise APIRateLimitExceeded(f"Outbound rate limit reached for {self.base_url}")
+            
             try:
                 self.logger.debug(f"Making {method.upper()} request to {url}")
-                response = getattr(self.session, method)(
+                read_timeout = min(self.timeout or self.client.read_timeout, budget.remaining())
+                response = self.client.request(
+                    method,
                     url, 
-                    timeout=self.timeout,
+                    headers=self.headers,
+                    timeout=(self.client.connect_timeout, read_timeout),
                     **kwargs
                 )
-                
-                response.raise_for_status()
+                self.rate_limiter.succeeded()
+                breaker.record_success()
                 return response.json()
                 
-            except Timeout as e:
-                attempts += 1
-                last_error = e
-                self.logger.warning(f"Request timeout ({attempts}/{self.retry_attempts}): {url}")
-                
             except RequestException as e:
-                attempts += 1
-                last_error = e
-                self.logger.warning(f"Request failed ({attempts}/{self.retry_attempts}): {url} - {str(e)}")
+                breaker.record_failure(e)
+                if isinstance(e, APIRateLimitExceeded):
+                    self.rate_limiter.penalize(e.retry_after)
+                delay = budget.next_delay(method, e)
+                if delay is None:
+                    self.logger.error(f"Request failed after {budget.attempts} attempt(s): {url} - {str(e)}")
+                    raise
+                kind = 'timeout' if isinstance(e, Timeout) else 'failed'
+                self.logger.warning(f"Request {kind} ({budget.attempts}/{self.retry_policy.max_attempts}), retrying in {delay:.2f}s: {url} - {str(e)}")
+                time.sleep(delay)
+            
+            except BaseException:
+                breaker.cancel_probe()
+                raise
+    
+    def _cache_key(self, endpoint: str, params: Optional[Dict[str, Any]]) -> tuple:
+        # Responses may depend on the caller's token, so it is part of the key
+        return (self.base_url, self.api_token, _normalize_endpoint(endpoint), _normalize_params(params))
+    
+    def _cache_timeout(self, endpoint: str) -> int:
+        if not config.CACHE_ENABLED:
+            return 0
+        return config.CACHE_TIMEOUTS.get(_normalize_endpoint(endpoint), config.CACHE_TIMEOUT)
+    
+    def invalidate_cache(self, endpoint: str) -> int:
+        """
+        Drop cached responses made stale by a write to `endpoint`: the
+        endpoint's parent resource and everything below it (a write to
+        patients/1/data invalidates patients/1 and patients/1/records),
+        plus the endpoints listed for it in CACHE_INVALIDATES. Returns the
+        number of entries dropped.
+        """
+        endpoint = _normalize_endpoint(endpoint)
+        resource = endpoint.rpartition('/')[0] or endpoint
+        related = set(config.CACHE_INVALIDATES.get(endpoint, ()))
+        
+        def stale(key):
+            cached = key[2]
+            return key[0] == self.base_url and (
+                cached == resource or cached.startswith(resource + '/') or cached in related
+            )
         
-        # Log the final error after all retries
-        self.logger.error(f"Request failed after {self.retry_attempts} attempts: {url} - {str(last_error)}")
-        raise last_error or RequestException(f"Failed to connect to {url} after {self.retry_attempts} attempts")
+        return response_cache().delete_matching(stale)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics of the shared response cache"""
+        return response_cache().stats()
     
     def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Get data from the API"""
-        return self._handle_request('get', endpoint, params=params)
+        """
+        Get data from the API
+        
+        Responses are cached for CACHE_TIMEOUT seconds, or the endpoint's
+        entry in CACHE_TIMEOUTS; callers get their own copy. While the
+        endpoint's circuit is open, an expired cached response is served
+        if there is one.
+        """
+        timeout = self._cache_timeout(endpoint)
+        if not timeout:
+            return self._handle_request('get', endpoint, params=params)
+        
+        cache = response_cache()
+        key = self._cache_key(endpoint, params)
+        data = cache.get(key)
+        if data is None:
+            try:
+                data = self._handle_request('get', endpoint, params=params)
+            except CircuitOpenError:
+                data = cache.get_stale(key)
+                if data is None:
+                    raise
+                self.logger.info(f"Serving stale {endpoint} response while its circuit is open")
+                return copy.deepcopy(data)
+            cache.set(key, data, timeout)
+        return copy.deepcopy(data)
     
     def post(self, endpoint: str, data: Optional[Dict[str, Any]] = None, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Post data to the API"""
-        return self._handle_request('post', endpoint, data=data, json=json)
+        try:
+            return self._handle_request('post', endpoint, data=data, json=json)
+        finally:
+            # Even a failed write may have been applied upstream
+            self.invalidate_cache(endpoint)
     
     def put(self, endpoint: str, data: Optional[Dict[str, Any]] = None, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Update data via the API"""
-        return self._handle_request('put', endpoint, data=data, json=json)
+        try:
+            return self._handle_request('put', endpoint, data=data, json=json)
+        finally:
+            self.invalidate_cache(endpoint)
     
     def delete(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Delete data via the API"""
-        return self._handle_request('delete', endpoint, params=params)
+        try:
+            return self._handle_request('delete', endpoint, params=params)
+        finally:
+            self.invalidate_cache(endpoint)
         
     def get_health_records(self, patient_id: Union[str, int]) -> Dict[str, Any]:
         """
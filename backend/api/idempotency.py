@@ -0,0 +1,194 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Set by the renderer on every response, so not stored with the record
+UNSTORED_HEADERS = {'content-type', 'content-length'}
+
+
+def _hash(*parts):
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _request_hash(request):
+    try:
+        body = request.body
+    except Exception:
+        # The stream was already consumed; fall back to the parsed data
+        body = json.dumps(request.data, cls=JSONEncoder, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600))
+
+
+def _lock_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+def _caller(request):
+    """
+    Who the key belongs to: the user, or for anonymous calls the session
+    (or failing that the client address), so one anonymous caller cannot
+    replay another's response by reusing their key.
+    """
+    if request.user and request.user.is_authenticated:
+        return str(request.user.pk)
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f'session:{session.session_key}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def _replay(record):
+    response = Response(record.response_data, status=record.status_code)
+    for header, value in record.response_headers.items():
+        response[header] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _error(detail, status_code, retry_after=None):
+    response = Response({'detail': detail}, status=status_code)
+    if retry_after:
+        response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _claim(key_hash, request_hash):
+    """
+    Insert the in-flight record for a key, or return the record that is
+    already there. Returns (record, claimed).
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                key_hash=key_hash,
+                request_hash=request_hash,
+                expires_at=now + _lock_timeout(),
+            )
+        return record, True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyRecord.objects.filter(key_hash=key_hash).first()
+    if record is None:
+        # Expired and purged between our insert and read; try once more
+        return _claim(key_hash, request_hash)
+    if record.expires_at <= now:
+        # A finished record past its TTL, or an in-flight one whose worker
+        # died: take it over if nobody else did first
+        taken = IdempotencyRecord.objects.filter(pk=record.pk, expires_at=record.expires_at).update(
+            request_hash=request_hash,
+            status_code=None,
+            response_data=None,
+            response_headers={},
+            expires_at=now + _lock_timeout(),
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def _wait_for_completion(record):
+    """Poll an in-flight record for up to IDEMPOTENCY_WAIT seconds"""
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT', 5)
+    while not record.is_complete and time.monotonic() < deadline:
+        time.sleep(0.1)
+        try:
+            record.refresh_from_db()
+        except IdempotencyRecord.DoesNotExist:
+            return None
+    return record
+
+
+def idempotent(handler):
+    """
+    Make a DRF POST handler (function view or viewset method) honour the
+    Idempotency-Key request header.
+
+    The first request with a key runs normally and its response is stored
+    for IDEMPOTENCY_TTL seconds, keyed by caller, path and key. Retries get
+    the stored response, headers included, without running the handler
+    again. A duplicate that
+    arrives while the first is still running waits up to IDEMPOTENCY_WAIT
+    seconds for it, then gets 409 with Retry-After. Reusing a key with a
+    different body is rejected with 422. Server errors are not stored, so
+    the client may retry them. Requests without the header are unaffected.
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        request = args[0] if isinstance(args[0], Request) else args[1]
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.',
+                          status.HTTP_400_BAD_REQUEST)
+
+        key_hash = _hash(_caller(request), request.path, key)
+        request_hash = _request_hash(request)
+
+        record, claimed = _claim(key_hash, request_hash)
+        if not claimed:
+            if record.request_hash != request_hash:
+                return _error(f'{IDEMPOTENCY_HEADER} was already used for a different request.',
+                              status.HTTP_422_UNPROCESSABLE_ENTITY)
+            record = _wait_for_completion(record)
+            if record is None or not record.is_complete:
+                return _error('A request with this Idempotency-Key is still in progress.',
+                              status.HTTP_409_CONFLICT, retry_after=1)
+            return _replay(record)
+
+        try:
+            response = handler(*args, **kwargs)
+        except Exception:
+            IdempotencyRecord.objects.filter(pk=record.pk).delete()
+            raise
+
+        if response.status_code >= 500:
+            IdempotencyRecord.objects.filter(pk=record.pk).delete()
+        else:
+            IdempotencyRecord.objects.filter(pk=record.pk).update(
+                status_code=response.status_code,
+                response_data=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+                response_headers={
+                    header: value for header, value in response.items()
+                    if header.lower() not in UNSTORED_HEADERS
+                },
+                expires_at=timezone.now() + _ttl(),
+            )
+        return response
+
+    return wrapper
+
+
+def expire_idempotency_records(batch_size=1000):
+    """Delete expired records in primary-key batches; returns the count"""
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyRecord.objects.filter(expires_at__lt=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,101 @@
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clients.archive import archive_enrollments
+from clients.models import Enrollment
+from health_programs.models import HealthProgram
+from .change_feed import compact_change_events
+from .idempotency import expire_idempotency_records
+from .models import JobCheckpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE = timedelta(minutes=30)
+
+
+def deactivate_ended_enrollments(checkpoint, today=None, batch_size=1000, full=False):
+    """
+    Deactivate enrollments in programs whose end date has passed.
+
+    Programs are found through the end_date index. The checkpoint records
+    the last end date fully processed and when the previous run started, so
+    each run only visits programs that ended since then, plus any program
+    edited since the last run (e.g. an end date moved into the past).
+    `full=True` ignores the checkpoint and rescans every ended program.
+    Enrollments are deactivated in batches of `batch_size` rows.
+
+    Returns a tuple of (programs_checked, enrollments_deactivated).
+    """
+    today = today or timezone.localdate()
+    started_at = timezone.now()
+    position = {} if full else checkpoint.position
+
+    programs = HealthProgram.objects.filter(end_date__lt=today)
+    if position.get('through') and position.get('since'):
+        programs = programs.filter(
+            Q(end_date__gt=date.fromisoformat(position['through'])) |
+            Q(updated_at__gte=parse_datetime(position['since']))
+        )
+
+    checked = deactivated = 0
+    for program_id, end_date in programs.order_by('end_date', 'id').values_list('id', 'end_date'):
+        count = Enrollment.objects.filter(program_id=program_id).deactivate_in_batches(batch_size=batch_size)
+        if count:
+            logger.info("Deactivated %d enrollments in ended program %s (ended %s)", count, program_id, end_date)
+        checked += 1
+        deactivated += count
+
+    checkpoint.save_position({
+        'through': (today - timedelta(days=1)).isoformat(),
+        'since': started_at.isoformat(),
+    })
+    return checked, deactivated
+
+
+def compact_change_feed(checkpoint):
+    return compact_change_events(
+        compact_after=timedelta(seconds=getattr(settings, 'CHANGE_FEED_COMPACT_AFTER', 24 * 3600)),
+        tombstone_retention=timedelta(seconds=getattr(settings, 'CHANGE_FEED_TOMBSTONE_RETENTION', 7 * 24 * 3600)),
+    )
+
+
+def expire_idempotency_keys(checkpoint):
+    return expire_idempotency_records()
+
+
+def archive_inactive_enrollments(checkpoint):
+    days = getattr(settings, 'ENROLLMENT_ARCHIVE_AFTER_DAYS', 365)
+    return archive_enrollments(timezone.now() - timedelta(days=days))
+
+
+# Jobs the scheduler and run_job() know about, by name
+JOBS = {
+    'deactivate_ended_enrollments': deactivate_ended_enrollments,
+    'compact_change_feed': compact_change_feed,
+    'expire_idempotency_keys': expire_idempotency_keys,
+    'archive_enrollments': archive_inactive_enrollments,
+}
+
+
+def run_job(name, lease=DEFAULT_LEASE, **kwargs):
+    """
+    Run a registered job under its checkpoint lease.
+
+    Returns (True, result) when the job ran, or (False, None) when another
+    run holds the lease.
+    """
+    checkpoint = JobCheckpoint.objects.acquire(name, lease)
+    if checkpoint is None:
+        logger.info("Job %s is already running, skipping", name)
+        return False, None
+    try:
+        result = JOBS[name](checkpoint, **kwargs)
+        JobCheckpoint.objects.filter(name=name).update(last_run_at=timezone.now())
+        return True, result
+    finally:
+        JobCheckpoint.objects.release(checkpoint)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api import password_hashing
+
+
+class Command(BaseCommand):
+    help = 'Measures password hashing throughput inline and on the hashing process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=32, help='Number of passwords to hash')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4],
+            help='Pool sizes to measure',
+        )
+        parser.add_argument('--chunk-size', type=int, default=8, help='Passwords per pool task')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        passwords = [f'benchmark-password-{n}' for n in range(count)]
+
+        started = time.perf_counter()
+        password_hashing._hash_many(passwords)
+        self._report('inline', count, time.perf_counter() - started)
+
+        for workers in options['workers']:
+            with override_settings(PASSWORD_HASHING_WORKERS=workers):
+                password_hashing.shutdown_pool()
+                # Start the workers outside the timed section
+                password_hashing.hash_passwords(passwords[:workers], chunk_size=1)
+                started = time.perf_counter()
+                password_hashing.hash_passwords(passwords, chunk_size=options['chunk_size'])
+                self._report(f'pool x{workers}', count, time.perf_counter() - started)
+                password_hashing.shutdown_pool()
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(f'{label:>10}: {count} hashes in {elapsed:.2f}s ({count / elapsed:.1f} hashes/s)')
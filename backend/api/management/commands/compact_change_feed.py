@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.change_feed import compact_change_events
+
+
+class Command(BaseCommand):
+    help = 'Compacts the change feed: drops superseded events and expired tombstones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compact-after',
+            type=int,
+            default=getattr(settings, 'CHANGE_FEED_COMPACT_AFTER', 24 * 3600),
+            help='Age in seconds after which superseded events are removed',
+        )
+        parser.add_argument(
+            '--tombstone-retention',
+            type=int,
+            default=getattr(settings, 'CHANGE_FEED_TOMBSTONE_RETENTION', 7 * 24 * 3600),
+            help='Age in seconds after which delete events are removed',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of events deleted per statement',
+        )
+
+    def handle(self, *args, **options):
+        superseded, tombstones = compact_change_events(
+            compact_after=timedelta(seconds=options['compact_after']),
+            tombstone_retention=timedelta(seconds=options['tombstone_retention']),
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {superseded} superseded events and {tombstones} expired tombstones.'
+        ))
@@ -1,8 +1,11 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from rest_framework.authtoken.models import Token
 import sys
 
+from api.authentication import shared_token_cache
+
 User = get_user_model()
 
 class Command(BaseCommand):
@@ -37,6 +40,11 @@ class Command(BaseCommand):
                 
             token.delete()
             self.stdout.write(self.style.SUCCESS(f'Existing token for "{username}" deleted.'))
+            if shared_token_cache() is None:
+                self.stdout.write(self.style.WARNING(
+                    'TOKEN_AUTH_SHARED_CACHE is not set: running servers may accept the old token '
+                    f'for up to {getattr(settings, "TOKEN_AUTH_CACHE_TTL", 60)} seconds.'
+                ))
         except Token.DoesNotExist:
             pass
         
@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.jobs import run_job
+
+
+class Command(BaseCommand):
+    help = 'Deactivates enrollments in health programs whose end date has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of enrollments updated per transaction',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Ignore the checkpoint and rescan every ended program',
+        )
+        parser.add_argument(
+            '--date',
+            help='Treat this date (YYYY-MM-DD) as today',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('Use the format YYYY-MM-DD for --date.')
+
+        ran, result = run_job(
+            'deactivate_ended_enrollments',
+            today=today,
+            batch_size=options['batch_size'],
+            full=options['full'],
+        )
+        if not ran:
+            self.stdout.write(self.style.WARNING('Another run is in progress; nothing done.'))
+            return
+
+        programs, deactivated = result
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {programs} ended programs and deactivated {deactivated} enrollments.'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.idempotency import expire_idempotency_records
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired Idempotency-Key records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of records deleted per statement',
+        )
+
+    def handle(self, *args, **options):
+        deleted = expire_idempotency_records(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} expired idempotency records.'))
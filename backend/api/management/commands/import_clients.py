@@ -0,0 +1,73 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk_import import CSV, NDJSON, ClientImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports clients from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='CSV (with header row) or NDJSON file to import')
+        parser.add_argument(
+            '--format',
+            choices=[CSV, NDJSON],
+            help='Input format; detected from the file extension by default',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows validated together (one uniqueness query per batch)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows per INSERT statement',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate only, do not write anything',
+        )
+        parser.add_argument(
+            '--report',
+            type=str,
+            help='Write the per-row error report to this JSON file',
+        )
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or detect_format(filename=options['path'])
+        if input_format is None:
+            raise CommandError('Cannot detect the file format; use --format csv or --format ndjson')
+
+        importer = ClientImporter(
+            batch_size=options['batch_size'],
+            insert_chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+        )
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = importer.run(read_rows(stream, input_format))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+        elapsed = time.monotonic() - started
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report.as_dict(), f, indent=2)
+
+        rate = report.total / elapsed if elapsed else 0
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report.created} of {report.total} rows in {elapsed:.2f}s ({rate:,.0f} rows/s).'
+        ))
+        if report.failed:
+            self.stdout.write(self.style.WARNING(f'{report.failed} rows failed validation.'))
+            for error in report.errors[:10]:
+                self.stdout.write(f"  row {error['row']}: {error['errors']}")
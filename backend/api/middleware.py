@@ -0,0 +1,268 @@
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .admission import get_controller
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/(json|javascript|xml|.*\+json|.*\+xml)|image/svg\+xml)'
+)
+
+
+def _accepted_encodings(request):
+    """Parse Accept-Encoding into {coding: q}"""
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(request):
+    """Pick the best supported content coding the client accepts, or None"""
+    accepted = _accepted_encodings(request)
+    wildcard = accepted.get('*', 0)
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0
+    for coding in supported:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+    return gzip.compress(data, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+            self._compress = self._compressor.process
+            self._flush = self._compressor.flush
+            self._finish = self._compressor.finish
+        else:
+            level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def chunk(self, data):
+        # Flushing per chunk keeps streamed rows moving to the client
+        return self._compress(data) + self._flush()
+
+    def finish(self):
+        return self._finish()
+
+
+def compress_stream(iterator, encoding):
+    compressor = _StreamCompressor(encoding)
+    for data in iterator:
+        output = compressor.chunk(data)
+        if output:
+            yield output
+    yield compressor.finish()
+
+
+async def compress_async_stream(iterator, encoding):
+    compressor = _StreamCompressor(encoding)
+    async for data in iterator:
+        output = compressor.chunk(data)
+        if output:
+            yield output
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Negotiate gzip or brotli compression of responses.
+    
+    - Responses smaller than COMPRESSION_MIN_SIZE bytes, non-text content and
+      responses that already carry a Content-Encoding are left alone.
+    - Streaming responses are compressed chunk by chunk.
+    - Responses served from the response cache (see api.conditional) carry a
+      `compression_cache_key`; their compressed variants are cached next to
+      them, so a hot payload is compressed once rather than per request.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+        content_type = response.get('Content-Type', '')
+        if not COMPRESSIBLE_TYPES.match(content_type):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_async_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            compressed = self._compress_content(response, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The compressed bytes differ from the identity representation
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def _compress_content(self, response, encoding):
+        cache_key = getattr(response, 'compression_cache_key', None)
+        if not cache_key:
+            return compress(response.content, encoding)
+
+        cache = caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+        variant_key = f'{cache_key}:{encoding}'
+        compressed = cache.get(variant_key)
+        if compressed is None:
+            compressed = compress(response.content, encoding)
+            cache.set(variant_key, compressed, getattr(response, 'compression_cache_timeout', None))
+        return compressed
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Add X-RateLimit-Limit/Remaining/Reset headers to responses of views
+    throttled by api.throttling.ExternalAPIRateThrottle. The throttle
+    records the tightest of the caller's limits on the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(remaining)
+            response['X-RateLimit-Reset'] = str(reset)
+        return response
+
+
+class _ReleasingContent:
+    """
+    Streaming body that gives back an admission slot once it is exhausted,
+    fails or is closed. Django closes the content when the response is
+    closed, so the slot is returned even if the body is never read.
+    """
+
+    def __init__(self, content, release):
+        self._content = content
+        self._release = release
+        self._released = False
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._release()
+
+
+class _ReleasingIterator(_ReleasingContent):
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._content)
+        except BaseException:
+            # StopIteration included: the body is done
+            self.close()
+            raise
+
+
+class _ReleasingAsyncIterator(_ReleasingContent):
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._content.__anext__()
+        except BaseException:
+            self.close()
+            raise
+
+
+class AdmissionControlMiddleware:
+    """
+    Load shedding by request class (see api.admission).
+
+    Requests are classified by path as interactive (the web UI), external
+    or bulk, each with its own concurrency budget in ADMISSION_CLASSES, so
+    bulk jobs and integrators cannot occupy every worker thread. A request
+    whose class is over budget waits briefly in that class's queue, then
+    is answered with 503 and Retry-After. Budgets are per process, so
+    they need threaded workers (see gunicorn.conf.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'ADMISSION_CONTROL_ENABLED', True):
+            return self.get_response(request)
+
+        request_class = get_controller().classify(request.path_info)
+        if not request_class.acquire():
+            response = JsonResponse(
+                {"error": "The server is busy. Please retry later."},
+                status=503,
+            )
+            response['Retry-After'] = str(request_class.retry_after)
+            return response
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            request_class.release()
+            raise
+        if response.streaming:
+            # Hold the slot until the body has been sent
+            wrapper = _ReleasingAsyncIterator if response.is_async else _ReleasingIterator
+            response.streaming_content = wrapper(response.streaming_content, request_class.release)
+        else:
+            request_class.release()
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.CharField(max_length=64)),
+                ('operation', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=6)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Change Event',
+                'verbose_name_plural': 'Change Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['model', 'object_id', 'id'], name='change_event_key_idx'), models.Index(fields=['created_at'], name='change_event_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='response_headers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_idempotency_response_headers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changeevent',
+            name='operation',
+            field=models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted'), ('archive', 'Moved to the archive')], max_length=7),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_change_event_archive_operation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Cache Generation',
+                'verbose_name_plural': 'Cache Generations',
+            },
+        ),
+    ]
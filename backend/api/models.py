@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+# Operation recorded for deletes of tracked rows; see deletes_recorded_as()
+_delete_operation = ContextVar('change_event_delete_operation', default='delete')
+
+
+class ChangeEventManager(models.Manager):
+
+    def record(self, instance, operation, using=None):
+        """Write one change event for a model instance"""
+        return self.db_manager(using).create(**self._event_fields(instance, operation))
+
+    def record_many(self, instances, operation, using=None):
+        """
+        Write change events for many instances in one INSERT. Bulk paths that
+        bypass save() and model signals must call this themselves.
+        """
+        events = [self.model(**self._event_fields(instance, operation)) for instance in instances]
+        return self.db_manager(using).bulk_create(events)
+
+    def _event_fields(self, instance, operation):
+        return {
+            'model': instance._meta.label_lower,
+            'object_id': str(instance.pk),
+            'operation': operation,
+            'payload': instance.get_change_payload() or None,
+        }
+
+
+class ChangeEvent(models.Model):
+    """
+    Transactional outbox: one row per create, update or delete of a tracked
+    model, written in the same transaction as the change itself. The
+    auto-increment id is the feed's sequence number.
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ARCHIVE = 'archive'
+    OPERATION_CHOICES = [
+        (UPSERT, 'Created or updated'),
+        (DELETE, 'Deleted'),
+        (ARCHIVE, 'Moved to the archive'),
+    ]
+    
+    model = models.CharField(max_length=50)
+    object_id = models.CharField(max_length=64)
+    operation = models.CharField(max_length=7, choices=OPERATION_CHOICES)
+    payload = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ChangeEventManager()
+    
+    class Meta:
+        verbose_name = _("Change Event")
+        verbose_name_plural = _("Change Events")
+        ordering = ['id']
+        indexes = [
+            # Finding superseded events during compaction
+            models.Index(fields=['model', 'object_id', 'id'], name='change_event_key_idx'),
+            models.Index(fields=['created_at'], name='change_event_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.pk} {self.operation} {self.model}:{self.object_id}"
+
+
+@contextmanager
+def deletes_recorded_as(operation):
+    """
+    Record deletes of tracked rows made inside the block as `operation`
+    instead of as tombstones, e.g. ChangeEvent.ARCHIVE for rows that move
+    to the archive table rather than disappear.
+    """
+    token = _delete_operation.set(operation)
+    try:
+        yield
+    finally:
+        _delete_operation.reset(token)
+
+
+def delete_operation():
+    return _delete_operation.get()
+
+
+class ChangeTrackedModel(models.Model):
+    """
+    Abstract base for models published on the change feed.
+    
+    save() runs inside a transaction together with the change event insert,
+    so a change and its event are committed or rolled back together. Deletes,
+    including cascades, are recorded by the post_delete receiver in
+    api.signals, which Django runs inside the deletion transaction.
+    """
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using')
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            ChangeEvent.objects.record(self, ChangeEvent.UPSERT, using=using)
+    
+    save.alters_data = True
+    
+    def get_change_payload(self):
+        """Extra fields carried on change events, e.g. natural keys"""
+        return {}
+
+
+class JobCheckpointManager(models.Manager):
+
+    def acquire(self, name, lease):
+        """
+        Take the run lease for a job, so overlapping runs (cron, the
+        in-process scheduler, other workers) skip instead of racing.
+        Returns the checkpoint if the lease was taken, otherwise None.
+        """
+        now = timezone.now()
+        self.get_or_create(name=name)
+        taken = self.filter(name=name).filter(
+            models.Q(locked_until__isnull=True) | models.Q(locked_until__lt=now)
+        ).update(locked_until=now + lease)
+        # Our locked_until doubles as the lease token for release()
+        return self.filter(name=name, locked_until=now + lease).first() if taken else None
+
+    def release(self, checkpoint):
+        """
+        Give up the lease taken by acquire(), unless it expired and another
+        run has taken it since
+        """
+        self.filter(name=checkpoint.name, locked_until=checkpoint.locked_until).update(locked_until=None)
+
+
+class JobCheckpoint(models.Model):
+    """
+    Progress marker and run lease for a periodic job. `position` is whatever
+    the job needs to resume incrementally.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    position = models.JSONField(default=dict, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = JobCheckpointManager()
+    
+    class Meta:
+        verbose_name = _("Job Checkpoint")
+        verbose_name_plural = _("Job Checkpoints")
+    
+    def __str__(self):
+        return self.name
+    
+    def save_position(self, position):
+        self.position = position
+        self.save(update_fields=['position', 'updated_at'])
+
+
+class IdempotencyRecord(models.Model):
+    """
+    First response to a POST carrying an Idempotency-Key, replayed for
+    retries. The row is inserted before the request executes and its unique
+    key doubles as the lock for concurrent duplicates; `status_code` stays
+    null while that first request is in flight.
+    """
+    # sha256 of (caller, path, Idempotency-Key)
+    key_hash = models.CharField(max_length=64, unique=True)
+    # sha256 of the request body, to reject a key reused for another request
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True)
+    # Headers the handler set, e.g. Location
+    response_headers = models.JSONField(default=dict, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        verbose_name = _("Idempotency Record")
+        verbose_name_plural = _("Idempotency Records")
+    
+    def __str__(self):
+        return f"{self.key_hash[:12]} ({self.status_code or 'in flight'})"
+    
+    @property
+    def is_complete(self):
+        return self.status_code is not None
+
+
+class CacheGenerationManager(models.Manager):
+
+    def current(self, name):
+        return self.filter(name=name).values_list('value', flat=True).first() or 0
+
+    def bump(self, name):
+        """Move to the next generation, orphaning entries cached under the last"""
+        if not self.filter(name=name).update(value=models.F('value') + 1):
+            _, created = self.get_or_create(name=name, defaults={'value': 1})
+            if not created:  # Created concurrently since the update
+                self.filter(name=name).update(value=models.F('value') + 1)
+
+
+class CacheGeneration(models.Model):
+    """
+    Counter that every process reads to learn that its cached entries of
+    one kind are stale, for deployments without a shared cache to keep it in.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+    
+    objects = CacheGenerationManager()
+    
+    class Meta:
+        verbose_name = _("Cache Generation")
+        verbose_name_plural = _("Cache Generations")
+    
+    def __str__(self):
+        return f"{self.name} ({self.value})"
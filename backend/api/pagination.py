@@ -0,0 +1,282 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Return the row count the database keeps in its table statistics.
+
+    This is a metadata lookup rather than a table scan, so it is cheap but
+    only approximate. Returns None on backends that do not expose it.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def is_unfiltered(queryset):
+    """Check whether a queryset covers the whole table (no WHERE clause)"""
+    return not queryset.query.where
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    """
+    Django paginator that uses table statistics for the total count of
+    large, unfiltered querysets instead of running SELECT COUNT(*).
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and is_unfiltered(queryset):
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate >= self.exact_count_threshold:
+                return estimate
+        return super().count
+
+
+class ApproximateCountPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination kept for the React UI, with an estimated count
+    for large tables.
+    """
+    django_paginator_class = ApproximateCountPaginator
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Count-free keyset (seek) pagination.
+
+    Rows are ordered by a unique composite key, e.g. ('-created_at', '-client_id'),
+    and each page continues from the key of the last row of the previous page
+    with a WHERE clause instead of an OFFSET, so deep pages cost the same as
+    the first one. Views set `keyset_ordering` to choose the key; the last
+    field must be unique.
+
+    A total count is only computed when requested with `?count=estimate`
+    (table statistics, falling back to an exact count for filtered querysets)
+    or `?count=exact`.
+
+    Requests carrying a `page` parameter are handed over to page-number
+    pagination, which the React UI relies on.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-pk',)
+    page_number_class = ApproximateCountPageNumberPagination
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+        queryset = queryset.order_by(*self.ordering)
+
+        self.page_number_paginator = None
+        if self.page_number_class and self.page_number_class.page_query_param in request.query_params:
+            self.page_number_paginator = self.page_number_class()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+
+        self.count = self.get_count(queryset, request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(queryset.model, position))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        self.count_is_estimate = False
+        if mode == 'estimate' and is_unfiltered(queryset):
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None:
+                self.count_is_estimate = True
+                return estimate
+        if mode in ('estimate', 'exact'):
+            return queryset.count()
+        return None
+
+    def _fields(self, model):
+        fields = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            fields.append((field, descending))
+        return fields
+
+    def get_seek_filter(self, model, position):
+        """
+        Build `(a, b) > (va, vb)` as `a > va OR (a = va AND b > vb)`, with
+        the comparison flipped for descending fields.
+        """
+        fields = self._fields(model)
+        if len(position) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+
+        try:
+            values = [field.to_python(value) for (field, _), value in zip(fields, position)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        seek = Q()
+        for index, (field, descending) in enumerate(fields):
+            term = Q(**{
+                f'{f.attname}__exact': v for (f, _), v in zip(fields[:index], values[:index])
+            })
+            lookup = 'lt' if descending else 'gt'
+            term &= Q(**{f'{field.attname}__{lookup}': values[index]})
+            seek |= term
+        return seek
+
+    def get_position(self, obj):
+        return [field.value_to_string(obj) for field, _ in self._fields(type(obj))]
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = self.encode_cursor(self.get_position(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+        ])
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_is_estimate'] = self.count_is_estimate
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'count': {'type': 'integer', 'description': 'Only present with ?count=estimate|exact'},
+                'count_is_estimate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'Continuation cursor returned in `next`', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': 'Number of results per page', 'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': "Include a total count: 'estimate' or 'exact'", 'schema': {'type': 'string'}},
+        ]
+
+
+class SyncFeedPagination(KeysetPagination):
+    """
+    Keyset pagination for the external sync feed.
+
+    Clients are returned in ascending (updated_at, client_id) order and the
+    response always carries an opaque `next_token`. Passing it back as
+    `?since_token=` resumes exactly after the last row seen, so rows are
+    neither skipped nor repeated when records change while a consumer pages.
+    """
+    ordering = ('updated_at', 'client_id')
+    cursor_query_param = 'since_token'
+    page_number_class = None
+    invalid_cursor_message = 'Invalid since_token'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'EXTERNAL_SYNC_PAGE_SIZE', 500)
+        self.max_page_size = getattr(settings, 'EXTERNAL_SYNC_MAX_PAGE_SIZE', 5000)
+
+    def get_ordering(self, view):
+        return self.ordering
+
+    def get_count(self, queryset, request):
+        return None
+
+    def get_next_token(self):
+        if self.page:
+            return self.encode_cursor(self.get_position(self.page[-1]))
+        return self.request.query_params.get(self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next_token', self.get_next_token()),
+            ('has_more', self.has_next),
+            ('results', data),
+        ]))
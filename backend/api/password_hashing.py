@@ -0,0 +1,135 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool has no free slot within the wait time"""
+
+
+def _init_worker():
+    # Workers started with spawn/forkserver need Django configured before
+    # make_password can read PASSWORD_HASHERS
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password)
+
+
+def _hash_many(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def get_pool():
+    """
+    Return the process-wide hashing pool, creating it on first use, or None
+    when PASSWORD_HASHING_WORKERS is 0 and hashing runs inline. Each web
+    worker process has its own pool, so the setting is sized per worker.
+    """
+    global _pool, _slots
+    workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', 0)
+    if not workers:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            _slots = threading.BoundedSemaphore(
+                getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', workers * 4)
+            )
+        return _pool
+
+
+def shutdown_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = _slots = None
+
+
+def _submit(function, argument):
+    pool = get_pool()
+    if pool is None:
+        return function(argument)
+
+    # Bound the number of hashes queued or running, so a registration
+    # surge waits here (or is turned away) instead of piling up work
+    wait = getattr(settings, 'PASSWORD_HASHING_QUEUE_TIMEOUT', 5)
+    slots = _slots
+    if not slots.acquire(timeout=wait):
+        raise PasswordHashingBusy("Password hashing is at capacity, try again shortly.")
+    try:
+        return pool.submit(function, argument).result(
+            timeout=getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 30)
+        )
+    except BrokenProcessPool:
+        logger.warning("Password hashing pool broke; restarting it and hashing inline")
+        shutdown_pool()
+        return function(argument)
+    except FutureTimeoutError:
+        raise PasswordHashingBusy("Password hashing timed out, try again shortly.")
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """
+    Hash one password on the hashing pool and return the encoded hash.
+
+    Call this before opening a transaction: the hash costs hundreds of
+    milliseconds of CPU, which should neither block the request worker's
+    interpreter nor keep database locks held.
+    """
+    return _submit(_hash, password)
+
+
+def hash_passwords(passwords, chunk_size=8):
+    """
+    Hash many passwords in parallel across the pool's workers, preserving
+    order. Each pool task hashes `chunk_size` passwords to amortise the
+    inter-process round trip, and takes a slot like hash_password() does,
+    so bulk work waits its turn instead of flooding the pool.
+    """
+    passwords = list(passwords)
+    pool = get_pool()
+    if pool is None:
+        return _hash_many(passwords)
+    chunks = [passwords[start:start + chunk_size] for start in range(0, len(passwords), chunk_size)]
+    wait = getattr(settings, 'PASSWORD_HASHING_QUEUE_TIMEOUT', 5)
+    slots = _slots
+    futures = []
+    try:
+        for chunk in chunks:
+            if not slots.acquire(timeout=wait):
+                raise PasswordHashingBusy("Password hashing is at capacity, try again shortly.")
+            try:
+                future = pool.submit(_hash_many, chunk)
+            except BaseException:
+                slots.release()
+                raise
+            # The slot is freed when the chunk finishes, fails or is cancelled
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+        timeout = getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 30)
+        return [encoded for future in futures for encoded in future.result(timeout=timeout)]
+    except FutureTimeoutError:
+        raise PasswordHashingBusy("Password hashing timed out, try again shortly.")
+    except BrokenProcessPool:
+        logger.warning("Password hashing pool broke; restarting it and hashing inline")
+        shutdown_pool()
+        return _hash_many(passwords)
+    finally:
+        for future in futures:
+            future.cancel()
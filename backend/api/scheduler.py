@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class Scheduler:
+    """
+    Minimal in-process scheduler that runs registered jobs from api.jobs on
+    a fixed interval in a daemon thread.
+
+    Every run goes through run_job(), whose database lease keeps several
+    processes with the scheduler enabled from running the same job at once,
+    so it is safe to enable in more than one worker. For cron-style
+    scheduling use the management commands instead.
+    """
+
+    def __init__(self, intervals, poll_interval=30):
+        # {job name: seconds between runs}
+        self.intervals = dict(intervals)
+        self.poll_interval = poll_interval
+        self.next_run = {name: time.monotonic() for name in self.intervals}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='api-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_pending(self):
+        """Run every job whose interval has elapsed"""
+        from .jobs import run_job
+
+        for name, interval in self.intervals.items():
+            now = time.monotonic()
+            if now < self.next_run[name]:
+                continue
+            self.next_run[name] = now + interval
+            try:
+                ran, result = run_job(name)
+                if ran:
+                    logger.info("Scheduled job %s finished: %s", name, result)
+            except Exception:
+                logger.exception("Scheduled job %s failed", name)
+            finally:
+                close_old_connections()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.poll_interval)
+
+
+def start_scheduler():
+    """Start the process-wide scheduler from SCHEDULED_JOBS, once"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                getattr(settings, 'SCHEDULED_JOBS', {}),
+                poll_interval=getattr(settings, 'SCHEDULER_POLL_INTERVAL', 30),
+            )
+            _scheduler.start()
+        return _scheduler
+
+
+def start_scheduler_if_enabled():
+    """Called by the WSGI and ASGI entry points when SCHEDULER_ENABLED is set"""
+    if getattr(settings, 'SCHEDULER_ENABLED', False):
+        return start_scheduler()
+    return None
@@ -1,8 +1,16 @@
+from collections import Counter
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from health_programs.models import HealthProgram, ProgramCategory
-from clients.models import Client, Enrollment
-from django.db import transaction
+from clients.models import ArchivedEnrollment, Client, Enrollment, touch_clients
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from locations.lookup import is_valid_name, locations
+from .models import ChangeEvent
+from .bulk_enrollment import CLIENT_FILTER_FIELDS
+from .password_hashing import hash_password, hash_passwords
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -57,6 +65,22 @@ class ClientSerializer(serializers.ModelSerializer):
     
     def get_age(self, obj):
         return obj.get_age()
+    
+    def validate_county(self, value):
+        county = locations.county(value)
+        if county is None:
+            raise serializers.ValidationError("Unknown county.")
+        return county.name
+    
+    def validate_sub_county(self, value):
+        if value and not is_valid_name(value):
+            raise serializers.ValidationError("Enter a valid sub-county name.")
+        return value
+    
+    def validate_ward(self, value):
+        if value and not is_valid_name(value):
+            raise serializers.ValidationError("Enter a valid ward name.")
+        return value
 
 class ClientDetailSerializer(ClientSerializer):
     enrollments = serializers.SerializerMethodField()
@@ -66,7 +90,11 @@ class ClientDetailSerializer(ClientSerializer):
     
     def get_enrollments(self, obj):
         enrollments = Enrollment.objects.filter(client=obj)
-        return EnrollmentSerializer(enrollments, many=True).data
+        data = list(EnrollmentSerializer(enrollments, many=True).data)
+        if self.context.get('include_archived'):
+            archived = obj.archived_enrollments.select_related('client', 'program')
+            data += ArchivedEnrollmentSerializer(archived, many=True).data
+        return data
 
 class EnrollmentSerializer(serializers.ModelSerializer):
     program_name = serializers.ReadOnlyField(source='program.name')
@@ -85,6 +113,16 @@ class EnrollmentSerializer(serializers.ModelSerializer):
     def get_client_id_number(self, obj):
         return obj.client.id_number if obj.client else None
 
+class ArchivedEnrollmentSerializer(EnrollmentSerializer):
+    archived = serializers.SerializerMethodField()
+    
+    class Meta(EnrollmentSerializer.Meta):
+        model = ArchivedEnrollment
+        fields = EnrollmentSerializer.Meta.fields + ['archived', 'archived_at']
+    
+    def get_archived(self, obj):
+        return True
+
 class EnrollmentUpdateSerializer(serializers.ModelSerializer):
     """
     Serializer for updating enrollments, excluding client field which shouldn't change
@@ -102,29 +140,145 @@ class EnrollClientSerializer(serializers.Serializer):
     notes = serializers.CharField(required=False, allow_blank=True)
     
     def create(self, validated_data):
-        client = Client.objects.get(client_id=validated_data['client_id'])
-        program = HealthProgram.objects.get(id=validated_data['program_id'])
-        
-        enrollment, created = Enrollment.objects.get_or_create(
-            client=client,
-            program=program,
-            defaults={
-                'enrollment_date': validated_data.get('enrollment_date'),
-                'facility_name': validated_data.get('facility_name', ''),
-                'mfl_code': validated_data.get('mfl_code', ''),
-                'notes': validated_data.get('notes', '')
-            }
+        fields = {
+            name: validated_data[name]
+            for name in ('enrollment_date', 'facility_name', 'mfl_code', 'notes')
+            if name in validated_data
+        }
+        enrollment = Enrollment(
+            client_id=validated_data['client_id'],
+            program_id=validated_data['program_id'],
+            is_active=True,
+            **fields
         )
         
-        if not created:
-            enrollment.enrollment_date = validated_data.get('enrollment_date', enrollment.enrollment_date)
-            enrollment.facility_name = validated_data.get('facility_name', enrollment.facility_name)
-            enrollment.mfl_code = validated_data.get('mfl_code', enrollment.mfl_code)
-            enrollment.notes = validated_data.get('notes', enrollment.notes)
-            enrollment.is_active = True
-            enrollment.save()
-            
-        return enrollment 
+        # One INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT statement
+        # replaces get_or_create followed by save(), and cannot race on
+        # unique_together(client, program).
+        try:
+            with transaction.atomic():
+                Enrollment.objects.upsert([enrollment], update_fields=['is_active', 'updated_at', *fields])
+                enrollment = Enrollment.objects.select_related('client', 'program').filter(
+                    client_id=validated_data['client_id'],
+                    program_id=validated_data['program_id'],
+                ).first()
+                if enrollment is None:
+                    # Foreign keys checked at commit time (SQLite, PostgreSQL)
+                    raise IntegrityError("Enrollment references a missing client or program")
+                ChangeEvent.objects.record(enrollment, ChangeEvent.UPSERT)
+                touch_clients([enrollment.client_id])
+        except IntegrityError:
+            raise serializers.ValidationError({'detail': 'Client or health program not found.'})
+        
+        return enrollment
+
+class BulkEnrollSerializer(serializers.Serializer):
+    """
+    Enroll many clients in one program, selected either by `client_ids` or
+    by a `filter` on client fields (see CLIENT_FILTER_FIELDS).
+    """
+    program_id = serializers.IntegerField()
+    client_ids = serializers.ListField(child=serializers.UUIDField(), required=False, max_length=50000)
+    filter = serializers.DictField(child=serializers.CharField(), required=False)
+    enrollment_date = serializers.DateField(required=False)
+    facility_name = serializers.CharField(required=False, allow_blank=True)
+    mfl_code = serializers.CharField(required=False, allow_blank=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    
+    def validate_program_id(self, value):
+        try:
+            self.program = HealthProgram.objects.get(id=value)
+        except HealthProgram.DoesNotExist:
+            raise serializers.ValidationError("Health program not found.")
+        return value
+    
+    def validate_filter(self, value):
+        unknown = set(value) - set(CLIENT_FILTER_FIELDS)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unsupported filter fields: {', '.join(sorted(unknown))}. "
+                f"Allowed: {', '.join(CLIENT_FILTER_FIELDS)}."
+            )
+        if not value:
+            raise serializers.ValidationError("Filter cannot be empty.")
+        try:
+            Client.objects.filter(**value)
+        except (ValueError, DjangoValidationError):
+            raise serializers.ValidationError("Invalid filter value.")
+        return value
+    
+    def validate(self, attrs):
+        if ('client_ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Provide either client_ids or filter.")
+        return attrs
+    
+    def get_enrollment_fields(self):
+        return {
+            name: self.validated_data[name]
+            for name in ('enrollment_date', 'facility_name', 'mfl_code', 'notes')
+            if name in self.validated_data
+        }
+
+class SetActiveSerializer(serializers.Serializer):
+    is_active = serializers.BooleanField()
+
+class BulkDeactivateSerializer(serializers.Serializer):
+    """
+    Select enrollments to deactivate. At least one criterion is required.
+    """
+    program_id = serializers.IntegerField(required=False)
+    program_ended = serializers.BooleanField(required=False)
+    enrolled_before = serializers.DateField(required=False)
+    
+    def validate(self, attrs):
+        if not attrs.get('program_id') and not attrs.get('program_ended') and not attrs.get('enrolled_before'):
+            raise serializers.ValidationError(
+                "Provide at least one of program_id, program_ended or enrolled_before."
+            )
+        return attrs
+    
+    def get_queryset(self):
+        queryset = Enrollment.objects.all()
+        if self.validated_data.get('program_id'):
+            queryset = queryset.filter(program_id=self.validated_data['program_id'])
+        if self.validated_data.get('program_ended'):
+            queryset = queryset.filter(program__end_date__lt=timezone.localdate())
+        if self.validated_data.get('enrolled_before'):
+            queryset = queryset.filter(enrollment_date__lt=self.validated_data['enrolled_before'])
+        return queryset
+
+class BulkClientRegistrationSerializer(serializers.ListSerializer):
+    """
+    Batched registration for assisted sign-up drives: all passwords are
+    hashed in parallel on the hashing pool, then users and clients are
+    written with one bulk insert each in a single transaction.
+    """
+    
+    def validate(self, attrs):
+        errors = {}
+        for field, model, lookup in (('username', User, 'username'), ('national_id', Client, 'id_number')):
+            values = [row[field] for row in attrs]
+            duplicates = {value for value, count in Counter(values).items() if count > 1}
+            duplicates.update(model.objects.filter(**{f'{lookup}__in': values}).values_list(lookup, flat=True))
+            if duplicates:
+                errors[field] = [f"Already registered or repeated in this batch: {', '.join(sorted(duplicates))}"]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+    
+    def create(self, validated_data):
+        passwords = hash_passwords([row['password'] for row in validated_data])
+        
+        users = [self.child.build_user(row, password) for row, password in zip(validated_data, passwords)]
+        clients = [self.child.build_client(row) for row in validated_data]
+        for client in clients:
+            client.assign_locations()
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            Client.objects.bulk_create(clients)
+            ChangeEvent.objects.record_many(clients, ChangeEvent.UPSERT)
+        
+        return clients
 
 class ClientRegistrationSerializer(serializers.Serializer):
     # User account fields
@@ -145,38 +299,51 @@ class ClientRegistrationSerializer(serializers.Serializer):
     emergency_contact_name = serializers.CharField(required=False, allow_blank=True)
     emergency_contact_phone = serializers.CharField(required=False, allow_blank=True)
     
-    @transaction.atomic
+    # Map gender to single letter code for Client model
+    gender_map = {
+        'Male': 'M',
+        'Female': 'F',
+        'Other': 'O'
+    }
+    
+    class Meta:
+        list_serializer_class = BulkClientRegistrationSerializer
+    
     def create(self, validated_data):
-        # Create user account
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            password=validated_data['password'],
-            email=validated_data.get('email', ''),
+        # Hash before the transaction opens, on the hashing process pool
+        password = hash_password(validated_data['password'])
+        
+        with transaction.atomic():
+            user = self.build_user(validated_data, password)
+            user.save()
+            client = self.build_client(validated_data)
+            client.save()
+        
+        return client
+    
+    def build_user(self, validated_data, password_hash):
+        """Unsaved user account carrying an already hashed password"""
+        return User(
+            username=User.normalize_username(validated_data['username']),
+            password=password_hash,
+            email=User.objects.normalize_email(validated_data.get('email', '')),
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name']
         )
-        
-        # Map gender to single letter code for Client model
-        gender_map = {
-            'Male': 'M',
-            'Female': 'F',
-            'Other': 'O'
-        }
-        
-        # Create client profile
-        client = Client.objects.create(
+    
+    def build_client(self, validated_data):
+        address = validated_data.get('address', '')
+        return Client(
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
             id_number=validated_data['national_id'],
             date_of_birth=validated_data['date_of_birth'],
-            gender=gender_map[validated_data['gender']],
+            gender=self.gender_map[validated_data['gender']],
             phone_number=validated_data['phone_number'],
             email=validated_data.get('email', ''),
-            county=validated_data.get('address', '').split(',')[0] if validated_data.get('address') else 'Unknown',
-            sub_county=validated_data.get('address', '').split(',')[1] if validated_data.get('address') and ',' in validated_data.get('address') else 'Unknown',
+            county=address.split(',')[0] if address else 'Unknown',
+            sub_county=address.split(',')[1] if address and ',' in address else 'Unknown',
         )
-        
-        return client 
 
 class ExternalClientProfileSerializer(serializers.ModelSerializer):
     """
@@ -209,13 +376,37 @@ class ExternalClientProfileSerializer(serializers.ModelSerializer):
         return obj.get_full_name()
     
     def get_enrollments(self, obj):
-        enrollments = Enrollment.objects.filter(client=obj)
+        # Uses prefetched enrollments when the view provides them
+        enrollments = obj.enrollment_set.all()
         # Return simplified enrollment data for external systems
-        return [{
+        data = [{
             'program_name': enrollment.program.name,
             'program_code': enrollment.program.code,
             'enrollment_date': enrollment.enrollment_date,
             'is_active': enrollment.is_active,
             'facility_name': enrollment.facility_name,
             'mfl_code': enrollment.mfl_code
-        } for enrollment in enrollments] 
\ No newline at end of file
+        } for enrollment in enrollments]
+        if self.context.get('include_archived'):
+            data += [{
+                'program_name': enrollment.program.name,
+                'program_code': enrollment.program.code,
+                'enrollment_date': enrollment.enrollment_date,
+                'is_active': enrollment.is_active,
+                'facility_name': enrollment.facility_name,
+                'mfl_code': enrollment.mfl_code,
+                'archived': True
+            } for enrollment in obj.archived_enrollments.all()]
+        return data
+
+
+class ChangeEventSerializer(serializers.ModelSerializer):
+    """
+    Serializer for change feed events. `sequence` is strictly increasing;
+    `operation` is either 'upsert' or 'delete' (a tombstone).
+    """
+    sequence = serializers.IntegerField(source='id')
+    
+    class Meta:
+        model = ChangeEvent
+        fields = ['sequence', 'model', 'object_id', 'operation', 'payload', 'created_at']
@@ -0,0 +1,77 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_all_session_users, forget_session_users, invalidate_tokens
+from .models import ChangeEvent, ChangeTrackedModel, delete_operation
+
+
+def record_delete(sender, instance, using, **kwargs):
+    """Write a tombstone (or archive) event for a deleted change-tracked row"""
+    ChangeEvent.objects.record(instance, delete_operation(), using=using)
+
+
+def connect_change_tracking():
+    # Connected per model rather than for all senders, so that deletes of
+    # untracked models keep Django's fast-delete path.
+    for model in apps.get_models():
+        if issubclass(model, ChangeTrackedModel):
+            post_delete.connect(record_delete, sender=model, dispatch_uid=f'change_feed_{model._meta.label_lower}')
+
+
+def invalidate_token(sender, instance, using, **kwargs):
+    """A token was deleted or replaced (e.g. by create_api_token --reset)"""
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_tokens([key]), using=using)
+
+
+def invalidate_user_tokens(sender, instance, using, update_fields=None, **kwargs):
+    """A user changed (deactivated, new password, ...): drop their cached tokens"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    keys = list(Token.objects.using(using).filter(user=instance).values_list('key', flat=True))
+    transaction.on_commit(lambda: invalidate_tokens(keys), using=using)
+
+
+def connect_token_invalidation():
+    post_delete.connect(invalidate_token, sender=Token, dispatch_uid='token_cache_delete')
+    post_save.connect(invalidate_token, sender=Token, dispatch_uid='token_cache_save')
+    post_save.connect(invalidate_user_tokens, sender=get_user_model(), dispatch_uid='token_cache_user')
+
+
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        forget_session_users([user.pk])
+
+
+def forget_changed_user(sender, instance, using, update_fields=None, **kwargs):
+    """A user changed or was deleted: drop their cached session user"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_session_users([user_id]), using=using)
+
+
+def forget_users_with_changed_permissions(sender, instance, action, using, **kwargs):
+    """Group membership or permissions changed: cached permissions are stale"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, get_user_model()):
+        user_id = instance.pk
+        transaction.on_commit(lambda: forget_session_users([user_id]), using=using)
+    else:
+        # A group or permission changed; it may apply to any user
+        transaction.on_commit(forget_all_session_users, using=using)
+
+
+def connect_session_user_invalidation():
+    User = get_user_model()
+    user_logged_out.connect(forget_logged_out_user, dispatch_uid='session_user_logout')
+    post_save.connect(forget_changed_user, sender=User, dispatch_uid='session_user_save')
+    post_delete.connect(forget_changed_user, sender=User, dispatch_uid='session_user_delete')
+    for through in (User.groups.through, User.user_permissions.through, Group.permissions.through):
+        m2m_changed.connect(forget_users_with_changed_permissions, sender=through, dispatch_uid=f'session_user_{through._meta.label_lower}')
@@ -0,0 +1,1488 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+import requests
+import tenacity
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from clients.models import ArchivedEnrollment, Client, Enrollment
+from health_programs.models import HealthProgram, ProgramCategory
+from locations.models import SubCounty, Ward
+from . import external_api_config as config
+from .admission import RequestClass, get_controller
+from .authentication import CachedModelBackend, CachedTokenAuthentication, local_token_cache
+from .external_api_client import (
+    APIRateLimitExceeded, CircuitBreaker, ExternalAPIClient, RetryPolicy, TokenBucket, circuit_breaker, shared_client,
+)
+from .external_api_service import ExternalAPIService, response_cache
+from .idempotency import idempotent
+from .jobs import run_job
+from .middleware import AdmissionControlMiddleware
+from . import password_hashing
+from .password_hashing import PasswordHashingBusy, get_pool, hash_passwords, shutdown_pool
+from .models import CacheGeneration, ChangeEvent, IdempotencyRecord, JobCheckpoint
+from .throttling import ExternalAPIRateThrottle, LocalWindowStore, LoginThrottle, get_store, sliding_window_hit
+
+
+def make_client(index, **extra):
+    fields = {
+        'first_name': f"Client{index}",
+        'last_name': "Test",
+        'id_number': f"ID{index:06d}",
+        'date_of_birth': date(1990, 1, 1),
+        'gender': 'F',
+        'county': "Nairobi",
+        'sub_county': "Westlands",
+    }
+    fields.update(extra)
+    return Client.objects.create(**fields)
+
+
+def make_program(code="PRG-1", **extra):
+    category, _ = ProgramCategory.objects.get_or_create(name="Child Health")
+    fields = {
+        'name': f"Program {code}",
+        'description': "Test program",
+        'code': code,
+        'start_date': timezone.now().date() - timedelta(days=30),
+        'location': "Nairobi",
+        'category': category,
+    }
+    fields.update(extra)
+    return HealthProgram.objects.create(**fields)
+
+
+class KeysetPaginationTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.client.force_authenticate(self.user)
+        for index in range(25):
+            make_client(index)
+
+    def test_cursor_pages_cover_every_client_once(self):
+        seen = []
+        url = '/api/clients/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['client_id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_count_is_opt_in(self):
+        response = self.client.get('/api/clients/?count=exact')
+        self.assertEqual(response.data['count'], 25)
+        self.assertFalse(response.data['count_is_estimate'])
+
+    def test_page_number_mode_still_available(self):
+        response = self.client.get('/api/clients/?page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/clients/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(EXTERNAL_SYNC_SAFETY_LAG=0)
+class ExternalClientSyncTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="integrator", password="pass12345")
+        self.client.force_authenticate(self.user)
+        self.clients = [make_client(index) for index in range(5)]
+
+    def sync(self, token=None):
+        url = '/api/external/clients/sync/?page_size=2'
+        if token:
+            url += f'&since_token={token}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_token_resumes_without_duplicates(self):
+        seen, token = [], None
+        while True:
+            data = self.sync(token)
+            seen.extend(row['client_id'] for row in data['results'])
+            token = data['next_token']
+            if not data['has_more']:
+                break
+        self.assertEqual(sorted(seen), sorted(str(c.client_id) for c in self.clients))
+
+        # Caught up: the token is echoed back with no rows
+        data = self.sync(token)
+        self.assertEqual(data['results'], [])
+        self.assertEqual(data['next_token'], token)
+
+    def test_enrollment_change_resends_client(self):
+        token = None
+        while True:
+            data = self.sync(token)
+            token = data['next_token']
+            if not data['has_more']:
+                break
+
+        Enrollment.objects.create(client=self.clients[0], program=make_program())
+
+        data = self.sync(token)
+        self.assertEqual([row['client_id'] for row in data['results']], [str(self.clients[0].client_id)])
+        self.assertEqual(len(data['results'][0]['enrollments']), 1)
+
+    def test_rows_are_held_while_an_older_transaction_is_writing(self):
+        with mock.patch('api.change_feed.open_writer_age', return_value=60):
+            data = self.sync()
+        self.assertEqual(data['results'], [])
+        self.assertFalse(data['has_more'])
+
+
+class ChangeFeedTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="integrator", password="pass12345")
+        self.client.force_authenticate(self.user)
+
+    def test_feed_uses_cached_token_authentication(self):
+        self.client.force_authenticate(None)
+        token = Token.objects.create(user=self.user)
+        local_token_cache().clear()
+        self.client.get('/api/external/changes/', HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertIsNotNone(local_token_cache().get(token.key))
+
+    def test_long_polls_have_their_own_admission_class(self):
+        controller = get_controller()
+        self.assertEqual(controller.classify('/api/external/changes/').name, 'longpoll')
+        self.assertEqual(controller.classify('/api/external/clients/').name, 'external')
+
+    def test_changes_and_tombstones_are_sequenced(self):
+        person = make_client(1)
+        person.phone_number = "+254700000001"
+        person.save()
+        enrollment = Enrollment.objects.create(client=person, program=make_program())
+        person.delete()
+
+        response = self.client.get('/api/external/changes/?after=0')
+        self.assertEqual(response.status_code, 200)
+        events = [(e['model'], e['operation']) for e in response.data['events']]
+        self.assertEqual(events, [
+            ('clients.client', 'upsert'),
+            ('clients.client', 'upsert'),
+            ('health_programs.healthprogram', 'upsert'),
+            ('clients.enrollment', 'upsert'),
+            ('clients.enrollment', 'delete'),
+            ('clients.client', 'delete'),
+        ])
+        self.assertEqual(response.data['events'][4]['payload']['program_id'], enrollment.program_id)
+
+        last = response.data['last_sequence']
+        response = self.client.get(f'/api/external/changes/?after={last}')
+        self.assertEqual(response.data['events'], [])
+        self.assertEqual(response.data['last_sequence'], last)
+
+    def test_gap_is_held_while_an_older_transaction_is_writing(self):
+        for i in range(3):
+            make_client(i)
+        events = ChangeEvent.objects.filter(model='clients.client').order_by('id')
+        first, missing, last = events
+        # The middle event is still uncommitted, and the last one is older
+        # than the grace period
+        missing.delete()
+        ChangeEvent.objects.filter(pk=last.pk).update(created_at=timezone.now() - timedelta(seconds=60))
+
+        with mock.patch('api.change_feed.open_writer_age', return_value=120):
+            response = self.client.get(f'/api/external/changes/?after={first.pk - 1}')
+        self.assertEqual([e['sequence'] for e in response.data['events']], [first.pk])
+
+        with mock.patch('api.change_feed.open_writer_age', return_value=0):
+            response = self.client.get(f'/api/external/changes/?after={first.pk - 1}')
+        self.assertEqual([e['sequence'] for e in response.data['events']], [first.pk, last.pk])
+
+    def test_compaction_keeps_latest_event_per_object(self):
+        person = make_client(1)
+        for _ in range(3):
+            person.save()
+        call_command('compact_change_feed', compact_after=0, tombstone_retention=3600, stdout=StringIO())
+
+        events = ChangeEvent.objects.filter(model='clients.client', object_id=str(person.pk))
+        self.assertEqual(events.count(), 1)
+
+
+class ConditionalGetTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.client.force_authenticate(self.user)
+        self.program = make_program()
+
+    def test_unchanged_catalogue_returns_304(self):
+        response = self.client.get('/api/programs/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/api/programs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_invalidate_etag(self):
+        etag = self.client.get('/api/programs/')['ETag']
+        self.program.category.name = "Renamed"
+        self.program.category.save()
+        self.assertEqual(self.client.get('/api/programs/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/api/programs/')['ETag']
+        make_program(code="PRG-2").delete()
+        self.assertEqual(self.client.get('/api/programs/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_client_list_validators_do_not_scan_clients(self):
+        for index in range(3):
+            make_client(index)
+        etag = self.client.get('/api/clients/', {'search': "Client"})['ETag']
+        # Only the change feed's latest sequence is read
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/clients/', {'search': "Client"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        make_client(9)
+        response = self.client.get('/api/clients/', {'search': "Client"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_external_profile_detail(self):
+        person = make_client(1)
+        url = f'/api/external/clients/{person.client_id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Enrollment.objects.create(client=person, program=self.program)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CompressionTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        for index in range(10):
+            make_program(code=f"PRG-{index}", description="Routine immunization for children " * 5)
+
+    def test_large_json_is_gzipped(self):
+        response = self.client.get('/api/programs/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['count'], 10)
+
+    def test_small_response_is_not_compressed(self):
+        response = self.client.get('/api/program-categories/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_cached_catalogue_skips_serialization(self):
+        first = self.client.get('/api/programs/', HTTP_ACCEPT_ENCODING='gzip')
+        # Only the validator aggregates run; the body comes from the cache
+        with self.assertNumQueries(2):
+            second = self.client.get('/api/programs/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(first.content), gzip.decompress(second.content))
+
+
+class BulkClientImportTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="admin", password="pass12345", is_staff=True)
+        self.client.force_authenticate(self.user)
+        make_client(1, id_number="EXISTING")
+
+    def test_csv_import_reports_row_errors(self):
+        body = (
+            "first_name,last_name,id_number,date_of_birth,gender,county,sub_county\n"
+            "Amina,Otieno,NEW1,1990-02-01,Female,Kisumu,Kisumu Central\n"
+            "Brian,Kamau,EXISTING,1985-07-12,M,Nairobi,Westlands\n"
+            "Cheru,Wanjiku,NEW1,1992-03-04,F,Nyeri,Othaya\n"
+            "Daudi,,NEW2,not-a-date,X,Mombasa,Nyali\n"
+            "Esther,Achieng,,2000-01-01,F,Kisumu,Seme\n"
+        )
+        response = self.client.post('/api/clients/bulk-import/', data=body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total'], 5)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([e['row'] for e in response.data['errors']], [2, 3, 4])
+        self.assertEqual(set(response.data['errors'][2]['errors']), {'last_name', 'date_of_birth', 'gender'})
+        self.assertTrue(Client.objects.filter(id_number="NEW1", first_name="Amina").exists())
+        self.assertEqual(ChangeEvent.objects.filter(model='clients.client').count(), 3)
+
+    def test_ndjson_import(self):
+        body = "\n".join(json.dumps({
+            'first_name': f"Row{i}", 'last_name': "Test", 'id_number': f"ND{i}",
+            'date_of_birth': "1990-01-01", 'gender': "O", 'county': "Kiambu", 'sub_county': "Thika",
+        }) for i in range(3))
+        response = self.client.post('/api/clients/bulk-import/', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 3)
+
+    def test_dry_run_leaves_location_tables_unchanged(self):
+        body = (
+            "first_name,last_name,id_number,date_of_birth,gender,county,sub_county,ward\n"
+            "Amina,Otieno,NEW1,1990-02-01,Female,Kisumu,Nyando,Awasi\n"
+        )
+        response = self.client.post(
+            '/api/clients/bulk-import/?dry_run=true', data=body, content_type='text/csv'
+        )
+        self.assertEqual(response.data['created'], 1)
+        self.assertFalse(Client.objects.filter(id_number="NEW1").exists())
+        self.assertFalse(SubCounty.objects.filter(name="Nyando").exists())
+        self.assertFalse(Ward.objects.filter(name="Awasi").exists())
+
+    def test_requires_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post('/api/clients/bulk-import/', data="", content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkEnrollTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="admin", password="pass12345", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.program = make_program()
+        self.clients = [make_client(i, county="Kisumu" if i < 3 else "Nairobi") for i in range(5)]
+        Enrollment.objects.create(client=self.clients[0], program=self.program, is_active=False)
+        Enrollment.objects.create(client=self.clients[1], program=self.program)
+
+    def test_enroll_by_ids(self):
+        missing = "00000000-0000-0000-0000-000000000000"
+        response = self.client.post('/api/enrollments/bulk_enroll/', {
+            'program_id': self.program.id,
+            'client_ids': [str(c.client_id) for c in self.clients[:3]] + [missing],
+            'facility_name': "Kisumu County Hospital",
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['reactivated'], 1)
+        self.assertEqual(response.data['already_active'], 1)
+        self.assertEqual(response.data['failed_client_ids'], [missing])
+        self.assertEqual(Enrollment.objects.filter(program=self.program, is_active=True).count(), 3)
+
+    def test_enroll_by_filter(self):
+        response = self.client.post('/api/enrollments/bulk_enroll/', {
+            'program_id': self.program.id,
+            'filter': {'county': "Nairobi"},
+        }, format='json')
+        self.assertEqual(response.data['created'], 2)
+        events = ChangeEvent.objects.filter(model='clients.enrollment').order_by('-id')[:2]
+        self.assertNotIn('None', [event.object_id for event in events])
+
+    def test_rejects_unknown_filter_fields(self):
+        response = self.client.post('/api/enrollments/bulk_enroll/', {
+            'program_id': self.program.id,
+            'filter': {'id_number__startswith': "1"},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class EnrollClientUpsertTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.client.force_authenticate(self.user)
+        self.program = make_program()
+        self.person = make_client(1)
+
+    def enroll(self, **extra):
+        data = {'client_id': str(self.person.client_id), 'program_id': self.program.id}
+        data.update(extra)
+        return self.client.post('/api/enrollments/enroll_client/', data, format='json')
+
+    def test_repeat_enrollment_updates_existing_row(self):
+        response = self.enroll(facility_name="Clinic A")
+        self.assertEqual(response.status_code, 201)
+        Enrollment.objects.update(is_active=False)
+
+        response = self.enroll(notes="Second visit")
+        self.assertEqual(response.status_code, 201)
+        enrollment = Enrollment.objects.get()
+        self.assertTrue(enrollment.is_active)
+        self.assertEqual(enrollment.facility_name, "Clinic A")
+        self.assertEqual(enrollment.notes, "Second visit")
+        self.assertEqual(response.data['id'], enrollment.id)
+
+    def test_unknown_program_is_rejected(self):
+        response = self.enroll(program_id=self.program.id + 100)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Enrollment.objects.exists())
+
+
+class EnrollmentActiveStateTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="admin", password="pass12345", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.program = make_program()
+        self.ended = make_program(code="PRG-2", end_date=timezone.now().date() - timedelta(days=1))
+        self.enrollment = Enrollment.objects.create(client=make_client(0), program=self.program)
+
+    def test_toggle_is_atomic_flip(self):
+        response = self.client.post(f'/api/enrollments/{self.enrollment.id}/toggle_active/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_active'])
+        response = self.client.post(f'/api/enrollments/{self.enrollment.id}/toggle_active/')
+        self.assertTrue(response.data['is_active'])
+        self.assertTrue(ChangeEvent.objects.filter(
+            model='clients.enrollment', object_id=str(self.enrollment.id)
+        ).exists())
+
+    def test_toggle_missing_enrollment(self):
+        response = self.client.post('/api/enrollments/999999/toggle_active/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_id_is_not_found(self):
+        response = self.client.post('/api/enrollments/abc/toggle_active/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_set_active_is_idempotent(self):
+        for _ in range(2):
+            response = self.client.post(
+                f'/api/enrollments/{self.enrollment.id}/set_active/', {'is_active': False}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.data['is_active'])
+
+    def test_bulk_deactivate_ended_programs(self):
+        for i in range(1, 6):
+            Enrollment.objects.create(client=make_client(i), program=self.ended)
+        response = self.client.post('/api/enrollments/bulk_deactivate/', {'program_ended': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deactivated'], 5)
+        self.assertFalse(Enrollment.objects.filter(program=self.ended, is_active=True).exists())
+        self.assertTrue(Enrollment.objects.get(pk=self.enrollment.pk).is_active)
+
+    def test_deactivate_in_batches(self):
+        for i in range(1, 6):
+            Enrollment.objects.create(client=make_client(i), program=self.ended)
+        deactivated = Enrollment.objects.filter(program=self.ended).deactivate_in_batches(batch_size=2)
+        self.assertEqual(deactivated, 5)
+
+    def test_deactivate_in_batches_touches_clients_on_the_same_database(self):
+        enrollment = Enrollment.objects.create(client=make_client(1), program=self.ended)
+        with mock.patch('clients.models.touch_clients') as touch_clients:
+            Enrollment.objects.using('default').filter(program=self.ended).deactivate_in_batches()
+        touch_clients.assert_called_once_with({enrollment.client_id}, using='default')
+
+    def test_deactivate_in_batches_skips_rows_deactivated_meanwhile(self):
+        other = Enrollment.objects.create(client=make_client(1), program=self.ended)
+        events = ChangeEvent.objects.filter(model='clients.enrollment', object_id=str(other.pk))
+        before = events.count()
+        atomic = transaction.atomic
+
+        def concurrent_writer(*args, **kwargs):
+            # Another writer deactivates a row between the batch read and ours
+            Enrollment.objects.filter(pk=other.pk).update(is_active=False)
+            return atomic(*args, **kwargs)
+
+        with mock.patch('clients.models.transaction.atomic', side_effect=concurrent_writer):
+            deactivated = Enrollment.objects.filter(program=self.ended).deactivate_in_batches()
+        self.assertEqual(deactivated, 0)
+        self.assertEqual(events.count(), before)
+
+    def test_bulk_deactivate_requires_criteria(self):
+        response = self.client.post('/api/enrollments/bulk_deactivate/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class DeactivateEndedEnrollmentsTest(APITestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.running = make_program(code="PRG-1")
+        self.ended = make_program(code="PRG-2", end_date=today - timedelta(days=3))
+        for i in range(3):
+            Enrollment.objects.create(client=make_client(i), program=self.ended)
+        Enrollment.objects.create(client=make_client(9), program=self.running)
+
+    def test_command_deactivates_ended_programs(self):
+        out = StringIO()
+        call_command('deactivate_ended_enrollments', '--batch-size', '2', stdout=out)
+        self.assertIn('deactivated 3 enrollments', out.getvalue())
+        self.assertFalse(Enrollment.objects.filter(program=self.ended, is_active=True).exists())
+        self.assertTrue(Enrollment.objects.get(program=self.running).is_active)
+        self.assertIsNone(JobCheckpoint.objects.get(name='deactivate_ended_enrollments').locked_until)
+
+    def test_checkpoint_skips_already_processed_programs(self):
+        run_job('deactivate_ended_enrollments')
+        ran, (programs, deactivated) = run_job('deactivate_ended_enrollments')
+        self.assertTrue(ran)
+        self.assertEqual((programs, deactivated), (0, 0))
+
+        # Ending a running program is picked up on the next run
+        self.running.end_date = timezone.now().date() - timedelta(days=10)
+        self.running.save()
+        _, (programs, deactivated) = run_job('deactivate_ended_enrollments')
+        self.assertEqual((programs, deactivated), (1, 1))
+
+    def test_release_keeps_a_lease_taken_over_by_another_run(self):
+        checkpoint = JobCheckpoint.objects.acquire('deactivate_ended_enrollments', timedelta(minutes=5))
+        # Our lease expired and another run took the job
+        JobCheckpoint.objects.filter(pk=checkpoint.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        other = JobCheckpoint.objects.acquire('deactivate_ended_enrollments', timedelta(minutes=5))
+        JobCheckpoint.objects.release(checkpoint)
+        self.assertEqual(JobCheckpoint.objects.get(pk=checkpoint.pk).locked_until, other.locked_until)
+
+    def test_overlapping_run_is_skipped(self):
+        JobCheckpoint.objects.acquire('deactivate_ended_enrollments', timedelta(minutes=5))
+        ran, result = run_job('deactivate_ended_enrollments')
+        self.assertFalse(ran)
+        self.assertEqual(Enrollment.objects.filter(is_active=True).count(), 4)
+
+
+def registration(index, **extra):
+    data = {
+        'username': f"user{index}",
+        'password': "S3cure-pass!",
+        'first_name': "Amina",
+        'last_name': "Otieno",
+        'date_of_birth': "1992-04-01",
+        'gender': "Female",
+        'national_id': f"NID{index:05d}",
+        'phone_number': "0712345678",
+        'address': "Kisumu,Kisumu Central",
+    }
+    data.update(extra)
+    return data
+
+
+class ClientRegistrationTest(APITestCase):
+
+    def tearDown(self):
+        shutdown_pool()
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1)
+    def test_register_hashes_on_pool(self):
+        response = self.client.post('/api/clients/register/', registration(1), format='json')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username="user1")
+        self.assertTrue(user.check_password("S3cure-pass!"))
+        self.assertEqual(Client.objects.get(pk=response.data['client_id']).county, "Kisumu")
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_PENDING=1)
+    def test_bulk_hashing_takes_pool_slots(self):
+        get_pool()
+        slots = password_hashing._slots
+        encoded = hash_passwords(["one", "two", "three"], chunk_size=1)
+        self.assertEqual(len(encoded), 3)
+        self.assertTrue(check_password("three", encoded[2]))
+
+        # Every slot is back, so a full pool turns bulk work away too
+        self.assertTrue(slots.acquire(blocking=False))
+        try:
+            with override_settings(PASSWORD_HASHING_QUEUE_TIMEOUT=0.1), self.assertRaises(PasswordHashingBusy):
+                hash_passwords(["four"])
+        finally:
+            slots.release()
+
+    def test_register_when_hashing_is_saturated(self):
+        with mock.patch('api.serializers.hash_password', side_effect=PasswordHashingBusy("busy")):
+            response = self.client.post('/api/clients/register/', registration(1), format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(PASSWORD_HASHING_WORKERS=0)
+    def test_bulk_registration(self):
+        staff = User.objects.create_user(username="admin", password="pass12345", is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.post(
+            '/api/clients/register/bulk/', [registration(i) for i in range(3)], format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertTrue(User.objects.get(username="user2").check_password("S3cure-pass!"))
+        self.assertEqual(ChangeEvent.objects.filter(model='clients.client').count(), 3)
+
+        response = self.client.post(
+            '/api/clients/register/bulk/', [registration(2), registration(5, username="user5")], format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Client.objects.count(), 3)
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=0, IDEMPOTENCY_WAIT=0)
+class IdempotencyKeyTest(APITestCase):
+
+    def register(self, key, **extra):
+        return self.client.post(
+            '/api/clients/register/', registration(1, **extra), format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_first_response(self):
+        first = self.register("key-1")
+        second = self.register("key-1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data['client_id'], str(first.data['client_id']))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Client.objects.count(), 1)
+
+    def test_key_reused_for_other_body(self):
+        self.register("key-1")
+        response = self.register("key-1", first_name="Other")
+        self.assertEqual(response.status_code, 422)
+
+    def test_in_flight_duplicate_gets_conflict(self):
+        self.register("key-1")
+        IdempotencyRecord.objects.update(status_code=None, expires_at=timezone.now() + timedelta(minutes=1))
+        response = self.register("key-1")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Retry-After', response)
+
+    def test_keys_are_scoped_per_user(self):
+        user = User.objects.create_user(username="staff", password="pass12345")
+        self.client.force_authenticate(user)
+        program = make_program()
+        person = make_client(1)
+        data = {'client_id': str(person.client_id), 'program_id': program.id}
+        first = self.client.post('/api/enrollments/enroll_client/', data, format='json', HTTP_IDEMPOTENCY_KEY="k")
+        second = self.client.post('/api/enrollments/enroll_client/', data, format='json', HTTP_IDEMPOTENCY_KEY="k")
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(IdempotencyRecord.objects.count(), 1)
+
+        other = User.objects.create_user(username="other", password="pass12345")
+        self.client.force_authenticate(other)
+        self.client.post('/api/enrollments/enroll_client/', data, format='json', HTTP_IDEMPOTENCY_KEY="k")
+        self.assertEqual(IdempotencyRecord.objects.count(), 2)
+
+    def test_anonymous_keys_are_scoped_per_caller(self):
+        self.register("key-1")
+        response = self.client.post(
+            '/api/clients/register/', registration(1), format='json',
+            HTTP_IDEMPOTENCY_KEY="key-1", REMOTE_ADDR="198.51.100.7",
+        )
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(IdempotencyRecord.objects.count(), 2)
+
+    def test_replay_restores_headers(self):
+        @api_view(['POST'])
+        @permission_classes([permissions.AllowAny])
+        @idempotent
+        def create(request):
+            response = Response({'id': 1}, status=201)
+            response['Location'] = '/api/things/1/'
+            return response
+
+        factory = APIRequestFactory()
+        for _ in range(2):
+            request = factory.post('/api/things/', {'name': "x"}, format='json', HTTP_IDEMPOTENCY_KEY="key-1")
+            response = create(request)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response['Location'], '/api/things/1/')
+
+    def test_expired_records_are_removed(self):
+        self.register("key-1")
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('expire_idempotency_keys', stdout=out)
+        self.assertIn('Removed 1', out.getvalue())
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+
+class ClientLocationTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.client.force_authenticate(self.user)
+
+    def test_unknown_county_is_rejected(self):
+        data = {
+            'first_name': "Jane", 'last_name': "Doe", 'date_of_birth': "1990-01-01",
+            'gender': "F", 'county': "Nairobbi", 'sub_county': "Westlands",
+        }
+        response = self.client.post('/api/clients/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('county', response.data)
+
+        data['county'] = "nairobi city"
+        response = self.client.post('/api/clients/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['county'], "Nairobi")
+
+    def test_client_search_is_served_by_the_viewset(self):
+        make_client(1, first_name="Wanjiru")
+        response = self.client.get('/api/clients/search/', {'q': "wanjiru"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['first_name'] for c in response.data], ["Wanjiru"])
+
+    def test_dashboard_groups_by_county_key(self):
+        make_client(1, county="Nairobi")
+        make_client(2, county="NAIROBI")
+        make_client(3, county="Kisumu")
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['clients_by_county'][0], {'county': "Nairobi", 'count': 2})
+
+
+class EnrollmentArchiveTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.client.force_authenticate(self.user)
+        self.person = make_client(1)
+        self.old = Enrollment.objects.create(client=self.person, program=make_program("PRG-1"), is_active=False)
+        self.recent = Enrollment.objects.create(client=self.person, program=make_program("PRG-2"), is_active=False)
+        self.active = Enrollment.objects.create(client=self.person, program=make_program("PRG-3"))
+        Enrollment.objects.filter(pk__in=[self.old.pk, self.active.pk]).update(
+            updated_at=timezone.now() - timedelta(days=400)
+        )
+
+    def archive(self):
+        out = StringIO()
+        call_command('archive_enrollments', '--older-than-days', '365', '--batch-size', '1', stdout=out)
+        return out.getvalue()
+
+    def test_archive_moves_only_old_inactive_rows(self):
+        self.assertIn('Archived 1 enrollments', self.archive())
+        self.assertEqual(list(ArchivedEnrollment.objects.values_list('id', flat=True)), [self.old.pk])
+        self.assertEqual(set(Enrollment.objects.values_list('id', flat=True)), {self.recent.pk, self.active.pk})
+        # Mirrors are told the row was archived, not deleted
+        self.assertFalse(ChangeEvent.objects.filter(operation=ChangeEvent.DELETE).exists())
+        archived = ChangeEvent.objects.filter(operation=ChangeEvent.ARCHIVE)
+        self.assertEqual(list(archived.values_list('object_id', flat=True)), [str(self.old.pk)])
+
+    def test_reads_include_archived_on_demand(self):
+        self.archive()
+        url = f'/api/clients/{self.person.client_id}/'
+        self.assertEqual(len(self.client.get(url).data['enrollments']), 2)
+        enrollments = self.client.get(url, {'include_archived': 'true'}).data['enrollments']
+        self.assertEqual(len(enrollments), 3)
+        self.assertEqual([e['id'] for e in enrollments if e.get('archived')], [self.old.pk])
+
+        response = self.client.get(
+            f'/api/external/clients/{self.person.client_id}/', {'include_archived': 'true'}
+        )
+        self.assertEqual(len(response.data['enrollments']), 3)
+
+    def test_archived_views_have_their_own_etag(self):
+        self.archive()
+        urls = (f'/api/clients/{self.person.client_id}/', f'/api/external/clients/{self.person.client_id}/')
+        archived_etags = {}
+        for url in urls:
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, {'include_archived': 'true'}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            archived_etags[url] = response['ETag']
+
+        # Archiving another enrollment changes the archived views' ETags
+        Enrollment.objects.filter(pk=self.recent.pk).update(updated_at=timezone.now() - timedelta(days=400))
+        self.archive()
+        for url in urls:
+            response = self.client.get(url, {'include_archived': 'true'}, HTTP_IF_NONE_MATCH=archived_etags[url])
+            self.assertEqual(response.status_code, 200)
+
+    def test_restore(self):
+        self.archive()
+        ArchivedEnrollment.objects.create(
+            id=999, client=self.person, program=self.active.program,
+            enrollment_date=date(2020, 1, 1), updated_at=timezone.now(),
+        )
+        out = StringIO()
+        call_command('restore_enrollments', '--client', str(self.person.client_id), stdout=out)
+        self.assertIn('Restored 1 enrollments', out.getvalue())
+        self.assertIn('1 stayed archived', out.getvalue())
+        self.assertTrue(Enrollment.objects.filter(pk=self.old.pk, is_active=False).exists())
+        self.assertEqual(list(ArchivedEnrollment.objects.values_list('id', flat=True)), [999])
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        local_token_cache().clear()
+        self.user = User.objects.create_user(username="integrator", password="pass12345")
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE=None)
+    def test_second_lookup_only_reads_the_revocation_generation(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(1):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_second_lookup_skips_the_database_with_a_shared_cache(self):
+        cache.clear()
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_cache_does_not_hold_the_password_hash(self):
+        cache.clear()
+        self.auth.authenticate_credentials(self.token.key)
+        cached = cache.get('auth-token:' + self.token.key)
+        self.assertNotIn(self.user.password, repr(cached))
+
+        # Another process, with an empty local cache
+        local_token_cache().clear()
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual((user.username, token.key, token.user_id), ("integrator", self.token.key, self.user.pk))
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertTrue(user.check_password("pass12345"))
+
+    def test_reset_token_is_invalidated(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('create_api_token', 'integrator', '--reset', stdout=StringIO())
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+        new_key = Token.objects.get(user=self.user).key
+        self.assertEqual(self.auth.authenticate_credentials(new_key)[0].pk, self.user.pk)
+
+    def test_deactivated_user_is_invalidated(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_external_api_accepts_cached_token(self):
+        for _ in range(2):
+            response = self.client.get('/api/external/clients/', HTTP_AUTHORIZATION=f"Token {self.token.key}")
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE=None)
+    def test_revocation_elsewhere_is_immediate_without_a_shared_cache(self):
+        self.auth.authenticate_credentials(self.token.key)
+        # Revoked in another process: only the database generation moves here
+        Token.objects.filter(pk=self.token.pk).delete()
+        CacheGeneration.objects.bump('auth-token-generation')
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_reset_warns_without_a_shared_cache(self):
+        out = StringIO()
+        with override_settings(TOKEN_AUTH_SHARED_CACHE=None):
+            call_command('create_api_token', 'integrator', '--reset', stdout=out)
+        self.assertIn('TOKEN_AUTH_SHARED_CACHE is not set', out.getvalue())
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_generation_revokes_local_entries(self):
+        cache.clear()
+        self.auth.authenticate_credentials(self.token.key)
+        # Another process revokes the token: only the shared cache changes
+        Token.objects.filter(pk=self.token.pk).delete()
+        cache.delete(f"auth-token:{self.token.key}")
+        cache.set('auth-token-generation', 5)
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+
+class ExternalAPIRateThrottleTest(APITestCase):
+
+    def setUp(self):
+        get_store().clear()
+        self.user = User.objects.create_user(username="integrator", password="pass12345")
+        self.token = Token.objects.create(user=self.user)
+
+    def get(self, token=None):
+        return self.client.get('/api/external/clients/', HTTP_AUTHORIZATION=f"Token {token or self.token.key}")
+
+    @override_settings(EXTERNAL_API_THROTTLE_RATES={'default': ['2/min']})
+    def test_limit_returns_429_with_retry_after(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['X-RateLimit-Limit'], '2')
+        self.assertEqual(first['X-RateLimit-Remaining'], '1')
+        self.assertEqual(self.get()['X-RateLimit-Remaining'], '0')
+
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+
+    @override_settings(EXTERNAL_API_THROTTLE_RATES={'default': ['1/min'], 'bulk-partner': ['5/min']})
+    def test_limits_are_per_token(self):
+        partner = User.objects.create_user(username="bulk-partner", password="pass12345")
+        partner_token = Token.objects.create(user=partner)
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 429)
+        for _ in range(5):
+            self.assertEqual(self.get(partner_token.key).status_code, 200)
+
+    @override_settings(EXTERNAL_API_THROTTLE_RATES={'default': ['100/min', '3/day']})
+    def test_quota_applies_on_top_of_rate(self):
+        for _ in range(3):
+            self.assertEqual(self.get().status_code, 200)
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['X-RateLimit-Limit'], '3')
+
+    @override_settings(EXTERNAL_API_THROTTLE_RATES={'default': ['2/min', '10/day']})
+    def test_rejected_calls_do_not_use_up_the_quota(self):
+        for _ in range(2):
+            self.assertEqual(self.get().status_code, 200)
+        for _ in range(5):
+            self.assertEqual(self.get().status_code, 429)
+        key = 'token:' + hashlib.sha256(self.token.key.encode()).hexdigest()[:32]
+        _, today = get_store().peek((key, 86400), int(time.time() // 86400))
+        self.assertEqual(today, 2)
+
+    @override_settings(EXTERNAL_API_THROTTLE_RATES={'default': ['2/min', '10/day']})
+    def test_concurrent_requests_cannot_overshoot_the_limit(self):
+        request = mock.Mock(auth=self.token, user=self.user, _request=mock.Mock())
+        barrier = threading.Barrier(8)
+        results = []
+
+        def attempt():
+            barrier.wait()
+            results.append(ExternalAPIRateThrottle().allow_request(request, None))
+
+        threads = [threading.Thread(target=attempt) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 2)
+        key = 'token:' + hashlib.sha256(self.token.key.encode()).hexdigest()[:32]
+        self.assertEqual(get_store().peek((key, 86400), int(time.time() // 86400))[1], 2)
+
+    def test_sliding_window_weights_previous_window(self):
+        store = LocalWindowStore()
+        for _ in range(10):
+            sliding_window_hit(store, 'key', 10, 60, now=60 * 100 + 30)
+        # Halfway through the next window half of the previous count remains
+        allowed, remaining, _ = sliding_window_hit(store, 'key', 10, 60, now=60 * 101 + 30)
+        self.assertTrue(allowed)
+        self.assertEqual(remaining, 4)
+        for _ in range(4):
+            sliding_window_hit(store, 'key', 10, 60, now=60 * 101 + 30)
+        allowed, _, retry_after = sliding_window_hit(store, 'key', 10, 60, now=60 * 101 + 30)
+        self.assertFalse(allowed)
+        self.assertLessEqual(retry_after, 30)
+
+    @override_settings(
+        EXTERNAL_API_THROTTLE_RATES={'default': ['1/min']},
+        EXTERNAL_API_THROTTLE_CACHE='default',
+    )
+    def test_shared_cache_store(self):
+        cache.clear()
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 429)
+
+
+@override_settings(ADMISSION_CLASSES={
+    'interactive': {'max_concurrent': None},
+    'external': {'max_concurrent': 1, 'max_queue': 0, 'queue_timeout': 0, 'retry_after': 7},
+})
+class AdmissionControlTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="integrator", password="pass12345")
+        self.token = Token.objects.create(user=self.user)
+        self.external = get_controller().classes['external']
+
+    def test_over_budget_class_is_shed(self):
+        self.assertTrue(self.external.acquire())
+        try:
+            response = self.client.get('/api/external/clients/', HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        finally:
+            self.external.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(self.external.stats()['shed'], 1)
+
+        response = self.client.get('/api/external/clients/', HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.external.stats()['in_flight'], 0)
+
+    def test_shed_response_carries_cors_headers(self):
+        self.assertTrue(self.external.acquire())
+        try:
+            response = self.client.get('/api/external/clients/', HTTP_ORIGIN='http://localhost:3000')
+        finally:
+            self.external.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'http://localhost:3000')
+
+    def test_interactive_requests_are_not_limited_by_other_classes(self):
+        self.assertTrue(self.external.acquire())
+        try:
+            self.client.force_authenticate(self.user)
+            response = self.client.get('/api/dashboard/')
+        finally:
+            self.external.release()
+        self.assertEqual(response.status_code, 200)
+
+    def test_queued_request_is_admitted_when_a_slot_frees(self):
+        request_class = RequestClass('bulk', max_concurrent=1, max_queue=1, queue_timeout=5)
+        self.assertTrue(request_class.acquire())
+        timer = threading.Timer(0.05, request_class.release)
+        timer.start()
+        self.assertTrue(request_class.acquire())
+        timer.join()
+        self.assertEqual(request_class.stats()['queued'], 1)
+        self.assertEqual(request_class.stats()['shed'], 0)
+
+    def stream(self, content):
+        middleware = AdmissionControlMiddleware(lambda request: StreamingHttpResponse(content))
+        return middleware(RequestFactory().get('/api/external/clients/'))
+
+    def test_streaming_response_holds_its_slot_until_sent(self):
+        response = self.stream(iter([b"a", b"b"]))
+        self.assertEqual(self.external.stats()['in_flight'], 1)
+        self.assertEqual(b"".join(response), b"ab")
+        self.assertEqual(self.external.stats()['in_flight'], 0)
+        response.close()
+        self.assertEqual(self.external.stats()['in_flight'], 0)
+
+    def test_unread_streaming_response_releases_on_close(self):
+        response = self.stream(iter([b"a"]))
+        response.close()
+        self.assertEqual(self.external.stats()['in_flight'], 0)
+
+    def test_async_streaming_response_releases_when_sent(self):
+        async def content():
+            yield b"a"
+            yield b"b"
+
+        async def consume(response):
+            return [part async for part in response.streaming_content]
+
+        response = self.stream(content())
+        self.assertEqual(self.external.stats()['in_flight'], 1)
+        self.assertEqual(asyncio.run(consume(response)), [b"a", b"b"])
+        self.assertEqual(self.external.stats()['in_flight'], 0)
+
+    def test_stats_endpoint_requires_admin(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/admission/').status_code, 403)
+        admin = User.objects.create_superuser(username="admin", password="pass12345")
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/admission/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('queue_depth', response.data['external'])
+
+
+@override_settings(
+    SESSION_SHARED_CACHE='default',
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    SESSION_CACHE_ALIAS='default',
+    AUTHENTICATION_BACKENDS=['api.authentication.CachedModelBackend'],
+)
+class CachedSessionTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_store('LOGIN_THROTTLE_CACHE').clear()
+        self.user = User.objects.create_user(username="nurse", password="pass12345")
+        response = self.client.post('/api/auth/login/', {'username': "nurse", 'password': "pass12345"}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_and_user_come_from_the_cache(self):
+        self.client.get('/api/auth/user/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.data['username'], "nurse")
+
+    def test_permissions_are_cached_with_the_user(self):
+        permission = Permission.objects.get(codename='view_client')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(permission)
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(backend.get_user(self.user.pk).has_perm('clients.view_client'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(permission)
+        self.assertFalse(backend.get_user(self.user.pk).has_perm('clients.view_client'))
+
+    def test_cached_user_leaves_out_the_password_hash(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        cached = cache.get(f"session-user:{cache.get('session-user-generation', 0)}:{self.user.pk}")
+        self.assertIsNotNone(cached)
+        self.assertNotIn(self.user.password, repr(cached))
+        user = backend.get_user(self.user.pk)
+        self.assertEqual(user.username, "nurse")
+        self.assertTrue(user.check_password("pass12345"))
+
+    def test_password_change_ends_cached_sessions(self):
+        self.client.get('/api/auth/user/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("new-pass12345")
+            self.user.save()
+        response = self.client.get('/api/auth/user/')
+        self.assertFalse(response.data.get('authenticated', True))
+
+    def test_logout_forgets_the_user(self):
+        self.client.get('/api/auth/user/')
+        self.client.post('/api/auth/logout/')
+        response = self.client.get('/api/auth/user/')
+        self.assertFalse(response.data.get('authenticated', True))
+
+    @override_settings(SESSION_SHARED_CACHE=None)
+    def test_users_are_read_from_the_database_without_a_shared_cache(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(backend.get_user(self.user.pk), self.user)
+
+
+@override_settings(LOGIN_FAILURE_LIMITS={'username': '3/15m', 'ip': '5/15m'})
+class LoginThrottleTest(APITestCase):
+
+    def setUp(self):
+        get_store('LOGIN_THROTTLE_CACHE').clear()
+        User.objects.create_user(username="nurse", password="pass12345")
+
+    def login(self, username="nurse", password="wrong"):
+        return self.client.post('/api/auth/login/', {'username': username, 'password': password}, format='json')
+
+    def test_failures_are_limited_per_username_without_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 401)
+        with mock.patch('api.views.authenticate') as authenticate:
+            response = self.login(password="pass12345")
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_unknown_usernames_are_counted_too(self):
+        for _ in range(3):
+            self.assertEqual(self.login(username="nobody").status_code, 401)
+        self.assertEqual(self.login(username="NOBODY").status_code, 429)
+
+    def test_failures_are_limited_per_ip(self):
+        for index in range(5):
+            self.assertEqual(self.login(username=f"user{index}").status_code, 401)
+        self.assertEqual(self.login(password="pass12345").status_code, 429)
+
+    def test_success_clears_the_username_counter(self):
+        for _ in range(2):
+            self.login()
+        self.assertEqual(self.login(password="pass12345").status_code, 200)
+        for _ in range(2):
+            self.assertEqual(self.login().status_code, 401)
+
+    def test_concurrent_attempts_reserve_slots_before_hashing(self):
+        request = mock.Mock(META={'REMOTE_ADDR': '10.0.0.1'})
+        # Every attempt is counted before any of them reaches authenticate()
+        attempts = [LoginThrottle(request, "nurse") for _ in range(4)]
+        results = [throttle.reserve() for throttle in attempts]
+        self.assertEqual(results[:3], [None, None, None])
+        self.assertGreaterEqual(results[3], 1)
+        attempts[0].succeeded()
+        self.assertIsNone(LoginThrottle(request, "nurse").reserve())
+
+    def test_forwarded_for_does_not_change_the_ip_key(self):
+        for index in range(5):
+            response = self.client.post(
+                '/api/auth/login/', {'username': f"user{index}", 'password': "wrong"},
+                format='json', HTTP_X_FORWARDED_FOR=f"203.0.113.{index}",
+            )
+            self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.login(username="other").status_code, 429)
+
+
+def upstream_response(status_code=200, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload if payload is not None else {}).encode()
+    response.headers.update(headers or {})
+    response.elapsed = timedelta(milliseconds=5)
+    return response
+
+
+class ExternalAPIClientTest(APITestCase):
+
+    def setUp(self):
+        self.client_transport = ExternalAPIClient(connect_timeout=2, read_timeout=10)
+
+    def test_services_share_one_pooled_session(self):
+        first = ExternalAPIService("https://upstream.example/api", api_token="one", client=self.client_transport)
+        second = ExternalAPIService("https://upstream.example/api", api_token="two", client=self.client_transport)
+        with mock.patch.object(self.client_transport.session, 'request', return_value=upstream_response(payload={'id': 1})) as request:
+            self.assertEqual(first.get('patients/1'), {'id': 1})
+            second.get('patients/2')
+        self.assertIs(first.client.session, second.client.session)
+        calls = request.call_args_list
+        self.assertEqual(calls[0].kwargs['headers'], {'Authorization': 'Bearer one'})
+        self.assertEqual(calls[1].kwargs['headers'], {'Authorization': 'Bearer two'})
+        self.assertEqual(calls[0].kwargs['timeout'], (2, 10))
+
+    def test_adapter_pool_is_configured(self):
+        adapter = self.client_transport.session.get_adapter('https://upstream.example/')
+        self.assertEqual(adapter._pool_maxsize, config.POOL_MAXSIZE)
+        self.assertIs(adapter, self.client_transport.session.get_adapter('http://upstream.example/'))
+
+    def test_429_raises_rate_limit_exceeded(self):
+        response = upstream_response(429, headers={'Retry-After': '12'})
+        with mock.patch.object(self.client_transport.session, 'request', return_value=response):
+            with self.assertRaises(APIRateLimitExceeded) as raised:
+                self.client_transport.request('get', 'https://upstream.example/api/patients/1')
+        self.assertEqual(raised.exception.retry_after, 12)
+
+    def test_shared_client_is_reused(self):
+        self.assertIs(shared_client(), shared_client())
+
+
+class ExternalAPIResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        response_cache().clear()
+        self.transport = ExternalAPIClient()
+        self.service = ExternalAPIService("https://upstream.example/api", api_token="one", client=self.transport)
+
+    def respond(self, payload):
+        return mock.patch.object(self.transport.session, 'request', return_value=upstream_response(payload=payload))
+
+    def test_gets_are_cached_by_endpoint_and_params(self):
+        before = self.service.cache_stats()
+        with self.respond({'id': 'P1'}) as request:
+            self.service.get('patient_detail', params={'id': 'P1', 'extra': None})
+            data = self.service.get('/patient_detail/', params={'id': 'P1'})
+            data['id'] = 'changed'
+            self.assertEqual(self.service.get_patient('P1'), {'id': 'P1'})
+            self.service.get('patient_detail', params={'id': 'P2'})
+        self.assertEqual(request.call_count, 2)
+        stats = self.service.cache_stats()
+        self.assertEqual(stats['hits'] - before['hits'], 2)
+        self.assertEqual(stats['misses'] - before['misses'], 2)
+
+    def test_writes_invalidate_related_gets(self):
+        with self.respond([{'id': 'P1'}]) as request:
+            self.service.get('patient_search', params={'q': 'Jane'})
+            self.service.get('patients/P1/records')
+            self.service.get('facilities')
+            self.service.create_patient({'first_name': 'Jane'})
+            self.service.submit_health_data('P1', {'weight': 60})
+            self.service.get('patient_search', params={'q': 'Jane'})
+            self.service.get('patients/P1/records')
+            self.service.get('facilities')
+        # create and submit, plus both gets again; facilities stays cached
+        self.assertEqual(request.call_count, 7)
+
+    def test_per_endpoint_timeouts(self):
+        with mock.patch.object(config, 'CACHE_TIMEOUTS', {'lab_results': 0}):
+            with self.respond([]) as request:
+                self.service.get_lab_results('P1')
+                self.service.get_lab_results('P1')
+        self.assertEqual(request.call_count, 2)
+
+    def test_cache_can_be_disabled(self):
+        with mock.patch.object(config, 'CACHE_ENABLED', False):
+            with self.respond({}) as request:
+                self.service.get('facilities')
+                self.service.get('facilities')
+        self.assertEqual(request.call_count, 2)
+
+
+class TokenBucketTest(APITestCase):
+
+    def test_bursts_up_to_capacity_then_paces(self):
+        bucket = TokenBucket(rate=100, capacity=3)
+        for _ in range(3):
+            self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+        # The next token arrives after 1/rate seconds
+        self.assertTrue(bucket.acquire(timeout=0.5))
+
+    def test_penalty_pauses_and_slows_the_bucket(self):
+        bucket = TokenBucket(rate=100, capacity=3)
+        bucket.penalize(retry_after=30)
+        self.assertEqual(bucket.rate, 50)
+        self.assertFalse(bucket.acquire(timeout=1))
+        for _ in range(10):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 100)
+
+    def test_upstream_429_stops_blind_retries(self):
+        transport = ExternalAPIClient()
+        service = ExternalAPIService("https://throttled.example/api", client=transport)
+        throttled = upstream_response(429, headers={'Retry-After': '30'})
+        with mock.patch.object(transport.session, 'request', return_value=throttled) as request:
+            result = service.get_patient('P1')
+        self.assertEqual(result, {'error': 'Service temporarily unavailable due to rate limiting'})
+        self.assertEqual(request.call_count, 1)
+
+
+class RetryPolicyTest(APITestCase):
+
+    def setUp(self):
+        self.transport = ExternalAPIClient()
+        self.service = ExternalAPIService(
+            "https://retry.example/api",
+            client=self.transport,
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=10, deadline=30),
+        )
+        sleep = mock.patch('api.external_api_service.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def upstream(self, *responses):
+        return mock.patch.object(self.transport.session, 'request', side_effect=list(responses))
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        with self.upstream(upstream_response(503), requests.ConnectionError(), upstream_response(payload={'ok': True})) as request:
+            self.assertEqual(self.service._handle_request('get', 'facilities'), {'ok': True})
+        self.assertEqual(request.call_count, 3)
+        delays = [call.args[0] for call in self.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(all(0.5 <= delay <= 10 for delay in delays))
+
+    def test_client_errors_are_not_retried(self):
+        with self.upstream(upstream_response(404)) as request:
+            with self.assertRaises(requests.HTTPError):
+                self.service._handle_request('get', 'patient_detail')
+        self.assertEqual(request.call_count, 1)
+
+    def test_non_idempotent_methods_are_not_retried(self):
+        with self.upstream(upstream_response(503)) as request:
+            self.assertIn('error', self.service.create_patient({'first_name': "Jane"}))
+        self.assertEqual(request.call_count, 1)
+
+    def test_retry_after_is_honoured(self):
+        with self.upstream(upstream_response(503, headers={'Retry-After': '7'}), upstream_response()):
+            self.service._handle_request('get', 'facilities')
+        self.assertGreaterEqual(self.sleep.call_args.args[0], 7)
+
+    def test_deadline_budget_stops_retries(self):
+        self.service.retry_policy = RetryPolicy(max_attempts=5, base_delay=0.5, deadline=5)
+        with self.upstream(upstream_response(503, headers={'Retry-After': '60'})) as request:
+            with self.assertRaises(requests.HTTPError):
+                self.service._handle_request('get', 'facilities')
+        self.assertEqual(request.call_count, 1)
+
+    def test_decorrelated_jitter_stays_within_bounds(self):
+        policy = RetryPolicy(base_delay=1, max_delay=8)
+        delay = 1
+        for _ in range(50):
+            next_delay = policy.backoff(delay)
+            self.assertGreaterEqual(next_delay, 1)
+            self.assertLessEqual(next_delay, min(8, delay * 3))
+            delay = next_delay
+
+    def test_tenacity_decorator_uses_the_same_policy(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0, deadline=5)
+        calls = []
+
+        @tenacity.retry(**policy.tenacity_kwargs(method_arg=0))
+        def call(method):
+            calls.append(method)
+            raise requests.ConnectionError()
+
+        with self.assertRaises(requests.ConnectionError):
+            call('get')
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        with self.assertRaises(requests.ConnectionError):
+            call('post')
+        self.assertEqual(len(calls), 1)
+
+
+class CircuitBreakerTest(APITestCase):
+
+    def setUp(self):
+        response_cache().clear()
+        self.transport = ExternalAPIClient()
+        # A base URL per test keeps breakers and rate limiters apart
+        self.service = ExternalAPIService(
+            f"https://{self._testMethodName}.example/api",
+            client=self.transport,
+            retry_policy=RetryPolicy(max_attempts=1),
+        )
+
+    def fail_calls(self, count):
+        with mock.patch.object(self.transport.session, 'request', side_effect=requests.ConnectionError()):
+            for _ in range(count):
+                self.assertIn('error', self.service.get_lab_results('P1'))
+
+    def breaker(self, endpoint):
+        return circuit_breaker(f"{self.service.base_url}/{endpoint}")
+
+    def test_open_circuit_fails_fast(self):
+        self.fail_calls(config.CIRCUIT_FAILURE_THRESHOLD)
+        self.assertEqual(self.breaker('lab_results').state, CircuitBreaker.OPEN)
+        with mock.patch.object(self.transport.session, 'request') as request:
+            self.assertIn('error', self.service.get_lab_results('P1'))
+        request.assert_not_called()
+        self.assertEqual(self.breaker('lab_results').stats()['rejected'], 1)
+        # Other endpoints are unaffected
+        self.assertEqual(self.breaker('facilities').state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_closes_the_circuit(self):
+        self.fail_calls(config.CIRCUIT_FAILURE_THRESHOLD)
+        breaker = self.breaker('lab_results')
+        breaker.opened_at -= config.CIRCUIT_RESET_TIMEOUT
+        with mock.patch.object(self.transport.session, 'request', return_value=upstream_response(payload=[])):
+            self.assertEqual(self.service.get_lab_results('P1'), [])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_probe_is_released_when_the_rate_limiter_gives_up(self):
+        self.fail_calls(config.CIRCUIT_FAILURE_THRESHOLD)
+        breaker = self.breaker('lab_results')
+        breaker.opened_at -= config.CIRCUIT_RESET_TIMEOUT
+        with mock.patch.object(self.service.rate_limiter, 'acquire', return_value=False):
+            self.assertIn('error', self.service.get_lab_results('P1'))
+        self.assertFalse(breaker.probing)
+        with mock.patch.object(self.transport.session, 'request', return_value=upstream_response(payload=[])) as request:
+            self.assertEqual(self.service.get_lab_results('P1'), [])
+        request.assert_called_once()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.fail_calls(config.CIRCUIT_FAILURE_THRESHOLD)
+        breaker = self.breaker('lab_results')
+        breaker.opened_at -= config.CIRCUIT_RESET_TIMEOUT
+        self.fail_calls(1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.stats()['times_opened'], 2)
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        with mock.patch.object(self.transport.session, 'request', return_value=upstream_response(404)):
+            for _ in range(config.CIRCUIT_FAILURE_THRESHOLD + 1):
+                self.service.get_patient('P1')
+        self.assertEqual(self.breaker('patient_detail').state, CircuitBreaker.CLOSED)
+
+    def test_open_circuit_serves_stale_cached_response(self):
+        with mock.patch.object(config, 'CACHE_TIMEOUTS', {'facilities': 0.01}):
+            with mock.patch.object(self.transport.session, 'request', return_value=upstream_response(payload=[{'name': "Clinic"}])):
+                self.service.get_facilities()
+            time.sleep(0.02)
+            breaker = self.breaker('facilities')
+            for _ in range(config.CIRCUIT_FAILURE_THRESHOLD):
+                breaker.record_failure(requests.ConnectionError())
+            with mock.patch.object(self.transport.session, 'request') as request:
+                self.assertEqual(self.service.get_facilities(), [{'name': "Clinic"}])
+            request.assert_not_called()
+
+    def test_status_endpoint(self):
+        self.fail_calls(1)
+        admin = User.objects.create_superuser(username="admin", password="pass12345")
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/external-api/status/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['circuits'][f"{self.service.base_url}/lab_results"]['consecutive_failures'], 1)
+        self.assertIn('hit_ratio', response.data['response_cache'])
@@ -0,0 +1,295 @@
+import hashlib
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import external_api_config as config
+
+PERIODS = {
+    's': 1, 'sec': 1, 'second': 1,
+    'm': 60, 'min': 60, 'minute': 60,
+    'h': 3600, 'hour': 3600,
+    'd': 86400, 'day': 86400,
+}
+RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*$')
+
+
+def parse_rate(rate):
+    """
+    Parse "100/min", "100/30s" or "10000/day" into (calls, period_seconds)
+    """
+    match = RATE_RE.match(rate.lower())
+    if not match or match.group(3) not in PERIODS:
+        raise ValueError(f"Invalid rate: {rate!r}")
+    calls, multiplier, unit = match.groups()
+    return int(calls), int(multiplier or 1) * PERIODS[unit]
+
+
+class LocalWindowStore:
+    """
+    Per-process window counters, for single-node deployments. Counters
+    older than two windows are pruned as new windows start.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._pruned_at = 0
+
+    def hit(self, key, window, period):
+        """Increment the current window; return (previous, current) counts"""
+        now = time.monotonic()
+        with self._lock:
+            current = self._counts.get((key, window), 0) + 1
+            self._counts[(key, window)] = current
+            previous = self._counts.get((key, window - 1), 0)
+            if now - self._pruned_at > 60:
+                self._prune()
+                self._pruned_at = now
+        return previous, current
+
+    def peek(self, key, window):
+        """Return (previous, current) counts without incrementing"""
+        return self._counts.get((key, window - 1), 0), self._counts.get((key, window), 0)
+
+    def reset(self, key, window):
+        with self._lock:
+            self._counts.pop((key, window - 1), None)
+            self._counts.pop((key, window), None)
+
+    def refund(self, key, window):
+        """Take back one hit from a window"""
+        with self._lock:
+            count = self._counts.get((key, window), 0)
+            if count > 0:
+                self._counts[(key, window)] = count - 1
+
+    def _prune(self):
+        # Keys carry absolute window numbers; drop anything two periods old
+        now = time.time()
+        for (key, window), _ in list(self._counts.items()):
+            period = key[1]
+            if window < now // period - 1:
+                del self._counts[(key, window)]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class CacheWindowStore:
+    """Window counters in a shared Django cache, for multi-node deployments"""
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def hit(self, key, window, period):
+        name = f"throttle:{key[0]}:{key[1]}:"
+        current_key = f"{name}{window}"
+        # add() is a no-op if the counter exists; incr() is atomic on
+        # Redis and Memcached
+        self.cache.add(current_key, 0, period * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            self.cache.set(current_key, 1, period * 2)
+            current = 1
+        previous = self.cache.get(f"{name}{window - 1}", 0)
+        return previous, current
+
+    def peek(self, key, window):
+        name = f"throttle:{key[0]}:{key[1]}:"
+        counts = self.cache.get_many([f"{name}{window - 1}", f"{name}{window}"])
+        return counts.get(f"{name}{window - 1}", 0), counts.get(f"{name}{window}", 0)
+
+    def reset(self, key, window):
+        name = f"throttle:{key[0]}:{key[1]}:"
+        self.cache.delete_many([f"{name}{window - 1}", f"{name}{window}"])
+
+    def refund(self, key, window):
+        try:
+            self.cache.decr(f"throttle:{key[0]}:{key[1]}:{window}")
+        except ValueError:
+            # The counter already expired
+            pass
+
+    def clear(self):
+        pass
+
+
+_local_store = LocalWindowStore()
+
+
+def get_store(setting='EXTERNAL_API_THROTTLE_CACHE'):
+    """The shared cache store named by `setting`, else the in-process one"""
+    alias = getattr(settings, setting, None)
+    return CacheWindowStore(alias) if alias else _local_store
+
+
+def sliding_window_hit(store, key, calls, period, now=None):
+    """
+    Count one request against a sliding window of `period` seconds.
+
+    The window is approximated from two fixed windows: the previous
+    window's count, weighted by how much of it still overlaps the sliding
+    window, plus the current window's count. This needs two counters per
+    key, whatever the request rate.
+
+    Returns (allowed, remaining, reset_seconds).
+    """
+    now = time.time() if now is None else now
+    window = int(now // period)
+    elapsed = (now % period) / period
+    previous, current = store.hit((key, period), window, period)
+    estimate = previous * (1 - elapsed) + current
+
+    if estimate <= calls:
+        return True, int(calls - estimate), math.ceil(period - now % period)
+
+    # Time until enough of the previous window slides out (or, if the
+    # current window alone is over the limit, until it ends)
+    if previous and current <= calls:
+        wait = ((previous + current - calls) / previous - elapsed) * period
+    else:
+        wait = period - now % period
+    return False, 0, max(1, math.ceil(wait))
+
+
+def default_rates():
+    rates = [f"{config.RATE_LIMIT_CALLS}/{config.RATE_LIMIT_PERIOD}s"]
+    quota = getattr(settings, 'EXTERNAL_API_DAILY_QUOTA', None)
+    if quota:
+        rates.append(f"{quota}/day")
+    return rates
+
+
+class ExternalAPIRateThrottle(BaseThrottle):
+    """
+    Per-token sliding-window rate limit and quota for the external API.
+
+    Each token (or user, or client IP for anonymous calls) gets the limits
+    listed for its username in EXTERNAL_API_THROTTLE_RATES, falling back to
+    the "default" entry and then to RATE_LIMIT_CALLS per RATE_LIMIT_PERIOD
+    from api.external_api_config plus EXTERNAL_API_DAILY_QUOTA. Counters
+    are kept in process, or in the cache named by
+    EXTERNAL_API_THROTTLE_CACHE when several nodes serve the API.
+
+    The tightest limit is reported in X-RateLimit-* headers by
+    RateLimitHeadersMiddleware; rejected calls get 429 with Retry-After.
+    """
+
+    def get_ident_key(self, request):
+        token = getattr(request.auth, 'key', None)
+        if token:
+            # Counters are keyed by a digest, never the token itself
+            return 'token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def get_rates(self, request):
+        configured = getattr(settings, 'EXTERNAL_API_THROTTLE_RATES', {})
+        username = request.user.get_username() if request.user and request.user.is_authenticated else None
+        rates = configured.get(username) or configured.get('default') or default_rates()
+        return [parse_rate(rate) for rate in rates]
+
+    def allow_request(self, request, view):
+        store = get_store()
+        key = self.get_ident_key(request)
+        now = time.time()
+
+        self._wait = None
+
+        # Count against every limit first, like LoginThrottle.reserve(), so
+        # concurrent requests cannot all pass a check made before any of
+        # them is counted. A rejected request is then taken back from every
+        # window, so it does not use up the ones it did fit in.
+        reserved = []
+        tightest = None
+        for calls, period in self.get_rates(request):
+            allowed, remaining, reset = sliding_window_hit(store, key, calls, period, now)
+            reserved.append(((key, period), int(now // period)))
+            if not allowed and reset > (self._wait or 0):
+                self._wait = reset
+                tightest = (calls, 0, reset)
+            elif self._wait is None and (tightest is None or remaining < tightest[1]):
+                tightest = (calls, remaining, reset)
+        if tightest is not None:
+            # Picked up by RateLimitHeadersMiddleware
+            request._request.rate_limit = tightest
+        if self._wait is None:
+            return True
+        for counter, window in reserved:
+            store.refund(counter, window)
+        return False
+
+    def wait(self):
+        return self._wait
+
+
+class LoginThrottle:
+    """
+    Failed login counters per username and per client IP.
+
+    Each attempt reserves a slot under the limits in LOGIN_FAILURE_LIMITS
+    before the password is hashed: the counters are incremented first, so
+    concurrent attempts cannot all pass a check made before any of them is
+    counted. Attempts over a limit are rejected and their slot handed back;
+    a successful login hands its slot back too and clears the username's
+    counter, so only failures stay counted. Unknown usernames are counted
+    like real ones, so rejections do not reveal which accounts exist.
+    Counters are kept in process, or in the cache named by
+    LOGIN_THROTTLE_CACHE.
+    """
+
+    def __init__(self, request, username):
+        self.store = get_store('LOGIN_THROTTLE_CACHE')
+        normalized = str(username).strip().lower().encode('utf-8')
+        # The socket address, not get_ident(): X-Forwarded-For is set by the
+        # client unless NUM_PROXIES says which proxies to trust
+        ip = request.META.get('REMOTE_ADDR', '')
+        self.keys = [
+            ('login-user:' + hashlib.sha256(normalized).hexdigest()[:32], 'username'),
+            (f'login-ip:{ip}', 'ip'),
+        ]
+        self._reserved = []
+
+    def _limits(self):
+        limits = getattr(settings, 'LOGIN_FAILURE_LIMITS', {'username': '5/15m', 'ip': '50/15m'})
+        for key, scope in self.keys:
+            if limits.get(scope):
+                yield (key,) + parse_rate(limits[scope])
+
+    def reserve(self):
+        """
+        Count this attempt against every limit. Returns None if it may go
+        ahead, else the seconds to wait (and nothing stays counted).
+        """
+        now = time.time()
+        waits = []
+        for key, calls, period in self._limits():
+            allowed, remaining, reset = sliding_window_hit(self.store, key, calls, period, now)
+            self._reserved.append(((key, period), int(now // period)))
+            if not allowed:
+                waits.append(reset)
+        if waits:
+            self._refund()
+            return max(waits)
+        return None
+
+    def _refund(self):
+        for key, window in self._reserved:
+            self.store.refund(key, window)
+        self._reserved = []
+
+    def succeeded(self):
+        self._refund()
+        now = time.time()
+        for key, calls, period in self._limits():
+            if key.startswith('login-user:'):
+                self.store.reset((key, period), int(now // period))
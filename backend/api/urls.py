@@ -5,8 +5,9 @@ from .views import (
     HealthProgramViewSet, ClientViewSet, EnrollmentViewSet, 
     ProgramCategoryViewSet, login_view, logout_view, 
     get_csrf_token, get_user_info, dashboard_summary,
-    register_client, program_search, client_search,
-    external_client_profile, check_program_code_unique
+    register_client, register_clients_bulk, program_search,
+    external_client_profile, external_client_sync, check_program_code_unique,
+    change_feed, admission_status, external_api_status
 )
 
 router = DefaultRouter()
@@ -16,8 +17,6 @@ router.register(r'enrollments', EnrollmentViewSet)
 router.register(r'program-categories', ProgramCategoryViewSet)
 
 urlpatterns = [
-    path('', include(router.urls)),
-    
     # Authentication endpoints
     path('auth/login/', login_view, name='api_login'),
     path('auth/logout/', logout_view, name='api_logout'),
@@ -26,19 +25,28 @@ urlpatterns = [
     
     # Registration endpoint
     path('clients/register/', register_client, name='register_client'),
+    path('clients/register/bulk/', register_clients_bulk, name='register_clients_bulk'),
     
     # Token authentication
     path('auth/token/', obtain_auth_token, name='api_token_auth'),
     
     # Dashboard data
     path('dashboard/', dashboard_summary, name='dashboard_summary'),
+    path('admission/', admission_status, name='admission_status'),
+    path('external-api/status/', external_api_status, name='external_api_status'),
     
     # Search endpoints
     path('programs/search/', program_search, name='program_search'),
     path('programs/check-code-unique/', check_program_code_unique, name='check_program_code_unique'),
-    path('clients/search/', client_search, name='client_search'),
+    # clients/search/ is the ClientViewSet.search action on the router
     
     # External API endpoints
     path('external/clients/', external_client_profile, name='external_client_list'),
+    path('external/clients/sync/', external_client_sync, name='external_client_sync'),
+    path('external/changes/', change_feed, name='change_feed'),
     path('external/clients/<uuid:client_id>/', external_client_profile, name='external_client_detail'),
+    
+    # Router last, so its <pk> routes do not take clients/register/ and
+    # programs/search/ as primary keys
+    path('', include(router.urls)),
 ] 
\ No newline at end of file
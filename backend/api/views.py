@@ -1,22 +1,27 @@
 from rest_framework import viewsets, permissions, status, filters
-from rest_framework.decorators import api_view, permission_classes, action, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, action, authentication_classes, throttle_classes
 from rest_framework.response import Response
-from django.db.models import Count, Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Prefetch
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import authenticate, login, logout
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 from django.contrib.auth.models import User
 from django.http import JsonResponse
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+import datetime
 
 from health_programs.models import HealthProgram, ProgramCategory
-from clients.models import Client, Enrollment
+from clients.models import ArchivedEnrollment, Client, Enrollment, record_enrollment_changes
+from locations.lookup import locations
 from .serializers import (
     ClientSerializer, 
     HealthProgramSerializer, 
@@ -25,10 +30,31 @@ from .serializers import (
     EnrollmentUpdateSerializer,
     ClientDetailSerializer,
     EnrollClientSerializer,
+    BulkEnrollSerializer,
+    SetActiveSerializer,
+    BulkDeactivateSerializer,
+    ArchivedEnrollmentSerializer,
     UserSerializer,
     ClientRegistrationSerializer,
-    ExternalClientProfileSerializer
+    ExternalClientProfileSerializer,
+    ChangeEventSerializer
 )
+from .admission import get_controller
+from .authentication import CachedTokenAuthentication
+from .change_feed import commit_horizon, read_changes, wait_for_changes
+from .external_api_service import upstream_status
+from .bulk_enrollment import bulk_enroll
+from .bulk_import import ClientImporter, CSVUploadParser, NDJSONUploadParser, detect_format, read_rows
+from .idempotency import idempotent
+from .conditional import ConditionalGetMixin, get_validators, not_modified_response, set_validator_headers
+from .pagination import KeysetPagination, SyncFeedPagination
+from .password_hashing import PasswordHashingBusy
+from .throttling import ExternalAPIRateThrottle, LoginThrottle
+
+
+def include_archived(request):
+    """Whether the request asked for archived enrollments (?include_archived=true)"""
+    return request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
 
 # Authentication views
 @api_view(['POST'])
@@ -44,15 +70,28 @@ def login_view(request):
             'detail': 'Please provide both username and password.'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    throttle = LoginThrottle(request, username)
+    retry_after = throttle.reserve()
+    if retry_after is not None:
+        # Rejected before authenticate() spends time hashing the password
+        response = Response({
+            'success': False,
+            'detail': 'Too many failed login attempts. Please try again later.'
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(retry_after)
+        return response
+    
     user = authenticate(request, username=username, password=password)
     
     if user is not None:
+        throttle.succeeded()
         login(request, user)
         # Return user data with a success indicator
         user_data = UserSerializer(user).data
         user_data['success'] = True
         return Response(user_data)
     else:
+        # The reserved attempt stays counted as a failure
         return Response({
             'success': False,
             'detail': 'Invalid credentials. Please check your username and password.'
@@ -81,11 +120,14 @@ def get_user_info(request):
         return Response({'authenticated': False, 'detail': 'Not authenticated'}, status=status.HTTP_200_OK)
     return Response(UserSerializer(request.user).data)
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-client_id')
+    conditional_dependencies = (HealthProgram,)
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['county', 'sub_county', 'gender']
+    filterset_fields = ['county', 'sub_county', 'gender', 'county_ref', 'sub_county_ref', 'ward_ref']
     search_fields = ['first_name', 'last_name', 'id_number', 'phone_number']
     
     def get_serializer_class(self):
@@ -93,12 +135,69 @@ class ClientViewSet(viewsets.ModelViewSet):
             return ClientDetailSerializer
         return ClientSerializer
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_archived'] = include_archived(self.request)
+        return context
+    
+    def get_conditional_validators(self, queryset):
+        # The detail view nests archived enrollments on request. Archiving
+        # and restoring write change events, which move the validators.
+        return get_validators(
+            queryset,
+            self.conditional_dependencies,
+            type(self).__name__,
+            self.action,
+            getattr(self.request, 'accepted_media_type', ''),
+            include_archived(self.request),
+        )
+    
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'])
     def enrollments(self, request, pk=None):
         client = self.get_object()
         enrollments = Enrollment.objects.filter(client=client)
         serializer = EnrollmentSerializer(enrollments, many=True)
-        return Response(serializer.data)
+        data = serializer.data
+        if include_archived(request):
+            archived = client.archived_enrollments.select_related('client', 'program')
+            data = list(data) + ArchivedEnrollmentSerializer(archived, many=True).data
+        return Response(data)
+    
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='bulk-import',
+        permission_classes=[permissions.IsAdminUser],
+        parser_classes=[CSVUploadParser, NDJSONUploadParser, MultiPartParser],
+    )
+    def bulk_import(self, request):
+        """
+        Import many clients from a CSV or NDJSON body (Content-Type text/csv
+        or application/x-ndjson), or from a multipart upload in the 'file'
+        field. Returns counts and a per-row error report.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            stream = upload.file
+            input_format = detect_format(upload.content_type, upload.name)
+        else:
+            stream = request.data
+            input_format = detect_format(request.content_type)
+        
+        if input_format is None or not hasattr(stream, 'read'):
+            return Response(
+                {"error": "Send CSV (text/csv) or NDJSON (application/x-ndjson) data."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        report = ClientImporter(dry_run=dry_run).run(read_rows(stream, input_format))
+        response_status = status.HTTP_201_CREATED if report.created else status.HTTP_200_OK
+        return Response(report.as_dict(), status=response_status)
     
     @action(detail=False, methods=['get'])
     def search(self, request):
@@ -119,9 +218,11 @@ class ClientViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(clients, many=True)
         return Response(serializer.data)
 
-class HealthProgramViewSet(viewsets.ModelViewSet):
+class HealthProgramViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = HealthProgram.objects.all()
     serializer_class = HealthProgramSerializer
+    conditional_dependencies = (ProgramCategory,)
+    response_cache_timeout = 300
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'code', 'description']
     
@@ -136,9 +237,10 @@ class HealthProgramViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
-class ProgramCategoryViewSet(viewsets.ModelViewSet):
+class ProgramCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = ProgramCategory.objects.all()
     serializer_class = ProgramCategorySerializer
+    response_cache_timeout = 300
     
     def get_permissions(self):
         """
@@ -154,6 +256,8 @@ class ProgramCategoryViewSet(viewsets.ModelViewSet):
 class EnrollmentViewSet(viewsets.ModelViewSet):
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-enrollment_date', '-id')
     
     def get_serializer_class(self):
         if self.action in ['update', 'partial_update']:
@@ -161,6 +265,7 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
         return EnrollmentSerializer
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def enroll_client(self, request):
         serializer = EnrollClientSerializer(data=request.data)
         if serializer.is_valid():
@@ -171,15 +276,77 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def bulk_enroll(self, request):
+        """
+        Enroll a list of clients, or every client matching a filter, in one
+        program. Reports created, reactivated, already active and failed counts.
+        """
+        serializer = BulkEnrollSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        result = bulk_enroll(
+            serializer.program,
+            client_ids=serializer.validated_data.get('client_ids'),
+            client_filter=serializer.validated_data.get('filter'),
+            fields=serializer.get_enrollment_fields(),
+        )
+        return Response(result.as_dict())
+    
+    def _update_active(self, update):
+        """
+        Apply a single-statement is_active update to the requested enrollment
+        and return its new state, or None if it was deleted meanwhile.
+        """
+        # get_object() turns a missing or malformed pk into a 404 and runs
+        # the object permission checks
+        enrollment = self.get_object()
+        queryset = Enrollment.objects.filter(pk=enrollment.pk)
+        with transaction.atomic():
+            if not update(queryset):
+                return None
+            # The UPDATE holds the row lock, so this reads our own write
+            row = queryset.values_list('id', 'client_id', 'program_id', 'is_active').get()
+            record_enrollment_changes([row[:3]])
+        return row[3]
+    
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
-        enrollment = self.get_object()
-        enrollment.is_active = not enrollment.is_active
-        enrollment.save()
+        is_active = self._update_active(lambda queryset: queryset.toggle_active())
+        if is_active is None:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
         return Response({
             'status': 'success',
-            'is_active': enrollment.is_active
+            'is_active': is_active
         })
+    
+    @action(detail=True, methods=['post'])
+    def set_active(self, request, pk=None):
+        serializer = SetActiveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        value = serializer.validated_data['is_active']
+        is_active = self._update_active(lambda queryset: queryset.set_active(value))
+        if is_active is None:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'status': 'success',
+            'is_active': is_active
+        })
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def bulk_deactivate(self, request):
+        """
+        Deactivate every active enrollment matching the given criteria, e.g.
+        all enrollments in programs whose end date has passed, in chunked
+        UPDATEs that each lock at most `batch_size` rows.
+        """
+        serializer = BulkDeactivateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        deactivated = serializer.get_queryset().deactivate_in_batches()
+        return Response({'status': 'success', 'deactivated': deactivated})
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -223,12 +390,14 @@ def dashboard_summary(request):
     # Sort by count, descending
     enrollments_by_program.sort(key=lambda x: x['count'], reverse=True)
     
-    # Get clients by county
+    # Get clients by county, grouping on the small county key and naming
+    # the groups from the cached lookup
+    county_names = {county.pk: county.name for county in locations.counties()}
     clients_by_county = []
-    counties = Client.objects.values('county').annotate(count=Count('county')).order_by('-count')
+    counties = Client.objects.values('county_ref').annotate(count=Count('pk')).order_by('-count')
     for county in counties:
         clients_by_county.append({
-            'county': county['county'],
+            'county': county_names.get(county['county_ref'], 'Unknown'),
             'count': county['count']
         })
     
@@ -248,27 +417,6 @@ def dashboard_summary(request):
         'clients_by_county': clients_by_county
     })
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def client_search(request):
-    """
-    Search clients by various parameters
-    """
-    query = request.query_params.get('q', '')
-    if not query:
-        return Response({'results': []})
-    
-    clients = Client.objects.filter(
-        Q(first_name__icontains=query) | 
-        Q(last_name__icontains=query) | 
-        Q(id_number__icontains=query) |
-        Q(phone_number__icontains=query) |
-        Q(email__icontains=query)
-    )
-    
-    serializer = ClientSerializer(clients, many=True)
-    return Response({'results': serializer.data})
-
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def program_search(request):
@@ -305,6 +453,7 @@ def check_program_code_unique(request):
 @api_view(['POST'])
 @authentication_classes([])  # No authentication required
 @permission_classes([permissions.AllowAny])
+@idempotent
 def register_client(request):
     """
     Register a new client with a user account
@@ -319,6 +468,11 @@ def register_client(request):
                 'message': 'Registration successful.',
                 'client_id': client.client_id,
             }, status=status.HTTP_201_CREATED)
+        except PasswordHashingBusy as e:
+            return Response({
+                'success': False,
+                'detail': str(e)
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
         except Exception as e:
             return Response({
                 'success': False,
@@ -330,6 +484,49 @@ def register_client(request):
         'detail': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def register_clients_bulk(request):
+    """
+    Register a batch of clients with user accounts, for assisted
+    registration drives. Passwords are hashed in parallel and the batch is
+    saved in one transaction: either every row is registered or none is.
+    """
+    rows = request.data.get('clients') if isinstance(request.data, dict) else request.data
+    if not isinstance(rows, list) or not rows:
+        return Response({
+            'success': False,
+            'detail': 'Provide a non-empty list of registrations.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    max_size = getattr(settings, 'BULK_REGISTRATION_MAX_SIZE', 500)
+    if len(rows) > max_size:
+        return Response({
+            'success': False,
+            'detail': f'At most {max_size} registrations per request.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = ClientRegistrationSerializer(data=rows, many=True)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'detail': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        clients = serializer.save()
+    except PasswordHashingBusy as e:
+        return Response({
+            'success': False,
+            'detail': str(e)
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+    
+    return Response({
+        'success': True,
+        'created': len(clients),
+        'client_ids': [client.client_id for client in clients],
+    }, status=status.HTTP_201_CREATED)
+
 @swagger_auto_schema(
     method='get',
     operation_description="Retrieve client profiles for external systems",
@@ -337,6 +534,7 @@ def register_client(request):
         openapi.Parameter('id_number', openapi.IN_QUERY, description="Filter by national ID number", type=openapi.TYPE_STRING),
         openapi.Parameter('phone', openapi.IN_QUERY, description="Filter by phone number", type=openapi.TYPE_STRING),
         openapi.Parameter('updated_since', openapi.IN_QUERY, description="Filter by last update time (ISO format)", type=openapi.TYPE_STRING),
+        openapi.Parameter('include_archived', openapi.IN_QUERY, description="Also return archived enrollments", type=openapi.TYPE_BOOLEAN),
     ],
     responses={
         200: ExternalClientProfileSerializer(many=True),
@@ -347,8 +545,9 @@ def register_client(request):
     tags=['External API']
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ExternalAPIRateThrottle])
 def external_client_profile(request, client_id=None):
     """
     API endpoint to expose client profile data for external systems.
@@ -363,6 +562,7 @@ def external_client_profile(request, client_id=None):
     - id_number: Filter by national ID number
     - phone: Filter by phone number
     - updated_since: Filter clients updated after this datetime (ISO format)
+    - include_archived: Also return archived (long inactive) enrollments
     
     Returns:
     - 200 OK: Client profile data
@@ -379,7 +579,14 @@ def external_client_profile(request, client_id=None):
     updated_since = request.query_params.get('updated_since', None)
     
     # Start with all clients
-    queryset = Client.objects.all()
+    queryset = Client.objects.prefetch_related(
+        Prefetch('enrollment_set', queryset=Enrollment.objects.select_related('program'))
+    )
+    archived = include_archived(request)
+    if archived:
+        queryset = queryset.prefetch_related(
+            Prefetch('archived_enrollments', queryset=ArchivedEnrollment.objects.select_related('program'))
+        )
     
     # Apply filters if provided
     if id_number:
@@ -395,23 +602,189 @@ def external_client_profile(request, client_id=None):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    if client_id:
+        queryset = queryset.filter(client_id=client_id)
+    
+    # Answer conditional requests before serializing anything. Archiving
+    # and restoring write change events, so archived rows need no aggregate.
+    etag, last_modified = get_validators(
+        queryset, (HealthProgram,), 'external_client_profile', client_id, archived,
+    )
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    
     # If client_id is provided, get that specific client
     if client_id:
         try:
-            client = queryset.get(client_id=client_id)
-            serializer = ExternalClientProfileSerializer(client)
-            return Response(serializer.data)
+            client = queryset.get()
+            serializer = ExternalClientProfileSerializer(client, context={'include_archived': archived})
+            response = Response(serializer.data)
         except Client.DoesNotExist:
             return Response(
                 {"error": f"Client with ID {client_id} not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+    else:
+        # Otherwise, return paginated list of clients
+        paginator = PageNumberPagination()
+        paginator.page_size = 10
+        
+        paginated_clients = paginator.paginate_queryset(queryset, request)
+        serializer = ExternalClientProfileSerializer(
+            paginated_clients, many=True, context={'include_archived': archived}
+        )
+        response = paginator.get_paginated_response(serializer.data)
+    
+    return set_validator_headers(response, etag, last_modified) 
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Incremental sync feed of client profiles for external systems",
+    manual_parameters=[
+        openapi.Parameter('since_token', openapi.IN_QUERY, description="Continuation token from the previous response", type=openapi.TYPE_STRING),
+        openapi.Parameter('updated_since', openapi.IN_QUERY, description="Start of the first sync when no token is held yet (ISO format)", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of clients per page", type=openapi.TYPE_INTEGER),
+    ],
+    responses={
+        200: ExternalClientProfileSerializer(many=True),
+        400: "Bad request. Invalid updated_since value.",
+        401: "Unauthorized. Authentication credentials were not provided or are invalid.",
+        404: "Not found. The since_token is invalid.",
+    },
+    security=[{"Token": []}],
+    tags=['External API']
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ExternalAPIRateThrottle])
+def external_client_sync(request):
+    """
+    Incremental sync feed of client profiles for external systems.
+    
+    Clients are returned in ascending (updated_at, client_id) order, each with
+    its enrollments. A change to any enrollment marks its client as updated,
+    so the client is sent again with its current enrollments.
+    
+    Query Parameters:
+    - since_token: Opaque token returned as next_token by the previous call
+    - updated_since: Starting point for the first sync (ISO format)
+    - page_size: Number of clients per page (default EXTERNAL_SYNC_PAGE_SIZE)
     
-    # Otherwise, return paginated list of clients
-    paginator = PageNumberPagination()
-    paginator.page_size = 10
+    Returns:
+    - next_token: Token to pass on the next call, even when no rows were returned
+    - has_more: Whether more changes are available right now
+    - results: Client profiles
     
-    paginated_clients = paginator.paginate_queryset(queryset, request)
-    serializer = ExternalClientProfileSerializer(paginated_clients, many=True)
+    Rows changed after the start of the oldest transaction still writing, and
+    in the last EXTERNAL_SYNC_SAFETY_LAG seconds, are held back so that
+    transactions still in flight cannot commit behind a consumer's token.
+    """
+    queryset = Client.objects.filter(
+        updated_at__lte=commit_horizon(getattr(settings, 'EXTERNAL_SYNC_SAFETY_LAG', 2))
+    ).prefetch_related(
+        Prefetch('enrollment_set', queryset=Enrollment.objects.select_related('program'))
+    )
     
-    return paginator.get_paginated_response(serializer.data) 
\ No newline at end of file
+    updated_since = request.query_params.get('updated_since')
+    if updated_since and not request.query_params.get('since_token'):
+        try:
+            since = parse_datetime(updated_since)
+        except ValueError:
+            since = None
+        if since is None:
+            return Response(
+                {"error": "Invalid date format for updated_since. Use ISO format (YYYY-MM-DDTHH:MM:SS)."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        queryset = queryset.filter(updated_at__gte=since)
+    
+    paginator = SyncFeedPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = ExternalClientProfileSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Sequenced change feed for clients, enrollments and health programs",
+    manual_parameters=[
+        openapi.Parameter('after', openapi.IN_QUERY, description="Return events with a sequence greater than this (default 0)", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('limit', openapi.IN_QUERY, description="Maximum number of events to return", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('wait', openapi.IN_QUERY, description="Seconds to wait for new events when none are available (long-poll)", type=openapi.TYPE_INTEGER),
+    ],
+    responses={
+        200: ChangeEventSerializer(many=True),
+        400: "Bad request. Invalid after, limit or wait value.",
+        401: "Unauthorized. Authentication credentials were not provided or are invalid.",
+    },
+    security=[{"Token": []}],
+    tags=['External API']
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ExternalAPIRateThrottle])
+def change_feed(request):
+    """
+    Change feed backed by the transactional outbox.
+    
+    Every create, update and delete of a Client, Enrollment or HealthProgram
+    is recorded with a monotonically increasing sequence number. Deletes are
+    reported as 'delete' events (tombstones) so consumers can remove rows.
+    Enrollments moved to the archive are reported as 'archive' events.
+    
+    Query Parameters:
+    - after: Sequence number of the last event already processed
+    - limit: Maximum number of events to return (default 500, max 5000)
+    - wait: Long-poll up to this many seconds when there are no new events
+    
+    Returns:
+    - events: Change events in sequence order
+    - last_sequence: Value to pass as `after` on the next call
+    - has_more: Whether more events are available right now
+    """
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', 500))
+        wait = float(request.query_params.get('wait', 0))
+    except ValueError:
+        return Response(
+            {"error": "after, limit and wait must be numbers."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    limit = max(1, min(limit, 5000))
+    wait = max(0, min(wait, getattr(settings, 'CHANGE_FEED_MAX_WAIT', 30)))
+    
+    if wait:
+        events, has_more = wait_for_changes(after, limit, wait)
+    else:
+        events, has_more = read_changes(after, limit)
+    
+    return Response({
+        'events': ChangeEventSerializer(events, many=True).data,
+        'last_sequence': events[-1].id if events else after,
+        'has_more': has_more,
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def admission_status(request):
+    """
+    Admission control counters for this process: per request class, the
+    concurrency budget, requests in flight, queue depth, and totals of
+    admitted, queued and shed requests since the process started.
+    """
+    return Response(get_controller().stats())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def external_api_status(request):
+    """
+    Outbound external API health for this process: the state of each
+    upstream endpoint's circuit breaker and response cache statistics.
+    """
+    return Response(upstream_status())
@@ -1,10 +1,10 @@
 from django.contrib import admin
-from .models import Client, Enrollment
+from .models import ArchivedEnrollment, Client, Enrollment
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
     list_display = ('get_full_name', 'id_number', 'phone_number', 'gender', 'county', 'date_of_birth')
-    list_filter = ('gender', 'county')
+    list_filter = ('gender', 'county_ref')
     search_fields = ('first_name', 'last_name', 'id_number', 'phone_number', 'email')
     date_hierarchy = 'created_at'
     
@@ -18,4 +18,11 @@ class EnrollmentAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'enrollment_date', 'program')
     search_fields = ('client__first_name', 'client__last_name', 'program__name', 'notes')
     date_hierarchy = 'enrollment_date'
-    raw_id_fields = ('client', 'program') 
\ No newline at end of file
+    raw_id_fields = ('client', 'program')
+
+@admin.register(ArchivedEnrollment)
+class ArchivedEnrollmentAdmin(admin.ModelAdmin):
+    list_display = ('client', 'program', 'enrollment_date', 'archived_at')
+    list_filter = ('archived_at', 'program')
+    search_fields = ('client__first_name', 'client__last_name', 'program__name')
+    raw_id_fields = ('client', 'program')
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class ClientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clients'
-    verbose_name = 'Clients Management' 
\ No newline at end of file
+    verbose_name = 'Clients Management'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,74 @@
+from django.db import transaction
+
+from api.models import ChangeEvent, deletes_recorded_as
+
+from .models import ArchivedEnrollment, Enrollment, record_enrollment_changes
+
+
+def archive_enrollments(cutoff, batch_size=1000):
+    """
+    Move inactive enrollments last changed before `cutoff` into the archive
+    table, `batch_size` rows per transaction. Returns the number moved.
+
+    Each batch is locked and re-checked before it moves, so an enrollment
+    reactivated in the meantime stays in the hot table. Moved rows are
+    reported on the change feed as 'archive' events, and their clients are
+    touched because their default profile, which omits archived
+    enrollments, has changed.
+    """
+    candidates = Enrollment.objects.filter(is_active=False, updated_at__lt=cutoff).order_by('id')
+    archived = 0
+    last_id = 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return archived
+        last_id = ids[-1]
+
+        with transaction.atomic():
+            rows = list(
+                Enrollment.objects.select_for_update()
+                .filter(id__in=ids, is_active=False, updated_at__lt=cutoff)
+            )
+            if not rows:
+                continue
+            ArchivedEnrollment.objects.bulk_create([ArchivedEnrollment.from_enrollment(row) for row in rows])
+            # The delete signals touch the clients and tell the change feed
+            # the rows were archived, not deleted; restore_enrollments()
+            # publishes them again
+            with deletes_recorded_as(ChangeEvent.ARCHIVE):
+                Enrollment.objects.filter(id__in=[row.id for row in rows]).delete()
+        archived += len(rows)
+
+
+def restore_enrollments(queryset, batch_size=1000):
+    """
+    Move archived enrollments selected by `queryset` back into the hot
+    table. Rows whose client has since been re-enrolled in the same program
+    stay archived. Returns a tuple of (restored, skipped).
+    """
+    queryset = queryset.order_by('id')
+    restored = skipped = 0
+    last_id = None
+    while True:
+        batch = queryset.filter(id__gt=last_id) if last_id is not None else queryset
+        ids = list(batch.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return restored, skipped
+        last_id = ids[-1]
+
+        with transaction.atomic():
+            rows = list(ArchivedEnrollment.objects.select_for_update().filter(id__in=ids))
+            taken = set(Enrollment.objects.filter(
+                client_id__in={row.client_id for row in rows},
+                program_id__in={row.program_id for row in rows},
+            ).values_list('client_id', 'program_id'))
+            movable = [row for row in rows if (row.client_id, row.program_id) not in taken]
+
+            # updated_at is reset on insert, so a restored row is not picked
+            # up again by the next archive run
+            Enrollment.objects.bulk_create([row.to_enrollment() for row in movable])
+            ArchivedEnrollment.objects.filter(id__in=[row.id for row in movable]).delete()
+            record_enrollment_changes([(row.id, row.client_id, row.program_id) for row in movable])
+        restored += len(movable)
+        skipped += len(rows) - len(movable)
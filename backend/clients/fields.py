@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+_uuid7_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """
+    Time-ordered UUID (RFC 9562 version 7).
+
+    The first 48 bits are the Unix time in milliseconds, so new keys land at
+    the end of a B-tree index instead of at random positions. Within one
+    millisecond a 12-bit counter, seeded randomly, keeps keys from this
+    process increasing; the remaining 62 bits are random.
+    """
+    global _last_ms, _counter
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # Counter exhausted: borrow the next millisecond
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+
+    value = (timestamp & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=value)
+
+
+def uuid_timestamp(value):
+    """Creation time in Unix milliseconds of a version 7 UUID, else None"""
+    if value.version != 7:
+        return None
+    return value.int >> 80
+
+
+class CompactUUIDField(models.UUIDField):
+    """
+    UUIDField whose values are sent to MySQL as BINARY(16) when
+    COMPACT_UUID_STORAGE is on.
+
+    Django stores UUIDs as char(32) on MySQL, which doubles the size of the
+    key and of every index and foreign key that repeats it. The columns are
+    converted by `manage.py convert_client_ids`; the setting only tells the
+    field which form the converted columns expect. Schema changes do not
+    depend on it, so migrations create the same char(32) columns whatever
+    the setting, and `convert_client_ids` must be rerun after a migration
+    adds or rebuilds a column holding client ids. Other backends keep
+    their native storage (uuid on PostgreSQL, char(32) elsewhere).
+    """
+
+    def _binary(self, connection):
+        return connection.vendor == 'mysql' and getattr(settings, 'COMPACT_UUID_STORAGE', False)
+
+    def get_internal_type(self):
+        # Own type name, so the MySQL backend's char(32) UUID converter is
+        # not applied to binary values; from_db_value handles both forms
+        return 'CompactUUIDField'
+
+    def db_type(self, connection):
+        return connection.data_types['UUIDField'] % self.db_type_parameters(connection)
+
+    def rel_db_type(self, connection):
+        return self.db_type(connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not self._binary(connection):
+            return super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = self.to_python(value)
+        return value.bytes
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return uuid.UUID(bytes=bytes(value))
+        return uuid.UUID(value)
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from clients.archive import archive_enrollments
+
+
+class Command(BaseCommand):
+    help = 'Moves long-inactive enrollments into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=getattr(settings, 'ENROLLMENT_ARCHIVE_AFTER_DAYS', 365),
+            help='Archive inactive enrollments not changed for this many days',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of enrollments moved per transaction',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        archived = archive_enrollments(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} enrollments inactive since before {cutoff:%Y-%m-%d}.'
+        ))
@@ -0,0 +1,65 @@
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from clients.models import Client
+from locations.lookup import locations
+
+
+class Command(BaseCommand):
+    help = 'Fills the county, sub-county and ward reference keys of existing clients from their text fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Clients resolved per batch',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-resolve every client, not only those without a county key',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Client.objects.all() if options['all'] else Client.objects.filter(county_ref__isnull=True)
+        queryset = queryset.order_by('client_id')
+        batch_size = options['batch_size']
+
+        resolved = 0
+        unresolved = Counter()
+        last_id = None
+        while True:
+            batch = queryset.filter(client_id__gt=last_id) if last_id else queryset
+            rows = list(batch.values_list('client_id', 'county', 'sub_county', 'ward')[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # One UPDATE per distinct location in the batch rather than per client
+            groups = defaultdict(list)
+            for client_id, county_name, sub_county_name, ward_name in rows:
+                county = locations.county(county_name)
+                if county is None:
+                    unresolved[county_name] += 1
+                    continue
+                sub_county = locations.sub_county(county, sub_county_name, create=True)
+                ward = locations.ward(sub_county, ward_name, create=True)
+                groups[(county, sub_county, ward)].append(client_id)
+
+            for (county, sub_county, ward), client_ids in groups.items():
+                # update() leaves updated_at alone: the client's visible data is unchanged
+                Client.objects.filter(client_id__in=client_ids).update(
+                    county_ref=county, sub_county_ref=sub_county, ward_ref=ward
+                )
+                resolved += len(client_ids)
+            self.stdout.write(f'Resolved {resolved} clients so far')
+
+        self.stdout.write(self.style.SUCCESS(f'Resolved {resolved} clients.'))
+        if unresolved:
+            self.stdout.write(self.style.WARNING(
+                f'{sum(unresolved.values())} clients have an unrecognised county:'
+            ))
+            for name, count in unresolved.most_common(20):
+                self.stdout.write(f'  {name!r}: {count}')
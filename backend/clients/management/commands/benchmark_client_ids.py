@@ -0,0 +1,60 @@
+import random
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from clients.fields import uuid7
+from clients.models import Client
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares insert and primary-key lookup speed for random (v4) and '
+        'time-ordered (v7) client ids. Rows are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20000, help='Clients inserted per run')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per INSERT')
+        parser.add_argument('--lookups', type=int, default=5000, help='Primary-key lookups per run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Backend: {connection.vendor}, client_id column: {Client._meta.pk.db_type(connection)}')
+        for label, generator in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+            inserted, looked_up = self._run(generator, options)
+            self.stdout.write(
+                f'{label}: {options["count"] / inserted:,.0f} inserts/s, '
+                f'{options["lookups"] / looked_up:,.0f} lookups/s'
+            )
+
+    def _run(self, generator, options):
+        count = options['count']
+        with transaction.atomic():
+            ids = [generator() for _ in range(count)]
+            started = time.perf_counter()
+            for start in range(0, count, options['chunk_size']):
+                Client.objects.bulk_create([
+                    Client(
+                        client_id=client_id,
+                        first_name='Bench',
+                        last_name='Mark',
+                        date_of_birth=date(1990, 1, 1),
+                        gender='O',
+                        county='Nairobi',
+                        sub_county='Westlands',
+                    )
+                    for client_id in ids[start:start + options['chunk_size']]
+                ])
+            inserted = time.perf_counter() - started
+
+            sample = random.sample(ids, min(options['lookups'], count))
+            started = time.perf_counter()
+            for client_id in sample:
+                Client.objects.filter(client_id=client_id).values_list('pk', flat=True).get()
+            looked_up = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+        return inserted, looked_up
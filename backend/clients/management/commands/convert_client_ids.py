@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import JobCheckpoint
+from clients.models import Client
+
+CHECKPOINT_NAME = 'convert_client_ids'
+
+
+class Command(BaseCommand):
+    help = (
+        'Converts client ids and the foreign keys that reference them from '
+        'char(32) to BINARY(16) on MySQL. Run it in a maintenance window, '
+        'then set COMPACT_UUID_STORAGE = True.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows converted per UPDATE',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the statements without running them',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('Binary client id storage is only used on MySQL.')
+
+        pk = Client._meta.pk
+        target = (Client._meta.db_table, pk.column)
+        references = [
+            (rel.related_model._meta.db_table, rel.field.column, rel.field.null)
+            for rel in Client._meta.related_objects
+            if rel.many_to_one or rel.one_to_one
+        ]
+        columns = [(Client._meta.db_table, pk.column, pk.null)] + references
+
+        # Foreign keys dropped by an interrupted run are remembered in a
+        # checkpoint, so a rerun restores them instead of losing them
+        checkpoint = None
+        saved = []
+        if not options['dry_run']:
+            checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+            saved = [tuple(fk) for fk in checkpoint.position.get('foreign_keys', [])]
+
+        # Migrations create char(32) columns whatever the setting, so columns
+        # added since the last conversion are picked up by a rerun
+        columns = [column for column in columns if self._column_type(column[0], column[1]) != 'binary']
+        if not columns and not saved:
+            self.stdout.write(self.style.SUCCESS('Client ids are already stored as BINARY(16).'))
+            return
+
+        quote = connection.ops.quote_name
+        existing = self._foreign_keys(references, target)
+        foreign_keys = saved + [fk for fk in existing if fk not in saved]
+        if checkpoint is not None:
+            checkpoint.save_position({'foreign_keys': [list(fk) for fk in foreign_keys]})
+
+        # 1. Drop the foreign keys so the key columns can change type
+        for table, column, name in foreign_keys:
+            if (table, column, name) in existing:
+                self._execute(f'ALTER TABLE {quote(table)} DROP FOREIGN KEY {quote(name)}', options)
+
+        # 2. Make the columns binary but still wide enough for the hex text
+        for table, column, null in columns:
+            self._execute(
+                f'ALTER TABLE {quote(table)} MODIFY {quote(column)} VARBINARY(32) {"NULL" if null else "NOT NULL"}',
+                options,
+            )
+
+        # 3. Decode the hex in short batches, so no statement holds locks for long
+        for table, column, _ in columns:
+            statement = (
+                f'UPDATE {quote(table)} SET {quote(column)} = UNHEX({quote(column)}) '
+                f'WHERE LENGTH({quote(column)}) = 32 LIMIT {int(options["batch_size"])}'
+            )
+            if options['dry_run']:
+                self.stdout.write(f'{statement};  -- repeated until no rows change')
+                continue
+            converted = 0
+            while True:
+                with connection.cursor() as cursor:
+                    cursor.execute(statement)
+                    if not cursor.rowcount:
+                        break
+                    converted += cursor.rowcount
+            self.stdout.write(f'{table}.{column}: converted {converted} rows')
+
+        # 4. Fix the final width and restore the foreign keys
+        for table, column, null in columns:
+            self._execute(
+                f'ALTER TABLE {quote(table)} MODIFY {quote(column)} BINARY(16) {"NULL" if null else "NOT NULL"}',
+                options,
+            )
+        for table, column, name in foreign_keys:
+            self._execute(
+                f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} FOREIGN KEY ({quote(column)}) '
+                f'REFERENCES {quote(target[0])} ({quote(target[1])})',
+                options,
+            )
+
+        if options['dry_run']:
+            return
+        checkpoint.save_position({})
+        self.stdout.write(self.style.SUCCESS('Client ids are now stored as BINARY(16).'))
+        if not getattr(settings, 'COMPACT_UUID_STORAGE', False):
+            self.stdout.write(self.style.WARNING(
+                'Set COMPACT_UUID_STORAGE = True before restarting the application.'
+            ))
+
+    def _foreign_keys(self, columns, target):
+        """(table, column, constraint name) of each foreign key to `target`"""
+        foreign_keys = []
+        with connection.cursor() as cursor:
+            for table, column, _ in columns:
+                for name, info in connection.introspection.get_constraints(cursor, table).items():
+                    if info['foreign_key'] == target and info['columns'] == [column]:
+                        foreign_keys.append((table, column, name))
+        return foreign_keys
+
+    def _column_type(self, table, column):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                [table, column]
+            )
+            row = cursor.fetchone()
+        return row[0].lower() if row else None
+
+    def _execute(self, statement, options):
+        if options['dry_run']:
+            self.stdout.write(f'{statement};')
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.archive import restore_enrollments
+from clients.models import ArchivedEnrollment
+
+
+class Command(BaseCommand):
+    help = 'Moves archived enrollments back into the enrollment table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', help='Restore the archived enrollments of this client id')
+        parser.add_argument('--program', type=int, help='Restore the archived enrollments of this program id')
+        parser.add_argument('--all', action='store_true', help='Restore every archived enrollment')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of enrollments moved per transaction',
+        )
+
+    def handle(self, *args, **options):
+        if not (options['client'] or options['program'] or options['all']):
+            raise CommandError('Give --client, --program or --all.')
+
+        queryset = ArchivedEnrollment.objects.all()
+        if options['client']:
+            queryset = queryset.filter(client_id=options['client'])
+        if options['program']:
+            queryset = queryset.filter(program_id=options['program'])
+
+        restored, skipped = restore_enrollments(queryset, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Restored {restored} enrollments.'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'{skipped} stayed archived because the client is enrolled in that program again.'
+            ))
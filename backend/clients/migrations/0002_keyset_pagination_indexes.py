@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['created_at', 'client_id'], name='client_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['enrollment_date', 'id'], name='enrollment_date_keyset_idx'),
+        ),
+    ]
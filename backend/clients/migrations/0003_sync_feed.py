@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['updated_at', 'client_id'], name='client_updated_keyset_idx'),
+        ),
+    ]
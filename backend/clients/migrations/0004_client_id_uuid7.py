@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:32
+
+import clients.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_sync_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='client_id',
+            field=clients.fields.CompactUUIDField(default=clients.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0002_seed_counties'),
+        ('clients', '0004_client_id_uuid7'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='county_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='clients', to='locations.county'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='sub_county_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='clients', to='locations.subcounty'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='ward_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='clients', to='locations.ward'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_programs', '0004_healthprogram_end_date_index'),
+        ('clients', '0005_client_location_refs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedEnrollment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('enrollment_date', models.DateField()),
+                ('is_active', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('facility_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('mfl_code', models.CharField(blank=True, max_length=10, null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_enrollments', to='clients.client')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_enrollments', to='health_programs.healthprogram')),
+            ],
+            options={
+                'verbose_name': 'Archived Enrollment',
+                'verbose_name_plural': 'Archived Enrollments',
+                'ordering': ['-enrollment_date'],
+            },
+        ),
+    ]
@@ -1,11 +1,15 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, Value, When
 from django.utils.translation import gettext_lazy as _
 from health_programs.models import HealthProgram
+from api.models import ChangeEvent, ChangeTrackedModel
+from locations.lookup import locations
+from locations.models import County, SubCounty, Ward
+from .fields import CompactUUIDField, uuid7
 from django.utils import timezone
-import uuid
 
 
-class Client(models.Model):
+class Client(ChangeTrackedModel):
     """
     Client/beneficiary of health programs
     """
@@ -15,8 +19,10 @@ class Client(models.Model):
         ('O', 'Other')
     ]
     
-    # Using UUID as client ID for better security and to avoid sequential IDs
-    client_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Using UUID as client ID for better security and to avoid sequential IDs.
+    # Version 7 UUIDs are time-ordered, so inserts append to the primary key
+    # index instead of splitting random pages.
+    client_id = CompactUUIDField(primary_key=True, default=uuid7, editable=False)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     id_number = models.CharField(max_length=20, unique=True, null=True, blank=True)
@@ -30,6 +36,18 @@ class Client(models.Model):
     sub_county = models.CharField(max_length=50)
     ward = models.CharField(max_length=50, null=True, blank=True)
     
+    # Normalised location keys, kept in step with the text fields above by
+    # assign_locations(). Reports group and filter on these.
+    county_ref = models.ForeignKey(
+        County, null=True, blank=True, related_name="clients", on_delete=models.PROTECT, editable=False
+    )
+    sub_county_ref = models.ForeignKey(
+        SubCounty, null=True, blank=True, related_name="clients", on_delete=models.PROTECT, editable=False
+    )
+    ward_ref = models.ForeignKey(
+        Ward, null=True, blank=True, related_name="clients", on_delete=models.PROTECT, editable=False
+    )
+    
     # Health info
     blood_type = models.CharField(max_length=5, null=True, blank=True)
     allergies = models.TextField(null=True, blank=True)
@@ -40,9 +58,40 @@ class Client(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination key for client lists
+            models.Index(fields=['created_at', 'client_id'], name='client_created_keyset_idx'),
+            # Keyset order of the external sync feed
+            models.Index(fields=['updated_at', 'client_id'], name='client_updated_keyset_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.client_id})"
     
+    def save(self, *args, **kwargs):
+        self.assign_locations()
+        super().save(*args, **kwargs)
+    
+    save.alters_data = True
+    
+    def assign_locations(self, create=True):
+        """
+        Resolve the county, sub-county and ward text to reference rows and
+        store the canonical names. Bulk paths that skip save() call this
+        before bulk_create. Unless `create` is False, sub-counties and
+        wards not in the reference tables yet are added.
+        """
+        self.county_ref = locations.county(self.county)
+        self.sub_county_ref = locations.sub_county(self.county_ref, self.sub_county, create=create)
+        self.ward_ref = locations.ward(self.sub_county_ref, self.ward, create=create)
+        if self.county_ref:
+            self.county = self.county_ref.name
+        if self.sub_county_ref:
+            self.sub_county = self.sub_county_ref.name
+        if self.ward_ref:
+            self.ward = self.ward_ref.name
+    
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
     
@@ -51,7 +100,74 @@ class Client(models.Model):
         return today.year - self.date_of_birth.year - ((today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
 
 
-class Enrollment(models.Model):
+class EnrollmentQuerySet(models.QuerySet):
+    
+    def upsert(self, enrollments, update_fields, batch_size=None):
+        """
+        Insert enrollments, updating `update_fields` on the existing row when
+        the (client, program) pair is already enrolled, in a single statement:
+        INSERT ... ON DUPLICATE KEY UPDATE on MySQL and INSERT ... ON CONFLICT
+        DO UPDATE on SQLite and PostgreSQL.
+        
+        Like bulk_create, this bypasses save() and signals, and row ids are
+        not returned on every backend.
+        """
+        features = connections[self.db].features
+        # MySQL infers the conflict target from the unique keys
+        unique_fields = ['client', 'program'] if features.supports_update_conflicts_with_target else None
+        return self.bulk_create(
+            enrollments,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+    
+    def set_active(self, is_active):
+        """Set is_active on every matching row with one UPDATE; returns the row count"""
+        return self.update(is_active=is_active, updated_at=timezone.now())
+    
+    def toggle_active(self):
+        """
+        Flip is_active in the database with one UPDATE, so concurrent toggles
+        cannot lose each other's writes. Returns the row count.
+        """
+        return self.update(
+            is_active=Case(When(is_active=True, then=Value(False)), default=Value(True)),
+            updated_at=timezone.now(),
+        )
+    
+    def deactivate_in_batches(self, batch_size=1000):
+        """
+        Deactivate all active matching enrollments as a series of short
+        UPDATE ... WHERE id IN (...) transactions, walking the primary key,
+        so no statement holds locks on more than `batch_size` rows.
+        Records change events and returns the number of rows deactivated.
+        """
+        active = self.filter(is_active=True).order_by('id')
+        deactivated = 0
+        last_id = 0
+        while True:
+            ids = list(active.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deactivated
+            with transaction.atomic(using=self.db):
+                # Lock and re-read the batch, so rows another writer has
+                # deactivated since are neither updated nor given an event
+                rows = list(
+                    Enrollment.objects.using(self.db).select_for_update()
+                    .filter(id__in=ids, is_active=True)
+                    .values_list('id', 'client_id', 'program_id')
+                )
+                if rows:
+                    deactivated += Enrollment.objects.using(self.db).filter(
+                        id__in=[row[0] for row in rows]
+                    ).set_active(False)
+                    record_enrollment_changes(rows, using=self.db)
+            last_id = ids[-1]
+
+
+class Enrollment(ChangeTrackedModel):
     """
     Client enrollment in a health program
     """
@@ -65,11 +181,86 @@ class Enrollment(models.Model):
     facility_name = models.CharField(max_length=100, null=True, blank=True)
     mfl_code = models.CharField(max_length=10, null=True, blank=True, help_text="Master Facility List Code")
     
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = EnrollmentQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _("Program Enrollment")
         verbose_name_plural = _("Program Enrollments")
         ordering = ['-enrollment_date']
         unique_together = ['client', 'program']
+        indexes = [
+            # Keyset pagination key for enrollment lists
+            models.Index(fields=['enrollment_date', 'id'], name='enrollment_date_keyset_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.client.get_full_name()} - {self.program.name}"
+    
+    def get_change_payload(self):
+        return {'client_id': str(self.client_id), 'program_id': self.program_id} 
+
+class ArchivedEnrollment(models.Model):
+    """
+    Inactive enrollment moved out of the hot enrollment table. Rows keep
+    their original id, so archiving and restoring are lossless.
+    """
+    # Fields copied between the hot and archive tables
+    COPIED_FIELDS = [
+        'id', 'client_id', 'program_id', 'enrollment_date', 'is_active',
+        'notes', 'facility_name', 'mfl_code', 'updated_at',
+    ]
+    
+    id = models.BigIntegerField(primary_key=True)
+    client = models.ForeignKey(Client, related_name="archived_enrollments", on_delete=models.CASCADE)
+    program = models.ForeignKey(HealthProgram, related_name="archived_enrollments", on_delete=models.CASCADE)
+    enrollment_date = models.DateField()
+    is_active = models.BooleanField(default=False)
+    notes = models.TextField(null=True, blank=True)
+    facility_name = models.CharField(max_length=100, null=True, blank=True)
+    mfl_code = models.CharField(max_length=10, null=True, blank=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = _("Archived Enrollment")
+        verbose_name_plural = _("Archived Enrollments")
+        ordering = ['-enrollment_date']
     
     def __str__(self):
-        return f"{self.client.get_full_name()} - {self.program.name}" 
\ No newline at end of file
+        return f"{self.client.get_full_name()} - {self.program.name} (archived)"
+    
+    @classmethod
+    def from_enrollment(cls, enrollment):
+        return cls(**{name: getattr(enrollment, name) for name in cls.COPIED_FIELDS})
+    
+    def to_enrollment(self):
+        return Enrollment(**{name: getattr(self, name) for name in self.COPIED_FIELDS})
+
+
+def touch_clients(client_ids, using=None):
+    """
+    Bump updated_at on the given clients so that changes to their enrollments
+    show up in the external sync feed. Needed after bulk operations that
+    bypass model signals.
+    """
+    client_ids = list(client_ids)
+    if client_ids:
+        Client.objects.using(using).filter(client_id__in=client_ids).update(updated_at=timezone.now())
+
+
+def record_enrollment_changes(rows, using=None):
+    """
+    Write change events and bump client sync timestamps for enrollments
+    changed by queryset updates. `rows` are (id, client_id, program_id).
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    ChangeEvent.objects.record_many(
+        [Enrollment(id=id, client_id=client_id, program_id=program_id) for id, client_id, program_id in rows],
+        ChangeEvent.UPSERT,
+        using=using,
+    )
+    touch_clients({client_id for _, client_id, _ in rows}, using=using)
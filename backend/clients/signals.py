@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Enrollment, touch_clients
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def touch_enrolled_client(sender, instance, using, **kwargs):
+    """
+    Enrollments are exposed as part of the client profile, so any change to
+    one marks its client as updated for the sync feed.
+    """
+    touch_clients([instance.client_id], using=using)
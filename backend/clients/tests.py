@@ -1,6 +1,10 @@
-from django.test import TestCase
+import uuid
+from types import SimpleNamespace
+
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from datetime import datetime, timedelta
+from .fields import CompactUUIDField, uuid7, uuid_timestamp
 from .models import Client, Enrollment
 from health_programs.models import HealthProgram, ProgramCategory
 
@@ -93,4 +97,33 @@ class EnrollmentModelTest(TestCase):
                 program=enrollment.program,
                 enrollment_date=timezone.now().date(),
                 status='pending'
-            ) 
\ No newline at end of file
+            )
+
+
+class ClientIdTest(TestCase):
+    
+    def test_uuid7_is_time_ordered(self):
+        values = [uuid7() for _ in range(1000)]
+        self.assertEqual(values, sorted(values))
+        self.assertTrue(all(value.version == 7 for value in values))
+        self.assertEqual(len(set(values)), len(values))
+        self.assertAlmostEqual(uuid_timestamp(values[0]) / 1000, timezone.now().timestamp(), delta=5)
+    
+    def test_new_clients_get_uuid7(self):
+        client = Client.objects.create(
+            first_name="Jane", last_name="Doe", date_of_birth=datetime(1990, 1, 1).date(),
+            gender="F", county="Nairobi", sub_county="Westlands"
+        )
+        self.assertEqual(client.client_id.version, 7)
+        self.assertEqual(Client.objects.get(pk=client.client_id).client_id, client.client_id)
+    
+    @override_settings(COMPACT_UUID_STORAGE=True)
+    def test_binary_storage_on_mysql(self):
+        field = CompactUUIDField()
+        mysql = SimpleNamespace(vendor='mysql', data_types={'UUIDField': 'char(32)'}, ops=SimpleNamespace(quote_name=str))
+        value = uuid7()
+        # The schema never follows the setting, so migrations stay the same
+        self.assertEqual(field.db_type(mysql), 'char(32)')
+        self.assertEqual(field.get_db_prep_value(value, mysql), value.bytes)
+        self.assertEqual(field.from_db_value(value.bytes, None, mysql), value)
+        self.assertEqual(field.from_db_value(value.hex, None, mysql), value)
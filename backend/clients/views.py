@@ -4,6 +4,7 @@ from django.contrib import messages
 from django.db.models import Q
 from .models import Client, Enrollment
 from health_programs.models import HealthProgram
+from locations.lookup import locations
 
 
 @login_required
@@ -26,10 +27,12 @@ def client_list(request):
     # Handle filtering
     county = request.GET.get('county')
     if county:
-        clients = clients.filter(county__iexact=county)
+        county_ref = locations.county(county)
+        # An unknown county matches no one, not the clients without a county
+        clients = clients.filter(county_ref=county_ref) if county_ref else clients.none()
     
-    # Get unique counties for filter dropdown
-    counties = Client.objects.values_list('county', flat=True).distinct()
+    # Counties for the filter dropdown come from the cached reference table
+    counties = [county.name for county in locations.counties()]
     
     context = {
         'clients': clients,
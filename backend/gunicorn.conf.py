@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration, read when gunicorn is started from this directory:
+
+    gunicorn health_system.wsgi
+
+Admission control (api/admission.py) budgets concurrent requests per
+process, so each worker serves requests on several threads. A sync
+worker runs one request at a time and would never reach a budget.
+"""
+
+from gunicorn.workers.sync import SyncWorker
+
+from health_system import settings
+
+wsgi_app = 'health_system.wsgi'
+worker_class = 'gthread'
+workers = settings.WEB_CONCURRENCY
+threads = settings.WEB_THREADS
+# Change feed long-polls wait up to CHANGE_FEED_MAX_WAIT seconds
+timeout = max(30, settings.CHANGE_FEED_MAX_WAIT * 2)
+
+
+def on_starting(server):
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return
+    cfg = server.cfg
+    # gunicorn swaps sync workers for gthread ones when threads > 1
+    if issubclass(cfg.worker_class, SyncWorker):
+        raise SystemExit(
+            'Admission control needs concurrent workers: run gthread workers '
+            f'with --threads 2 or more instead of {cfg.worker_class_str}'
+        )
+    largest = max(
+        (options.get('max_concurrent') or 0 for options in settings.ADMISSION_CLASSES.values()),
+        default=0,
+    )
+    if largest >= cfg.threads:
+        server.log.warning(
+            'WEB_THREADS=%s leaves no thread for interactive requests when a '
+            'class reaches its budget of %s', cfg.threads, largest,
+        )
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_programs', '0002_alter_healthprogram_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='programcategory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_programs', '0003_programcategory_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthprogram',
+            index=models.Index(fields=['end_date'], name='program_end_date_idx'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from api.models import ChangeTrackedModel
 
 
 def validate_non_empty_code(value):
@@ -15,6 +16,7 @@ class ProgramCategory(models.Model):
     """
     name = models.CharField(_("Category Name"), max_length=100)
     description = models.TextField(_("Description"), blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = _("Program Category")
@@ -25,7 +27,7 @@ class ProgramCategory(models.Model):
         return self.name
 
 
-class HealthProgram(models.Model):
+class HealthProgram(ChangeTrackedModel):
     """
     Health programs offered by the ministry
     """
@@ -46,6 +48,12 @@ class HealthProgram(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Finding programs that have ended, for enrollment deactivation
+            models.Index(fields=['end_date'], name='program_end_date_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.name} ({self.code})"
     
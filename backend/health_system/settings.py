@@ -34,14 +34,18 @@ INSTALLED_APPS = [
     
     # Local apps
     'health_programs',
+    'locations',
     'clients',
     'api',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',  # Before anything that can answer, so 503s carry CORS headers
+    'api.middleware.AdmissionControlMiddleware',  # Shed load before doing any work
+    'api.middleware.CompressionMiddleware',  # Before anything that reads the response body
+    'api.middleware.RateLimitHeadersMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'corsheaders.middleware.CorsMiddleware',  # CORS middleware before CommonMiddleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -123,6 +127,23 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Caching
+# Per-process memory cache; point 'default' at Redis or Memcached to share
+# cached responses between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'afya-yetu',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    }
+}
+RESPONSE_CACHE_ALIAS = 'default'
+
+# Response compression (api.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 1024  # bytes; smaller responses are sent as-is
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5  # used when the optional brotli package is installed
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -132,7 +153,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',  # Add token authentication
+        'api.authentication.CachedTokenAuthentication',  # Token authentication with a token cache
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -143,6 +164,112 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# External sync feed (/api/external/clients/sync/)
+EXTERNAL_SYNC_PAGE_SIZE = 500
+EXTERNAL_SYNC_MAX_PAGE_SIZE = 5000
+# Rows changed after the oldest transaction still writing began (see
+# CHANGE_FEED_GAP_GRACE), or in the last EXTERNAL_SYNC_SAFETY_LAG seconds,
+# are held back.
+EXTERNAL_SYNC_SAFETY_LAG = 2  # seconds
+
+# Change feed (/api/external/changes/), see api.change_feed. A sequence
+# gap is waited on while a transaction older than the event after it is
+# still writing (on MySQL the database user needs the PROCESS privilege
+# to see them), and for at least CHANGE_FEED_GAP_GRACE seconds.
+CHANGE_FEED_GAP_GRACE = 5  # seconds
+CHANGE_FEED_MAX_WAIT = 30  # longest long-poll, in seconds
+CHANGE_FEED_COMPACT_AFTER = 24 * 3600  # superseded events kept this long (seconds)
+CHANGE_FEED_TOMBSTONE_RETENTION = 7 * 24 * 3600  # delete events kept this long (seconds)
+
+# Send client ids to MySQL as BINARY(16) instead of char(32). Turn on only
+# after converting the columns with `manage.py convert_client_ids`, and
+# rerun it after migrations that add columns referencing clients.
+COMPACT_UUID_STORAGE = False
+
+# Seconds the in-process county/sub-county/ward lookup is trusted before
+# it is reloaded (changes made in this process clear it immediately)
+LOCATION_CACHE_TTL = 300
+
+# Token authentication cache (see api/authentication.py). Every process
+# drops revoked tokens immediately: a revocation generation is kept in the
+# shared cache (Redis/Memcached) named in TOKEN_AUTH_SHARED_CACHE, or in
+# the database without one. The default cache is used when it is shared.
+TOKEN_AUTH_CACHE_SIZE = 1000
+TOKEN_AUTH_CACHE_TTL = 60  # seconds a token is trusted by one process
+TOKEN_AUTH_SHARED_CACHE = None if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache')) else 'default'
+TOKEN_AUTH_SHARED_CACHE_TTL = 300  # seconds
+
+# Inbound rate limits for the external API (see api/throttling.py), as
+# lists of "calls/period" per username; "default" applies to other callers.
+# Without a default, RATE_LIMIT_CALLS per RATE_LIMIT_PERIOD from
+# api.external_api_config applies, plus EXTERNAL_API_DAILY_QUOTA. Name a
+# shared cache alias in EXTERNAL_API_THROTTLE_CACHE when several nodes
+# serve the API; otherwise counters are kept per process.
+EXTERNAL_API_THROTTLE_RATES = {}
+EXTERNAL_API_DAILY_QUOTA = 20000  # requests per token per day, None for no quota
+EXTERNAL_API_THROTTLE_CACHE = None
+
+# Web server processes and threads per process, read by gunicorn.conf.py
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) + 1))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 16))
+
+# Admission control (see api/admission.py). Requests are classified by
+# path; each class may run max_concurrent requests per process (None for
+# no limit) and queue up to max_queue more for queue_timeout seconds
+# before being answered with 503 and Retry-After. Unmatched paths are
+# interactive. Change feed long-polls hold a thread for up to
+# CHANGE_FEED_MAX_WAIT seconds, so they get a small budget of their own.
+# Budgets only bite when a process serves requests on several threads:
+# gunicorn.conf.py runs WEB_CONCURRENCY gthread workers of WEB_THREADS
+# threads and refuses to start single-threaded workers. A host admits at
+# most WEB_CONCURRENCY x max_concurrent requests of each class, and the
+# budgets below together leave threads free for interactive requests.
+ADMISSION_CONTROL_ENABLED = True
+ADMISSION_CLASSES = {
+    'interactive': {'max_concurrent': None},
+    'external': {'max_concurrent': 8, 'max_queue': 16, 'queue_timeout': 2, 'retry_after': 2},
+    'longpoll': {'max_concurrent': 2, 'max_queue': 0, 'queue_timeout': 0, 'retry_after': 5},
+    'bulk': {'max_concurrent': 2, 'max_queue': 2, 'queue_timeout': 1, 'retry_after': 30},
+}
+ADMISSION_ROUTES = [  # (regex on the path, class), first match wins
+    (r'^/api/clients/register/bulk/', 'bulk'),
+    (r'^/api/(clients/bulk-import|enrollments/bulk_(enroll|deactivate))/', 'bulk'),
+    (r'^/api/external/changes/', 'longpoll'),
+    (r'^/api/external/', 'external'),
+]
+
+# In-process scheduler for periodic jobs (see api/jobs.py). It is started
+# by the WSGI/ASGI entry points, so never by migrate, shell or other
+# management commands. The same jobs can be run from cron with their
+# management commands instead.
+SCHEDULER_ENABLED = False
+SCHEDULER_POLL_INTERVAL = 30  # seconds
+SCHEDULED_JOBS = {  # job name: seconds between runs
+    'deactivate_ended_enrollments': 3600,
+    'compact_change_feed': 6 * 3600,
+    'expire_idempotency_keys': 3600,
+    'archive_enrollments': 24 * 3600,
+}
+
+# Inactive enrollments unchanged for this long move to the archive table
+ENROLLMENT_ARCHIVE_AFTER_DAYS = 365
+
+# Idempotency-Key handling for retried POSTs (see api/idempotency.py)
+IDEMPOTENCY_TTL = 24 * 3600  # seconds a stored response is replayed
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds before an in-flight key is considered abandoned
+IDEMPOTENCY_WAIT = 5  # seconds a duplicate waits for the in-flight request
+
+# Password hashing for client registration runs on a process pool so the
+# PBKDF2 cost stays off request workers. 0 workers hashes inline. Every
+# web worker process starts its own pool, so half the host's cores are
+# shared out between the WEB_CONCURRENCY pools, at least one worker each:
+# a host runs WEB_CONCURRENCY x PASSWORD_HASHING_WORKERS hashing processes.
+PASSWORD_HASHING_WORKERS = max(1, (os.cpu_count() or 2) // 2 // WEB_CONCURRENCY)
+PASSWORD_HASHING_MAX_PENDING = PASSWORD_HASHING_WORKERS * 4  # hashes queued or running
+PASSWORD_HASHING_QUEUE_TIMEOUT = 5  # seconds to wait for a slot before answering 503
+PASSWORD_HASHING_TIMEOUT = 30  # seconds
+BULK_REGISTRATION_MAX_SIZE = 500
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only in development
 CORS_ALLOWED_ORIGINS = [
@@ -168,6 +295,7 @@ CORS_ALLOW_HEADERS = [  # Specify allowed headers
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 # CSRF settings
@@ -178,6 +306,26 @@ CSRF_TRUSTED_ORIGINS = [
 CSRF_COOKIE_SAMESITE = 'Lax'  # Strict, Lax, or None
 CSRF_COOKIE_HTTPONLY = False  # False to allow JavaScript access
 SESSION_COOKIE_SAMESITE = 'Lax'
+
+# Failed logins allowed per username and per client IP before further
+# attempts are rejected with 429 (see api/throttling.py). Name a shared
+# cache alias in LOGIN_THROTTLE_CACHE to count across processes.
+LOGIN_FAILURE_LIMITS = {'username': '5/15m', 'ip': '50/15m'}
+LOGIN_THROTTLE_CACHE = None
+
+# Sessions are read from the cache alias in SESSION_SHARED_CACHE, written
+# through to the database, and the user behind each session is cached with
+# their permissions (see api/authentication.py). As with
+# TOKEN_AUTH_SHARED_CACHE, the default cache is used when every process
+# shares it (Redis/Memcached). Otherwise sessions and users are read from
+# the database: a per-process cache would let other workers keep serving
+# a session after logout or a password change.
+SESSION_SHARED_CACHE = TOKEN_AUTH_SHARED_CACHE
+SESSION_USER_CACHE_TTL = 300  # seconds
+if SESSION_SHARED_CACHE:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = SESSION_SHARED_CACHE
+    AUTHENTICATION_BACKENDS = ['api.authentication.CachedModelBackend']
 CSRF_USE_SESSIONS = False  # Store CSRF in the session instead of a cookie
 
 # Security settings (for production)
@@ -13,4 +13,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_system.settings')
 
-application = get_wsgi_application() 
\ No newline at end of file
+application = get_wsgi_application()
+
+# Only web server processes run the in-process scheduler
+from api.scheduler import start_scheduler_if_enabled  # noqa: E402
+
+start_scheduler_if_enabled()
@@ -0,0 +1,19 @@
+from django.contrib import admin
+from .models import County, SubCounty, Ward
+
+@admin.register(County)
+class CountyAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name')
+    search_fields = ('name',)
+
+@admin.register(SubCounty)
+class SubCountyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'county')
+    list_filter = ('county',)
+    search_fields = ('name',)
+
+@admin.register(Ward)
+class WardAdmin(admin.ModelAdmin):
+    list_display = ('name', 'sub_county')
+    search_fields = ('name', 'sub_county__name')
+    raw_id_fields = ('sub_county',)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class LocationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.SmallAutoField'
+    name = 'locations'
+    verbose_name = 'Administrative Locations'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,126 @@
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import County, SubCounty, Ward
+
+# Placeholder values the registration flow and older imports write when a
+# location is not known; they never resolve to a reference row
+UNKNOWN_NAMES = {'', 'unknown', 'none', 'na', 'n/a'}
+
+_NOISE_WORDS = re.compile(r'\b(county|city|sub[\s-]*county)\b')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_VALID_NAME = re.compile(r"^[^\W\d_][\w\s'.-]*$")
+MAX_NAME_LENGTH = 50
+
+
+def normalize_name(name):
+    """
+    Comparison key for a location name: case, punctuation, spacing and a
+    trailing "County"/"City" are ignored, so "Murang'a", "muranga county"
+    and "MURANG A" all match.
+    """
+    name = _NOISE_WORDS.sub(' ', (name or '').lower())
+    return _NON_ALNUM.sub('', name)
+
+
+def is_valid_name(name):
+    """
+    Whether free text may be stored as a new sub-county or ward: at most
+    50 letters, digits, spaces, hyphens, apostrophes and full stops,
+    starting with a letter.
+    """
+    name = (name or '').strip()
+    return (
+        len(name) <= MAX_NAME_LENGTH
+        and _VALID_NAME.match(name) is not None
+        and normalize_name(name) not in UNKNOWN_NAMES
+    )
+
+
+class LocationLookup:
+    """
+    In-process cache of the location reference tables.
+
+    Counties are loaded in one query on first use; sub-counties and wards
+    are loaded per parent the first time that parent is looked up outside
+    a transaction (bulk paths resolve before opening theirs). The
+    cache is cleared whenever a location row is saved or deleted in this
+    process and expires after LOCATION_CACHE_TTL seconds so other processes
+    pick up changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._counties = None
+            self._sub_counties = {}
+            self._wards = {}
+            self._loaded_at = 0
+
+    def _fresh(self):
+        ttl = getattr(settings, 'LOCATION_CACHE_TTL', 300)
+        if self._counties is None or time.monotonic() - self._loaded_at > ttl:
+            counties = {normalize_name(county.name): county for county in County.objects.all()}
+            with self._lock:
+                self._counties = counties
+                self._sub_counties = {}
+                self._wards = {}
+                self._loaded_at = time.monotonic()
+        return self._counties
+
+    def counties(self):
+        """All counties, by name"""
+        return sorted(self._fresh().values(), key=lambda county: county.name)
+
+    def county(self, name):
+        """The County matching a free-text name, or None"""
+        key = normalize_name(name)
+        if key in UNKNOWN_NAMES:
+            return None
+        return self._fresh().get(key)
+
+    def sub_county(self, county, name, create=False):
+        """
+        The SubCounty of `county` matching `name`, or None. Write paths pass
+        `create` to add a sub-county that is not in the table yet, provided
+        its name passes is_valid_name().
+        """
+        return self._child('_sub_counties', SubCounty, 'county', county, name, create)
+
+    def ward(self, sub_county, name, create=False):
+        return self._child('_wards', Ward, 'sub_county', sub_county, name, create)
+
+    def _child(self, attr, model, parent_field, parent, name, create):
+        key = normalize_name(name)
+        if parent is None or key in UNKNOWN_NAMES or not (name or '').strip():
+            return None
+        self._fresh()
+        # Read the per-parent dict only after _fresh(), which may replace it
+        with self._lock:
+            cache = getattr(self, attr)
+            children = cache.get(parent.pk)
+        if children is None:
+            children = {
+                normalize_name(child.name): child
+                for child in model.objects.filter(**{parent_field: parent})
+            }
+            # Inside a transaction the rows may include ones it created and
+            # may still roll back, so only cache what was read outside one
+            if not transaction.get_connection().in_atomic_block:
+                with self._lock:
+                    if getattr(self, attr) is cache:
+                        cache[parent.pk] = children
+        child = children.get(key)
+        if child is None and create and is_valid_name(name):
+            # Saving clears the cache, so the new row is picked up on reload
+            child, _ = model.objects.get_or_create(**{parent_field: parent, 'name': name.strip().title()})
+        return child
+
+locations = LocationLookup()
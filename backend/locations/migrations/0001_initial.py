@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='County',
+            fields=[
+                ('id', models.SmallAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.PositiveSmallIntegerField(unique=True, verbose_name='County Code')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='County Name')),
+            ],
+            options={
+                'verbose_name': 'County',
+                'verbose_name_plural': 'Counties',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SubCounty',
+            fields=[
+                ('id', models.SmallAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Sub-County Name')),
+                ('county', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='sub_counties', to='locations.county')),
+            ],
+            options={
+                'verbose_name': 'Sub-County',
+                'verbose_name_plural': 'Sub-Counties',
+                'ordering': ['name'],
+                'unique_together': {('county', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Ward',
+            fields=[
+                ('id', models.SmallAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Ward Name')),
+                ('sub_county', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='wards', to='locations.subcounty')),
+            ],
+            options={
+                'verbose_name': 'Ward',
+                'verbose_name_plural': 'Wards',
+                'ordering': ['name'],
+                'unique_together': {('sub_county', 'name')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class County(models.Model):
+    """
+    One of Kenya's 47 counties, keyed by a small integer so client rows and
+    their indexes carry two bytes instead of the county name
+    """
+    code = models.PositiveSmallIntegerField(_("County Code"), unique=True)
+    name = models.CharField(_("County Name"), max_length=50, unique=True)
+    
+    class Meta:
+        verbose_name = _("County")
+        verbose_name_plural = _("Counties")
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+
+class SubCounty(models.Model):
+    county = models.ForeignKey(County, related_name="sub_counties", on_delete=models.PROTECT)
+    name = models.CharField(_("Sub-County Name"), max_length=50)
+    
+    class Meta:
+        verbose_name = _("Sub-County")
+        verbose_name_plural = _("Sub-Counties")
+        ordering = ['name']
+        unique_together = ['county', 'name']
+    
+    def __str__(self):
+        return f"{self.name}, {self.county}"
+
+
+class Ward(models.Model):
+    sub_county = models.ForeignKey(SubCounty, related_name="wards", on_delete=models.PROTECT)
+    name = models.CharField(_("Ward Name"), max_length=50)
+    
+    class Meta:
+        verbose_name = _("Ward")
+        verbose_name_plural = _("Wards")
+        ordering = ['name']
+        unique_together = ['sub_county', 'name']
+    
+    def __str__(self):
+        return f"{self.name}, {self.sub_county}"
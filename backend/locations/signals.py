@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .lookup import locations
+from .models import County, SubCounty, Ward
+
+
+@receiver(post_save, sender=County)
+@receiver(post_save, sender=SubCounty)
+@receiver(post_save, sender=Ward)
+@receiver(post_delete, sender=County)
+@receiver(post_delete, sender=SubCounty)
+@receiver(post_delete, sender=Ward)
+def clear_location_cache(sender, **kwargs):
+    locations.clear()
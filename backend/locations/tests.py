@@ -0,0 +1,81 @@
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from clients.models import Client
+from .lookup import locations, normalize_name
+from .models import County, SubCounty
+
+
+class LocationLookupTest(TestCase):
+
+    def setUp(self):
+        locations.clear()
+
+    def test_counties_are_seeded(self):
+        self.assertEqual(County.objects.count(), 47)
+        self.assertEqual(County.objects.get(code=47).name, "Nairobi")
+
+    def test_name_variants_resolve_to_one_county(self):
+        self.assertEqual(normalize_name("Murang'a County"), normalize_name("MURANGA"))
+        for name in ("Taita Taveta", "taita-taveta county", "  TAITA TAVETA "):
+            self.assertEqual(locations.county(name).code, 6)
+        self.assertIsNone(locations.county("Unknown"))
+        self.assertIsNone(locations.county("Atlantis"))
+
+    def test_client_save_assigns_references(self):
+        client = Client.objects.create(
+            first_name="Jane", last_name="Doe", date_of_birth=date(1990, 1, 1), gender="F",
+            county="kisumu county", sub_county="kisumu central", ward="Railways",
+        )
+        client.refresh_from_db()
+        self.assertEqual(client.county_ref.code, 42)
+        self.assertEqual(client.county, "Kisumu")
+        self.assertEqual(client.sub_county_ref.name, "Kisumu Central")
+        self.assertEqual(client.ward_ref.sub_county, client.sub_county_ref)
+
+        Client.objects.create(
+            first_name="John", last_name="Doe", date_of_birth=date(1990, 1, 1), gender="M",
+            county="Kisumu", sub_county="Kisumu-Central",
+        )
+        self.assertEqual(SubCounty.objects.filter(county__code=42).count(), 1)
+
+    def test_lookups_do_not_create_rows(self):
+        kisumu = locations.county("Kisumu")
+        self.assertIsNone(locations.sub_county(kisumu, "Nyando"))
+        self.assertFalse(SubCounty.objects.filter(name="Nyando").exists())
+        self.assertIsNone(locations.sub_county(kisumu, "<script>", create=True))
+        self.assertEqual(locations.sub_county(kisumu, "nyando", create=True).name, "Nyando")
+
+    def test_child_cache_survives_a_reload(self):
+        kisumu = locations.county("Kisumu")
+        locations.sub_county(kisumu, "Nyando", create=True)
+        locations.clear()
+        # As if outside a transaction, so the sub-counties are cached
+        outside = mock.Mock(in_atomic_block=False)
+        with mock.patch('locations.lookup.transaction.get_connection', return_value=outside):
+            # The first call also reloads the counties, replacing the dicts
+            locations.sub_county(kisumu, "Nyando")
+            with self.assertNumQueries(0):
+                self.assertEqual(locations.sub_county(kisumu, "Nyando").name, "Nyando")
+
+
+class BackfillClientLocationsTest(TestCase):
+
+    def test_backfill_in_batches(self):
+        for index, county in enumerate(["Nairobi", "nairobi", "Mombasa", "Eldoret"]):
+            client = Client.objects.create(
+                first_name=f"Client{index}", last_name="Test", date_of_birth=date(1990, 1, 1),
+                gender="F", county=county, sub_county="Central",
+            )
+        # Simulate rows written before the reference keys existed
+        Client.objects.update(county_ref=None, sub_county_ref=None, ward_ref=None)
+
+        out = StringIO()
+        call_command('backfill_client_locations', '--batch-size', '2', stdout=out)
+        self.assertIn('Resolved 3 clients.', out.getvalue())
+        self.assertIn("'Eldoret': 1", out.getvalue())
+        self.assertEqual(Client.objects.filter(county_ref__code=47).count(), 2)
@@ -2,25 +2,31 @@ import logging
 import requests
 from typing import Dict, Any, Optional
 from requests.exceptions import RequestException
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import Retrying
+
+from ..api.external_api_client import ExternalAPIClient, RetryPolicy, shared_client
 
 logger = logging.getLogger(__name__)
 
 class ExternalAPIService:
     """Service for interacting with external health information APIs."""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], client: Optional[ExternalAPIClient] = None):
         """
         Initialize the API service with configuration.
         
         Args:
             config: Configuration dictionary containing API settings
+            client: Transport to use (default the shared pooled client)
         """
         self.api_config = config.get('api', {})
         self.base_url = self.api_config.get('base_url')
         self.token = self.api_config.get('token')
-        self.timeout = self.api_config.get('timeout', 30)
+        self.timeout = self.api_config.get('timeout')
         self.retry_attempts = self.api_config.get('retry_attempts', 3)
+        # Same retry rules as api.external_api_service
+        self.retry_policy = RetryPolicy(max_attempts=self.retry_attempts)
+        self.client = client or shared_client()
         
         if not self.base_url:
             raise ValueError("API base URL is required")
@@ -44,15 +50,10 @@ class ExternalAPIService:
             
         return headers
     
-    @retry(
-        retry=retry_if_exception_type(RequestException),
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        reraise=True
-    )
     def _request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
         """
-        Make a request to the API with automatic retries.
+        Make a request to the API, retrying transient failures of
+        idempotent methods according to self.retry_policy.
         
         Args:
             method: HTTP method (get, post, put, etc.)
@@ -65,18 +66,21 @@ class ExternalAPIService:
         Raises:
             RequestException: If the request fails after retries
         """
+        retrying = Retrying(**self.retry_policy.tenacity_kwargs(method_arg=0))
+        return retrying(self._send, method, endpoint, **kwargs)
+    
+    def _send(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """Make one attempt of a request"""
         url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
         
         if 'headers' not in kwargs:
             kwargs['headers'] = self._get_headers()
             
-        if 'timeout' not in kwargs:
-            kwargs['timeout'] = self.timeout
+        if 'timeout' not in kwargs and self.timeout is not None:
+            kwargs['timeout'] = (self.client.connect_timeout, self.timeout)
             
         try:
-            response = requests.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response
+            return self.client.request(method, url, **kwargs)
         except RequestException as e:
             logger.error(f"API request failed: {str(e)}")
             raise